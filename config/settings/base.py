@@ -72,6 +72,7 @@ THIRD_PARTY_APPS = [
     'shibboleth',
 ]
 LOCAL_APPS = [
+    'prplatform.core',
     'prplatform.users.apps.UsersConfig',
     'prplatform.courses.apps.CoursesConfig',
     'prplatform.exercises.apps.ExercisesConfig',
@@ -143,6 +144,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'shibboleth.middleware.ShibbolethRemoteUserMiddleware',
     'prplatform.aplus_integration.lti_middleware.LtiLoginMiddleware',
+    'prplatform.courses.roles.RoleScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -257,6 +259,44 @@ SHIBBOLETH_ATTRIBUTE_MAP = {
     "mail": (True, "email"),
 }
 
+# A+ hook queue (prplatform.aplus_integration.worker)
+# a failing AplusAPICallRequest is retried after BACKOFF * 2^(attempts - 1) seconds,
+# at most MAX_BACKOFF, and moved to the dead state after MAX_ATTEMPTS attempts
+APLUS_QUEUE_MAX_ATTEMPTS = env.int('APLUS_QUEUE_MAX_ATTEMPTS', default=8)
+APLUS_QUEUE_BACKOFF_SECONDS = env.int('APLUS_QUEUE_BACKOFF_SECONDS', default=30)
+APLUS_QUEUE_MAX_BACKOFF_SECONDS = env.int('APLUS_QUEUE_MAX_BACKOFF_SECONDS', default=3600)
+# a submission that A+ is still grading is checked again after NOT_READY seconds,
+# as long as it takes. these checks are not counted as attempts
+APLUS_QUEUE_NOT_READY_SECONDS = env.int('APLUS_QUEUE_NOT_READY_SECONDS', default=60)
+# a claimed call is handled without holding a database lock. other workers skip it for
+# CLAIM seconds, after that it is handled again if its worker died meanwhile
+APLUS_QUEUE_CLAIM_SECONDS = env.int('APLUS_QUEUE_CLAIM_SECONDS', default=600)
+
+# A+ API client (prplatform.aplus_integration.client)
+APLUS_API_CONNECT_TIMEOUT = env.float('APLUS_API_CONNECT_TIMEOUT', default=5)
+APLUS_API_READ_TIMEOUT = env.float('APLUS_API_READ_TIMEOUT', default=30)
+APLUS_API_RETRIES = env.int('APLUS_API_RETRIES', default=3)
+APLUS_API_RETRY_BACKOFF = env.float('APLUS_API_RETRY_BACKOFF', default=0.5)
+# largest submission file downloaded from A+ in bytes, 0 for no limit
+APLUS_MAX_FILE_SIZE = env.int('APLUS_MAX_FILE_SIZE', default=0)
+
+# LTI launches (prplatform.aplus_integration.lti_middleware): how long the secrets
+# of the LTI clients are kept in memory before they are read from the database again.
+# a revoked secret keeps working this long in every process, 0 disables the cache
+LTI_CLIENT_CACHE_SECONDS = env.int('LTI_CLIENT_CACHE_SECONDS', default=300)
+# how long a confirmed enrollment lets repeated LTI launches skip the enrollment queries
+ENROLLMENT_CACHE_SECONDS = env.int('ENROLLMENT_CACHE_SECONDS', default=600)
+# default lifetime of the entries of prplatform.core.cache
+CACHE_TIMEOUT_SECONDS = env.int('CACHE_TIMEOUT_SECONDS', default=3600)
+
+# submission downloads (prplatform.submissions.downloads): '' streams the files from
+# django, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd) lets the front
+# proxy send them. nginx needs an internal location DOWNLOAD_ACCEL_PREFIX -> MEDIA_ROOT
+DOWNLOAD_OFFLOAD = env('DOWNLOAD_OFFLOAD', default='')
+DOWNLOAD_ACCEL_PREFIX = env('DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+# how long the download tokens of the LTI views are valid (prplatform.submissions.tokens)
+DOWNLOAD_TOKEN_MAX_AGE = env.int('DOWNLOAD_TOKEN_MAX_AGE', default=24 * 60 * 60)
+
 
 # for instance logging is easier to configure in local_settings.py
 # versus environment variables. put local_settings.py in project root.
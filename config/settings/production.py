@@ -1,5 +1,7 @@
 import logging
 
+from django.core.exceptions import ImproperlyConfigured
+
 from .base import *  # noqa
 from .base import env
 
@@ -18,18 +20,22 @@ DATABASES['default']['CONN_MAX_AGE'] = env.int('CONN_MAX_AGE', default=60)  # no
 
 # CACHES
 # ------------------------------------------------------------------------------
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django_redis.cache.RedisCache',
-#         'LOCATION': env('REDIS_URL'),
-#         'OPTIONS': {
-#             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#             # Mimicing memcache behavior.
-#             # http://niwinz.github.io/django-redis/latest/#_memcached_exceptions_behavior
-#             'IGNORE_EXCEPTIONS': True,
-#         }
-#     }
-# }
+# Redis is required: with a local-memory cache every process would have a cache
+# of its own and the others would not see the invalidations of prplatform.core.cache.
+if not env('REDIS_URL'):
+    raise ImproperlyConfigured('Set REDIS_URL, production needs a cache shared by all processes')
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': env('REDIS_URL'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # Mimicing memcache behavior.
+            # http://niwinz.github.io/django-redis/latest/#_memcached_exceptions_behavior
+            'IGNORE_EXCEPTIONS': True,
+        }
+    }
+}
 
 # SECURITY
 # ------------------------------------------------------------------------------
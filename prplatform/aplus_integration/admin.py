@@ -4,4 +4,5 @@ from .models import AplusAPICallRequest
 
 @admin.register(AplusAPICallRequest)
 class AplusAPICallRequestAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("pk", "submission_exercise", "state", "attempts", "next_attempt_at", "created")
+    list_filter = ("state",)
@@ -0,0 +1,166 @@
+"""
+HTTP client for the A+ API.
+
+Every thread keeps one requests.Session per A+ site, so consecutive calls to the
+same site reuse kept-alive connections instead of paying a new TCP/TLS handshake.
+All calls have connect and read timeouts, idempotent GETs are retried with an
+exponential backoff with jitter, and the latency of each call is recorded per site.
+"""
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.files import File
+
+import logging
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class AplusAPIError(Exception):
+    pass
+
+
+class FileTooLarge(AplusAPIError):
+    """ The file is larger than allowed. Retrying won't help. """
+    pass
+
+
+class StreamedResponseFile(File):
+    """
+    A File whose chunks() streams the body of a requests response opened with
+    stream=True. Storage backends save it chunk by chunk so the whole file is never
+    in memory. With max_size, an oversized transfer is aborted as soon as the
+    Content-Length header or the received bytes exceed the limit.
+    """
+
+    def __init__(self, response, name, max_size=None):
+        super().__init__(response.raw, name=name)
+        self.response = response
+        self.max_size = max_size
+
+        length = response.headers.get('Content-Length')
+        if max_size and length and int(length) > max_size:
+            response.close()
+            raise FileTooLarge(f"{name} is {length} bytes, the limit is {max_size}")
+
+    def chunks(self, chunk_size=None):
+        received = 0
+        for chunk in self.response.iter_content(chunk_size or self.DEFAULT_CHUNK_SIZE):
+            received += len(chunk)
+            if self.max_size and received > self.max_size:
+                self.response.close()
+                raise FileTooLarge(f"{self.name} exceeded the limit of {self.max_size} bytes")
+            yield chunk
+
+    def multiple_chunks(self, chunk_size=None):
+        return True
+
+    def close(self):
+        self.response.close()
+
+
+class CallMetrics:
+    """ Thread-safe latency counters of the calls, per site """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites = {}
+
+    def record(self, site, seconds, failed):
+        with self._lock:
+            stats = self._sites.setdefault(site, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {site: dict(stats) for site, stats in self._sites.items()}
+
+
+class AplusClient:
+
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=3, backoff=0.5, pool_size=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.metrics = CallMetrics()
+        self._local = threading.local()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(connect_timeout=settings.APLUS_API_CONNECT_TIMEOUT,
+                   read_timeout=settings.APLUS_API_READ_TIMEOUT,
+                   retries=settings.APLUS_API_RETRIES,
+                   backoff=settings.APLUS_API_RETRY_BACKOFF)
+
+    def _session(self, site):
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        if site not in sessions:
+            session = requests.Session()
+            # retries are done in get() so that they can be logged and measured
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            sessions[site] = session
+        return sessions[site]
+
+    def _sleep_before_retry(self, attempt):
+        # full jitter keeps the workers that failed at the same time from retrying in lockstep
+        time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def get(self, url, apikey, stream=False):
+        """ GETs url with the token of the course. Raises AplusAPIError when all attempts fail. """
+        parsed = urlparse(url)
+        site = f"{parsed.scheme}://{parsed.netloc}"
+        session = self._session(site)
+        headers = {'Authorization': f"Token {apikey}"}
+
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                response = session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.record(site, time.monotonic() - started, failed=True)
+                error = e
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                self.metrics.record(site, time.monotonic() - started, failed=failed)
+                if not failed:
+                    response.raise_for_status()
+                    return response
+                response.close()
+                error = AplusAPIError(f"{url} responded {response.status_code}")
+
+            logger.info(f"A+ API call to {url} failed (attempt {attempt + 1}/{self.retries + 1}): {error}")
+            if attempt < self.retries:
+                self._sleep_before_retry(attempt)
+
+        raise AplusAPIError(f"Giving up {url}: {error}")
+
+    def get_json(self, url, apikey):
+        return self.get(url, apikey).json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """ The client shared by the whole process """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AplusClient.from_settings()
+        return _client
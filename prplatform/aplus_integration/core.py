@@ -1,17 +1,22 @@
-import requests
 import os
 import json
 
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.core.cache import cache
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
+from django.db import transaction
 
 from prplatform.users.models import User
 from prplatform.submissions.models import OriginalSubmission
 
+from .client import StreamedResponseFile, get_client
+
 import logging
 logger = logging.getLogger(__name__)
 
+# the message of a submission that A+ has not graded yet, see AplusAPICallRequest.postpone
+NOT_READY = 'Not ready yet'
+
 def get_real_submission_from_hook_data(submission_exercise, query_dict):
     # <QueryDict: {'exercise_id': ['6'], 'site': ['http://localhost:8000'], 'submission_id': ['8'], 'course_id': ['1']}>
 
@@ -22,19 +27,20 @@ def get_real_submission_from_hook_data(submission_exercise, query_dict):
     exercise_id = query_dict.get('exercise_id')
     submission_id = query_dict.get('submission_id')
     submission_url = f"{site}/api/v2/submissions/{submission_id}"
-    AUTHENTICATION_HEADERS = {
-        'Authorization': f"Token {submission_exercise.course.aplus_apikey}"
-    }
-    return requests.get(submission_url, headers=AUTHENTICATION_HEADERS).json()
+    return get_client().get_json(submission_url, submission_exercise.course.aplus_apikey)
 
 def handle_submission_by_hook(apicall_request_object):
     submission_exercise = apicall_request_object.submission_exercise
     aplus_hook_data = apicall_request_object.hook_data
 
+    discard_incomplete([submission_exercise.pk], [apicall_request_object.aplus_submission_id])
+    if is_ingested(submission_exercise, apicall_request_object.aplus_submission_id):
+        return (True, 'Already ingested, may be deleted')
+
     submission_json = get_real_submission_from_hook_data(submission_exercise, aplus_hook_data)
 
     if submission_json['status'] == 'waiting':
-        return (False, 'Not ready yet')
+        return (False, NOT_READY)
 
     grade = submission_json['grade']
     late_penalty = submission_json['late_penalty_applied']
@@ -47,6 +53,23 @@ def handle_submission_by_hook(apicall_request_object):
 
     return (True, 'Handled, may be deleted')
 
+def discard_incomplete(exercise_ids, aplus_submission_ids):
+    """
+    Deletes the submissions created from the A+ submissions whose file was never saved.
+    The rows are written before the downloads, a worker that died while downloading
+    leaves one behind and it would block ingesting the submission again.
+    """
+    OriginalSubmission.objects.filter(exercise__in=exercise_ids,
+                                      aplus_submission_id__in=aplus_submission_ids,
+                                      file='').delete()
+
+def is_ingested(submission_exercise, aplus_submission_id):
+    """ True if a submission has already been created from the A+ submission """
+    if aplus_submission_id is None:
+        return False
+    return OriginalSubmission.objects.filter(exercise=submission_exercise,
+                                             aplus_submission_id=aplus_submission_id).exists()
+
 def get_user(aplus_submission):
 
     submitter = aplus_submission["submitters"][0]
@@ -67,6 +90,45 @@ def get_user(aplus_submission):
 
     return user
 
+def submitter_email(aplus_submission):
+    return User.objects.normalize_email(aplus_submission["submitters"][0]["email"])
+
+def get_users(aplus_submissions):
+    """
+    get_user for many submissions at once: the existing LTI users are fetched with one
+    query and the missing ones are created with another. Returns a dict email -> User.
+    """
+    submitters = {}
+    for aplus_submission in aplus_submissions:
+        submitters.setdefault(submitter_email(aplus_submission), aplus_submission["submitters"][0]["username"])
+
+    users = {}
+    for user in User.objects.filter(email__in=submitters, lti=True).order_by('pk'):
+        users.setdefault(user.email, user)
+
+    missing = [email for email in submitters if email not in users]
+    if missing:
+        logger.info(f"USERS WERE NOT FOUND BY EMAIL {missing} --> creating new ones")
+        # prefixed username to not clash with shibboleth-based accounts
+        created = User.objects.bulk_create([
+            User(username=User.normalize_username(f"lti_{submitters[email]}"), email=email, lti=True,
+                 password=make_password(None))
+            for email in missing
+        ])
+        users.update({user.email: user for user in created})
+
+    return users
+
+def open_submission_file(submission_exercise, aplus_submission):
+    """
+    StreamedResponseFile of the file of the A+ submission, named after the original file.
+    Nothing is downloaded before the file is read, the caller has to close it.
+    """
+    file_url = aplus_submission["files"][0]["url"]
+    filename = aplus_submission["files"][0]["filename"]
+    response = get_client().get(file_url, submission_exercise.course.aplus_apikey, stream=True)
+    return StreamedResponseFile(response, filename, max_size=settings.APLUS_MAX_FILE_SIZE or None)
+
 def create_submission_for(submission_exercise, aplus_submission, user):
     """
        1. check if there's an user with the aplus submitter's email
@@ -75,21 +137,26 @@ def create_submission_for(submission_exercise, aplus_submission, user):
        4. create a new original submission with the file and submitter
     """
 
-    file_url = aplus_submission["files"][0]["url"]
-    filename = aplus_submission["files"][0]["filename"]
-    file_blob = requests.get(file_url, headers={ 'Authorization': f'Token {submission_exercise.course.aplus_apikey}' })
-
-    temp_file = NamedTemporaryFile(delete=True)
-    temp_file.name = filename
-    temp_file.write(file_blob.content)
-    temp_file.flush()
-
+    # the row is written first since the path of the file contains its pk
     new_orig_sub = OriginalSubmission(
                         course=submission_exercise.course,
                         submitter_user=user,
                         exercise=submission_exercise,
-                        file=File(temp_file)
+                        aplus_submission_id=aplus_submission["id"],
                         )
-    new_orig_sub.save()
-    logger.info(new_orig_sub)
+    with transaction.atomic():
+        new_orig_sub.save()
 
+    # the storage backend reads the body chunk by chunk, no transaction is open meanwhile
+    try:
+        submission_file = open_submission_file(submission_exercise, aplus_submission)
+        try:
+            new_orig_sub.file.save(submission_file.name, submission_file, save=False)
+        finally:
+            submission_file.close()
+    except Exception:
+        new_orig_sub.delete()
+        raise
+
+    new_orig_sub.save(update_fields=['file'])
+    logger.info(new_orig_sub)
@@ -37,10 +37,11 @@ class ExerciseIncomingHook(CourseContextMixin, DetailView):
         if self.object:
 
             # this will be processed from a "queue" by a cron job in a separate
-            # process handled by django mgmt commands
-            AplusAPICallRequest.objects.create(
+            # process handled by django mgmt commands. a repeated delivery of
+            # the same submission is not queued twice
+            AplusAPICallRequest.objects.upsert_for_hook(
                     submission_exercise=self.object,
-                    hook_data=self.request.POST)
+                    hook_data=self.request.POST.dict())
 
         # just end the connection no matter what actually happened
         return HttpResponse("OK :-)")
@@ -0,0 +1,148 @@
+"""
+Batch ingestion of AplusAPICallRequests.
+
+When a SubmissionExercise is connected to A+ after students have already submitted,
+hundreds of hook calls arrive at once and handling them one by one is bounded by the
+round-trip latency of the A+ API. ingest_batch claims a batch of due calls and handles
+them course by course: the submission JSON of every call and later the submitted files
+are fetched by a pool of threads, and the users and OriginalSubmissions are created
+with bulk queries. The threads only talk to A+ and the file storage, the database is
+only used by the calling thread. Like in the worker, the calls are claimed in a short
+transaction and no transaction is open while A+ is requested.
+"""
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from django.db import transaction
+
+from prplatform.submissions.models import OriginalSubmission
+
+from .client import FileTooLarge
+from .core import (
+        NOT_READY,
+        discard_incomplete,
+        get_real_submission_from_hook_data,
+        get_users,
+        open_submission_file,
+        submitter_email,
+    )
+from .models import AplusAPICallRequest
+from .worker import claim_calls, record_outcome
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _fetch(call):
+    """ (can_delete, msg, submission JSON to create a submission of or None) like handle_submission_by_hook """
+    try:
+        submission_json = get_real_submission_from_hook_data(call.submission_exercise, call.hook_data)
+        if submission_json['status'] == 'waiting':
+            return False, NOT_READY, None
+        grading_data = submission_json['grading_data']
+        if grading_data['points'] != grading_data['max_points']:
+            return True, 'Handled, may be deleted', None
+        return True, 'Handled, may be deleted', submission_json
+    except Exception:
+        logger.exception(f"Fetching the submission of {call} failed")
+        return False, traceback.format_exc(), None
+
+
+def _download(sub, submission_json):
+    """ Streams the file into the storage. Returns None or (msg, permanent) if it failed. """
+    try:
+        submission_file = open_submission_file(sub.exercise, submission_json)
+        try:
+            # save=False: the names are written with one query by _ingest_course
+            sub.file.save(submission_file.name, submission_file, save=False)
+        finally:
+            submission_file.close()
+    except FileTooLarge as e:
+        return str(e), True
+    except Exception:
+        logger.exception(f"Downloading the file of {sub} failed")
+        return traceback.format_exc(), False
+    return None
+
+
+def _ingest_course(pool, calls):
+    """ Handles the calls of one course. Returns {call: (can_delete, msg, permanent)}. """
+    outcomes = {}
+    discard_incomplete({call.submission_exercise_id for call in calls}, [call.aplus_submission_id for call in calls])
+    ingested = set(OriginalSubmission.objects.filter(exercise__in={call.submission_exercise_id for call in calls},
+                                                     aplus_submission_id__in=[call.aplus_submission_id
+                                                                              for call in calls])
+                                             .values_list('exercise_id', 'aplus_submission_id'))
+    for call in calls:
+        if (call.submission_exercise_id, call.aplus_submission_id) in ingested:
+            outcomes[call] = (True, 'Already ingested, may be deleted', False)
+    calls = [call for call in calls if call not in outcomes]
+
+    accepted = []
+    for call, (can_delete, msg, submission_json) in zip(calls, pool.map(_fetch, calls)):
+        outcomes[call] = (can_delete, msg, False)
+        if submission_json is not None:
+            accepted.append((call, submission_json))
+
+    if not accepted:
+        return outcomes
+
+    # the rows are written before the downloads since the paths of the files contain their pks
+    with transaction.atomic():
+        users = get_users([submission_json for call, submission_json in accepted])
+        subs = OriginalSubmission.objects.bulk_create([
+            OriginalSubmission(course=call.submission_exercise.course,
+                               submitter_user=users[submitter_email(submission_json)],
+                               exercise=call.submission_exercise,
+                               aplus_submission_id=submission_json["id"])
+            for call, submission_json in accepted
+        ])
+
+    failed = []
+    try:
+        downloads = list(pool.map(_download, subs, [submission_json for call, submission_json in accepted]))
+    except Exception:
+        OriginalSubmission.objects.filter(pk__in=[sub.pk for sub in subs]).delete()
+        raise
+    for (call, submission_json), sub, error in zip(accepted, subs, downloads):
+        if error is not None:
+            msg, permanent = error
+            outcomes[call] = (False, msg, permanent)
+            failed.append(sub.pk)
+
+    with transaction.atomic():
+        OriginalSubmission.objects.filter(pk__in=failed).delete()
+        OriginalSubmission.objects.bulk_update([sub for sub in subs if sub.pk not in failed], ['file'])
+    logger.info(f"Created {len(subs) - len(failed)} submissions from {len(calls)} calls")
+    return outcomes
+
+
+def ingest_batch(batch_size=100, concurrency=8):
+    """
+    Handles up to batch_size due calls with concurrency threads.
+    Returns the number of calls claimed, 0 when nothing is due.
+    """
+    calls = claim_calls(batch_size)
+    if not calls:
+        return 0
+
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='aplus-ingest') as pool:
+        calls.sort(key=lambda call: call.submission_exercise.course_id)
+        for course_id, course_calls in groupby(calls, key=lambda call: call.submission_exercise.course_id):
+            course_calls = list(course_calls)
+            try:
+                outcomes.update(_ingest_course(pool, course_calls))
+            except Exception:
+                logger.exception(f"Ingesting the calls of course {course_id} failed")
+                msg = traceback.format_exc()
+                outcomes.update({call: (False, msg, False) for call in course_calls})
+
+    with transaction.atomic():
+        AplusAPICallRequest.objects.filter(pk__in=[call.pk for call, (can_delete, msg, permanent)
+                                                   in outcomes.items() if can_delete]).delete()
+        for call, (can_delete, msg, permanent) in outcomes.items():
+            if not can_delete:
+                record_outcome(call, can_delete, msg, permanent)
+    return len(calls)
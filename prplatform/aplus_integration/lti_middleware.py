@@ -1,7 +1,12 @@
 import logging
-from django.db import IntegrityError
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpResponse
-from django.contrib.auth import authenticate, login
 from django.urls import resolve
 from oauthlib.oauth1 import SignatureOnlyEndpoint
 from oauthlib.common import urlencode
@@ -15,39 +20,111 @@ from prplatform.users.models import User
 
 logger = logging.getLogger(__name__)
 
+LTI_LAUNCH_KEYS = ('lti_message_type', 'lti_version', 'oauth_consumer_key')
+
+
+class ExpiringCache:
+    """ Thread-safe LRU cache of at most max_size entries that expire after ttl seconds """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedLTIRequestValidator(LTIRequestValidator):
+    """
+    LTIRequestValidator that keeps the client lookups in memory for LTI_CLIENT_CACHE_SECONDS
+    and remembers the used nonces in the Django cache, so that a launch doesn't query the
+    LTI clients from the database every time.
+
+    The lookups are kept in each process. A removed client or a changed secret is accepted
+    by a process until its entry expires, at most LTI_CLIENT_CACHE_SECONDS later. With 0
+    nothing is kept and every launch reads the client from the database.
+    """
+
+    CLIENT_CACHE_SIZE = 256
+
+    def __init__(self):
+        super().__init__()
+        self.clients = ExpiringCache(self.CLIENT_CACHE_SIZE, settings.LTI_CLIENT_CACHE_SECONDS)
+
+    def validate_client_key(self, client_key, request):
+        validate = super().validate_client_key
+        return self.clients.get_or_compute(('valid', client_key), lambda: validate(client_key, request))
+
+    def get_client_secret(self, client_key, request):
+        get_secret = super().get_client_secret
+        return self.clients.get_or_compute(('secret', client_key), lambda: get_secret(client_key, request))
+
+    def validate_timestamp_and_nonce(self, client_key, timestamp, nonce, request,
+                                     request_token=None, access_token=None):
+        # the endpoint rejects timestamps older than timestamp_lifetime, so a nonce only has to be
+        # remembered that long. cache.add is atomic and fails if the nonce has been used already
+        key = sha256(f"{client_key}:{timestamp}:{nonce}".encode()).hexdigest()
+        return cache.add(f"lti_nonce:{key}", True, timeout=self.timestamp_lifetime)
+
+
+def launch_params(request):
+    """ The parameters of an LTI launch, None for any other request """
+    # multipart posts are launches too: A+ forwards the embedded forms with file inputs signed
+    post = request.POST if request.method == 'POST' else {}
+
+    if not all(key in post or key in request.GET for key in LTI_LAUNCH_KEYS):
+        return None
+
+    query_dict = {}
+    query_dict.update(post.items())
+    query_dict.update(request.GET.items())
+    return query_dict
+
 
 class LtiLoginMiddleware(MiddlewareMixin):
 
     def __init__(self, get_response=None):
         self.get_response = get_response
+        # the endpoint and the validator are stateless and shared by all requests
+        self.endpoint = SignatureOnlyEndpoint(CachedLTIRequestValidator())
 
     def __call__(self, request):
 
         request.LTI_MODE = False
 
-        uri = urlparse(request.build_absolute_uri())
-        method = request.method
+        query_dict = launch_params(request)
 
-        query_dict = {}
-        if request.POST:
-            query_dict.update(request.POST.items())
-        if request.GET:
-            query_dict.update(request.GET.items())
-
-        if 'lti_message_type' in query_dict and \
-           'lti_version' in query_dict and \
-           'oauth_consumer_key' in query_dict:
+        if query_dict is not None:
 
+            uri = urlparse(request.build_absolute_uri())
             uri = uri._replace(query=urlencode(query_dict.items())).geturl()
-            headers = {k: v for k, v in request.META.items() if not k.startswith('wsgi.')}
-
-            if 'HTTP_AUTHORIZATION' in headers:
-                headers['Authorization'] = headers['HTTP_AUTHORIZATION']
-            if 'CONTENT_TYPE' in headers:
-                headers['Content-Type'] = headers['CONTENT_TYPE']
+            # only these are used for checking the signature
+            headers = {}
+            if 'HTTP_AUTHORIZATION' in request.META:
+                headers['Authorization'] = request.META['HTTP_AUTHORIZATION']
+            if 'CONTENT_TYPE' in request.META:
+                headers['Content-Type'] = request.META['CONTENT_TYPE']
 
-            endpoint = SignatureOnlyEndpoint(LTIRequestValidator())
-            is_valid, oauth_request = endpoint.validate_request(uri, method, '', headers)
+            is_valid, oauth_request = self.endpoint.validate_request(uri, request.method, '', headers)
 
             if not is_valid:
                 # normally an exception would be raised in a case like this.
@@ -72,10 +149,10 @@ class LtiLoginMiddleware(MiddlewareMixin):
             # it is CRITICAL to pay attention to UserModel.lti boolean since accounts of
             # Shibboleth and LTI login protocols should not be mixed.
 
-            try:
-                user = User.objects.get(email=oauth_request.lis_person_contact_email_primary, lti=True)
+            user = User.objects.filter(email=oauth_request.lis_person_contact_email_primary, lti=True).first()
+            if user:
                 logger.info(f"Previous user found! Logging {user} in")
-            except Exception:
+            else:
                 logger.info("Previous user NOT FOUND --> create a new one")
                 user = LTIAuthBackend().authenticate(oauth_request=oauth_request)
                 user.lti = True
@@ -83,11 +160,10 @@ class LtiLoginMiddleware(MiddlewareMixin):
                 logger.info(f"Created user {user}")
 
             resolved_view = resolve(request.path)
-            course = Course.objects.get(
-                    base_course__url_slug=resolved_view.kwargs['base_url_slug'],
-                    url_slug=resolved_view.kwargs['url_slug'])
+            Course.objects.enroll_by_slugs(user,
+                                           resolved_view.kwargs['base_url_slug'],
+                                           resolved_view.kwargs['url_slug'])
 
-            course.enroll(user)
             request.user = user
 
         response = self.get_response(request)
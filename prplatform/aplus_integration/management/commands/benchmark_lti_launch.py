@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import itertools
+import time
+
+from django_lti_login.models import LTIClient
+from oauthlib.oauth1 import Client, SIGNATURE_TYPE_BODY
+
+from prplatform.aplus_integration.lti_middleware import LtiLoginMiddleware
+from prplatform.courses.models import BaseCourse, Course
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measures the latency of LtiLoginMiddleware for plain requests, first LTI launches '
+            'of new students and repeated launches of the same student. All data is created inside '
+            'a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='How many requests of each kind are measured')
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        self.middleware = LtiLoginMiddleware(lambda request: HttpResponse('OK'))
+        self.students = itertools.count()
+
+        try:
+            with transaction.atomic():
+                self._create_data()
+                rows = [
+                    ('plain request', lambda: self.factory.get(self.path)),
+                    ('first launch', lambda: self._launch(f"benchmark-lti-{next(self.students)}")),
+                    ('repeated launch', lambda: self._launch('benchmark-lti')),
+                ]
+                self.stdout.write(f"{'':>16} {'ms':>10} {'queries':>8}")
+                for name, make_request in rows:
+                    elapsed_ms, query_count = self._measure(make_request, options['repeat'])
+                    self.stdout.write(f"{name:>16} {elapsed_ms:>10.3f} {query_count:>8}")
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _measure(self, make_request, repeat):
+        # warm up, the repeated launches need the student to be enrolled already
+        self.middleware(make_request())
+
+        elapsed = 0
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(repeat):
+                # building and signing the request is not measured
+                request = make_request()
+                start = time.perf_counter()
+                response = self.middleware(request)
+                elapsed += time.perf_counter() - start
+                assert response.content == b'OK', response.content
+        return elapsed * 1000 / repeat, len(queries) / repeat
+
+    def _launch(self, student):
+        params = {
+            'lti_message_type': 'basic-lti-launch-request',
+            'lti_version': 'LTI-1p0',
+            'resource_link_id': 'benchmark',
+            'user_id': student,
+            'lis_person_contact_email_primary': f'{student}@prp.fi',
+            'lis_person_name_given': 'Benchmark',
+            'lis_person_name_family': 'LTI',
+            'roles': 'Student',
+        }
+        # every launch has a new nonce
+        _, _, body = self.oauth_client.sign(f"http://testserver{self.path}", http_method='POST', body=params,
+                                            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        return self.factory.post(self.path, data=body, content_type='application/x-www-form-urlencoded')
+
+    def _create_data(self):
+        now = timezone.now()
+        base_course = BaseCourse.objects.create(name='Benchmark', code='BENCHMARK-LTI',
+                                                url_slug='benchmark-lti', school='BENCH')
+        Course.objects.create(base_course=base_course, year=now.year, code='BENCHMARK-LTI',
+                              url_slug='benchmark-lti', start_date=now.date(), end_date=now.date())
+        LTIClient.objects.create(key='benchmark-lti', secret='benchmark-lti-secret')
+        self.oauth_client = Client('benchmark-lti', client_secret='benchmark-lti-secret',
+                                   signature_type=SIGNATURE_TYPE_BODY)
+        self.path = reverse('courses:detail', kwargs={'base_url_slug': 'benchmark-lti', 'url_slug': 'benchmark-lti'})
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from prplatform.aplus_integration.client import get_client
+from prplatform.aplus_integration.ingest import ingest_batch
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Handles every due AplusAPICallRequest in batches, fetching from A+ concurrently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Number of concurrent A+ API calls (default: 8)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of calls claimed at a time (default: 100)')
+
+    def handle(self, *args, **options):
+        total = 0
+        # failed calls are scheduled for later so they are not claimed again by the loop
+        while True:
+            claimed = ingest_batch(batch_size=options['batch_size'], concurrency=options['concurrency'])
+            if not claimed:
+                break
+            total += claimed
+            logger.info(f"Ingested {total} AplusAPICallRequests so far")
+        logger.info(f"Ingested {total} AplusAPICallRequests")
+        logger.info(f"A+ API calls: {get_client().metrics.snapshot()}")
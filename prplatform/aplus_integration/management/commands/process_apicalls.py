@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from prplatform.aplus_integration.client import get_client
+from prplatform.aplus_integration.worker import run_workers
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Processes the queue of AplusAPICallRequests as a long-lived process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of concurrent workers (default: 4)')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='Seconds an idle worker waits before checking the queue again (default: 5)')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when nothing is due instead of waiting for new calls')
+
+    def handle(self, *args, **options):
+        logger.info(f"Starting {options['workers']} AplusAPICallRequest workers")
+        run_workers(workers=options['workers'], once=options['once'], poll_interval=options['poll_interval'])
+        logger.info("AplusAPICallRequest workers stopped")
+        logger.info(f"A+ API calls: {get_client().metrics.snapshot()}")
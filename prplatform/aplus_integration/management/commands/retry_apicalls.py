@@ -1,41 +1,36 @@
-
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.utils import timezone
 
 from prplatform.aplus_integration.models import AplusAPICallRequest
-from prplatform.aplus_integration.core import (
-        handle_submission_by_hook,
-    )
+from prplatform.aplus_integration.client import get_client
+from prplatform.aplus_integration.worker import due_calls, run_workers
 
 import logging
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'Fetches all submissions to all APLUS SubmissionExercises'
+    help = 'Fetches all due submissions to all APLUS SubmissionExercises and exits'
 
     def add_arguments(self, parser):
-        pass
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of concurrent workers (default: 1)')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Give the calls that have run out of attempts another round')
 
     def handle(self, *args, **options):
 
-        pending_calls = AplusAPICallRequest.objects.all()
-
-        logger.info(f"Found {pending_calls.count()} AplusAPICallRequests ---> fetch now")
-
-        for call in pending_calls:
-            with transaction.atomic():
-                # PLEASE NOTE:
-                # this transaction *only* means rollback, the possible exception
-                # is not handled here in any way which will terminate the mgmt command
-                # call. since the system is configured to use sentry reporting, the
-                # error will be reported there and sufficient means may be taken then.
-                # if there's one tricky submission causing problems, it may be removed
-                # through django admin or shell access.
-                logger.debug(f"Starting to handle {call}")
-                can_delete, msg = handle_submission_by_hook(call)
-                if can_delete:
-                    logger.debug('Hook handled the call -> deleting')
-                    call.delete()
-
-        logger.info(f"Handled all AplusAPICallRequests")
+        if options['requeue_dead']:
+            requeued = AplusAPICallRequest.objects.filter(state=AplusAPICallRequest.DEAD) \
+                                                  .update(state=AplusAPICallRequest.PENDING,
+                                                          attempts=0,
+                                                          next_attempt_at=timezone.now())
+            logger.info(f"Requeued {requeued} dead AplusAPICallRequests")
+
+        logger.info(f"Found {due_calls().count()} due AplusAPICallRequests ---> fetch now")
+
+        # a failing call no longer aborts the run, it is retried later with a backoff
+        run_workers(workers=options['workers'], once=True)
+
+        logger.info(f"Handled all due AplusAPICallRequests")
+        logger.info(f"A+ API calls: {get_client().metrics.snapshot()}")
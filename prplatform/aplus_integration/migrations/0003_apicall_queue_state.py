@@ -0,0 +1,38 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplus_integration', '0002_auto_20190124_1652'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aplusapicallrequest',
+            name='state',
+            field=models.CharField(choices=[('PENDING', 'Waiting to be processed'), ('DEAD', 'Gave up after too many failed attempts')], default='PENDING', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='aplusapicallrequest',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='aplusapicallrequest',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='aplusapicallrequest',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='aplusapicallrequest',
+            index=models.Index(fields=['state', 'next_attempt_at'], name='apicall_due_idx'),
+        ),
+    ]
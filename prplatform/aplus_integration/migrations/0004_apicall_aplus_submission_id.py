@@ -0,0 +1,54 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+def flatten_hook_data(apps, schema_editor):
+    """ Old calls stored dict(request.POST) where every value is a list, keep the first value of each """
+    AplusAPICallRequest = apps.get_model('aplus_integration', 'AplusAPICallRequest')
+    for call in AplusAPICallRequest.objects.order_by('pk'):
+        if not any(isinstance(value, list) for value in call.hook_data.values()):
+            continue
+        call.hook_data = {key: (value[0] if value else None) if isinstance(value, list) else value
+                          for key, value in call.hook_data.items()}
+        call.save(update_fields=['hook_data'])
+
+
+def fill_submission_ids(apps, schema_editor):
+    """ Parses the submission ids of the queued calls and drops the repeated deliveries """
+    AplusAPICallRequest = apps.get_model('aplus_integration', 'AplusAPICallRequest')
+    seen = set()
+    duplicates = []
+    for call in AplusAPICallRequest.objects.order_by('pk'):
+        try:
+            call.aplus_submission_id = int(call.hook_data.get('submission_id'))
+        except (TypeError, ValueError):
+            continue
+        key = (call.submission_exercise_id, call.aplus_submission_id)
+        if key in seen:
+            duplicates.append(call.pk)
+            continue
+        seen.add(key)
+        call.save(update_fields=['aplus_submission_id'])
+    AplusAPICallRequest.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplus_integration', '0003_apicall_queue_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aplusapicallrequest',
+            name='aplus_submission_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(flatten_hook_data, migrations.RunPython.noop),
+        migrations.RunPython(fill_submission_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='aplusapicallrequest',
+            constraint=models.UniqueConstraint(fields=('submission_exercise', 'aplus_submission_id'), name='apicall_unique_submission'),
+        ),
+    ]
@@ -1,10 +1,83 @@
+from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.db import models
+from django.utils import timezone
 
 from prplatform.core.models import TimeStampedModel
 from prplatform.exercises.models import SubmissionExercise
 
+def parse_submission_id(hook_data):
+    """ The A+ submission id in the hook data or None """
+    try:
+        return int(hook_data.get('submission_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+class AplusAPICallRequestManager(models.Manager):
+
+    def upsert_for_hook(self, submission_exercise, hook_data):
+        """
+        Queues the hook call unless the same submission is already in the queue.
+        INSERT ... ON CONFLICT DO NOTHING makes concurrent deliveries safe too.
+        """
+        self.bulk_create([self.model(submission_exercise=submission_exercise,
+                                     hook_data=hook_data,
+                                     aplus_submission_id=parse_submission_id(hook_data))],
+                         ignore_conflicts=True)
+
+
 class AplusAPICallRequest(TimeStampedModel):
+    """ A hook call from A+ waiting to be processed by aplus_integration.worker.
+        Handled calls are deleted, failing ones are retried with exponential backoff
+        and moved to the DEAD state after APLUS_QUEUE_MAX_ATTEMPTS attempts.
+        Submissions that are not graded yet are checked again without using attempts. """
+
+    PENDING = 'PENDING'
+    DEAD = 'DEAD'
+    STATE_CHOICES = (
+        (PENDING, 'Waiting to be processed'),
+        (DEAD, 'Gave up after too many failed attempts'),
+    )
 
     submission_exercise = models.ForeignKey(SubmissionExercise, on_delete=models.CASCADE)
     hook_data = JSONField()
+    # A+ may deliver the hook of a submission more than once, see upsert_for_hook
+    aplus_submission_id = models.IntegerField(null=True)
+
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    objects = AplusAPICallRequestManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'next_attempt_at'], name='apicall_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['submission_exercise', 'aplus_submission_id'],
+                                    name='apicall_unique_submission'),
+        ]
+
+    def __str__(self):
+        return f"AplusAPICallRequest {self.pk} ({self.state}, attempts: {self.attempts})"
+
+    def schedule_retry(self, error, permanent=False):
+        """ permanent errors go straight to the DEAD state """
+        self.attempts += 1
+        self.last_error = error
+        if permanent or self.attempts >= settings.APLUS_QUEUE_MAX_ATTEMPTS:
+            self.state = self.DEAD
+        else:
+            delay = min(settings.APLUS_QUEUE_BACKOFF_SECONDS * 2 ** (self.attempts - 1),
+                        settings.APLUS_QUEUE_MAX_BACKOFF_SECONDS)
+            self.next_attempt_at = timezone.now() + timezone.timedelta(seconds=delay)
+        self.save()
+
+    def postpone(self, msg):
+        """ A+ has not graded the submission yet: checked again later without using an attempt """
+        self.last_error = msg
+        self.next_attempt_at = timezone.now() + timezone.timedelta(seconds=settings.APLUS_QUEUE_NOT_READY_SECONDS)
+        self.save()
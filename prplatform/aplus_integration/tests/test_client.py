@@ -0,0 +1,129 @@
+from django.test import SimpleTestCase
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import threading
+import time
+
+from prplatform.aplus_integration.client import AplusAPIError, AplusClient, FileTooLarge, StreamedResponseFile
+
+FILE_SIZE = 256 * 1024
+
+
+class StubAplusHandler(BaseHTTPRequestHandler):
+    """ /ok answers JSON, /flaky fails with 503 until server.flaky_failures run out, /slow hangs """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.tokens.append(self.headers.get('Authorization'))
+
+        if self.path in ('/file', '/chunked'):
+            return self._respond_file(chunked=self.path == '/chunked')
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/flaky' and self.server.flaky_failures > 0:
+            self.server.flaky_failures -= 1
+            self._respond(503, {'detail': 'try again'})
+        else:
+            self._respond(200, {'status': 'ready'})
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond_file(self, chunked):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(FILE_SIZE))
+        self.end_headers()
+        for _ in range(FILE_SIZE // 1024):
+            block = b'x' * 1024
+            if chunked:
+                self.wfile.write(f"{len(block):x}\r\n".encode() + block + b"\r\n")
+            else:
+                self.wfile.write(block)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class StubAplusServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class AplusClientTest(SimpleTestCase):
+
+    def setUp(self):
+        self.server = StubAplusServer(('127.0.0.1', 0), StubAplusHandler)
+        self.server.connections = set()
+        self.server.tokens = []
+        self.server.flaky_failures = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.site = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = AplusClient(connect_timeout=1, read_timeout=0.3, retries=2, backoff=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get_json(f"{self.site}/ok", 'secret'), {'status': 'ready'})
+
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.server.tokens, ['Token secret'] * 3)
+        self.assertEqual(self.client.metrics.snapshot()[self.site]['calls'], 3)
+
+    def test_retries_server_errors(self):
+        self.server.flaky_failures = 2
+        self.assertEqual(self.client.get_json(f"{self.site}/flaky", 'secret'), {'status': 'ready'})
+
+        metrics = self.client.metrics.snapshot()[self.site]
+        self.assertEqual(metrics['calls'], 3)
+        self.assertEqual(metrics['errors'], 2)
+
+        self.server.flaky_failures = 3
+        self.assertRaises(AplusAPIError, self.client.get, f"{self.site}/flaky", 'secret')
+
+    def test_read_timeout(self):
+        started = time.monotonic()
+        self.assertRaises(AplusAPIError, self.client.get, f"{self.site}/slow", 'secret')
+        # three attempts of 0.3 seconds each instead of hanging
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(self.client.metrics.snapshot()[self.site]['errors'], 3)
+
+    def test_file_is_streamed_in_chunks(self):
+        for path in ['/file', '/chunked']:
+            response = self.client.get(f"{self.site}{path}", 'secret', stream=True)
+            streamed = StreamedResponseFile(response, 'submission.py')
+            chunk_sizes = [len(chunk) for chunk in streamed.chunks(chunk_size=16 * 1024)]
+            streamed.close()
+
+            self.assertEqual(sum(chunk_sizes), FILE_SIZE)
+            self.assertLessEqual(max(chunk_sizes), 16 * 1024)
+
+    def test_oversized_file_is_aborted(self):
+        # Content-Length is checked before anything is read
+        response = self.client.get(f"{self.site}/file", 'secret', stream=True)
+        self.assertRaises(FileTooLarge, StreamedResponseFile, response, 'submission.py', max_size=FILE_SIZE - 1)
+
+        # without it the transfer is aborted once the limit is passed
+        response = self.client.get(f"{self.site}/chunked", 'secret', stream=True)
+        streamed = StreamedResponseFile(response, 'submission.py', max_size=64 * 1024)
+        received = []
+        with self.assertRaises(FileTooLarge):
+            for chunk in streamed.chunks(chunk_size=16 * 1024):
+                received.append(chunk)
+        self.assertLessEqual(sum(len(chunk) for chunk in received), 64 * 1024)
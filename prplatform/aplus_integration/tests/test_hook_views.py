@@ -0,0 +1,25 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from prplatform.aplus_integration.models import AplusAPICallRequest
+from prplatform.exercises.models import SubmissionExercise
+
+
+class ExerciseIncomingHookTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def test_repeated_delivery_is_queued_once(self):
+        se = SubmissionExercise.objects.get(name='T3 Plus submission')
+        se.aplus_course_id = 1
+        se.aplus_exercise_id = 6
+        se.save()
+
+        url = reverse('courses:exercises:hook-view', kwargs={'base_url_slug': 'prog1', 'url_slug': 'F2018'})
+        hook_data = {'site': 'http://plus', 'course_id': '1', 'exercise_id': '6', 'submission_id': '8'}
+        for _ in range(3):
+            self.assertEqual(self.client.post(url, hook_data).status_code, 200)
+        self.client.post(url, dict(hook_data, submission_id='9'))
+
+        calls = AplusAPICallRequest.objects.filter(submission_exercise=se).order_by('aplus_submission_id')
+        self.assertEqual([call.aplus_submission_id for call in calls], [8, 9])
+        self.assertEqual(calls[0].hook_data, hook_data)
@@ -0,0 +1,91 @@
+import io
+
+import requests
+
+from django.test import TestCase
+
+from unittest import mock
+
+from prplatform.aplus_integration.ingest import ingest_batch
+from prplatform.aplus_integration.models import AplusAPICallRequest
+from prplatform.exercises.models import SubmissionExercise
+from prplatform.submissions.models import OriginalSubmission
+from prplatform.users.models import User
+
+
+class FakeClient:
+    """ Answers like the A+ API: submission n is submitted by student n and ready unless n is 0 """
+
+    def __init__(self):
+        self.fetched = []
+
+    def get_json(self, url, apikey):
+        n = int(url.rsplit('/', 1)[1])
+        self.fetched.append(n)
+        return {
+            'id': n,
+            'status': 'waiting' if n == 0 else 'ready',
+            'grade': 10,
+            'late_penalty_applied': None,
+            'grading_data': {'points': 10, 'max_points': 10 if n != 3 else 20},
+            'submitters': [{'email': f'aplus{n}@prp.fi', 'username': f'aplus{n}'}],
+            'files': [{'url': f'http://plus/files/{n}', 'filename': f'sub{n}.py'}],
+        }
+
+    def get(self, url, apikey, stream=False):
+        if url.endswith('/4'):
+            raise requests.ConnectionError('connection refused')
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(f"print({url.rsplit('/', 1)[1]})".encode())
+        return response
+
+
+@mock.patch('prplatform.aplus_integration.core.get_client', return_value=FakeClient())
+class IngestTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def setUp(self):
+        self.se = SubmissionExercise.objects.get(name='T3 Plus submission')
+        for n in range(6):
+            AplusAPICallRequest.objects.upsert_for_hook(self.se, {'site': 'http://plus', 'submission_id': str(n)})
+        self.existing = User.objects.create(username='lti_aplus1', email='aplus1@prp.fi', lti=True)
+
+    def test_batch_is_ingested(self, get_client):
+        subs_before = OriginalSubmission.objects.filter(exercise=self.se).count()
+
+        self.assertEqual(ingest_batch(batch_size=10, concurrency=3), 6)
+
+        created = list(OriginalSubmission.objects.filter(exercise=self.se).order_by('pk'))[subs_before:]
+        # 0 is waiting, 3 did not get full points and the file of 4 could not be downloaded
+        self.assertEqual([sub.submitter_user.email for sub in created],
+                         ['aplus1@prp.fi', 'aplus2@prp.fi', 'aplus5@prp.fi'])
+        self.assertEqual(created[0].submitter_user, self.existing)
+        self.assertTrue(User.objects.get(email='aplus2@prp.fi').lti)
+        self.assertEqual(created[1].file.read(), b'print(2)')
+
+        remaining = AplusAPICallRequest.objects.order_by('pk')
+        self.assertEqual([call.hook_data['submission_id'] for call in remaining], ['0', '4'])
+        # waiting for the grading in A+ is not a failed attempt
+        self.assertEqual([call.attempts for call in remaining], [0, 1])
+        self.assertIn('connection refused', remaining[1].last_error)
+
+        # the failed calls are retried later, not in the same run
+        self.assertEqual(ingest_batch(), 0)
+
+    def test_redelivered_submission_is_not_fetched_again(self, get_client):
+        ingest_batch()
+        subs = OriginalSubmission.objects.filter(exercise=self.se).count()
+
+        # delivered again after it was ingested, and twice while still in the queue
+        AplusAPICallRequest.objects.upsert_for_hook(self.se, {'site': 'http://plus', 'submission_id': '2'})
+        AplusAPICallRequest.objects.upsert_for_hook(self.se, {'site': 'http://plus', 'submission_id': '7'})
+        AplusAPICallRequest.objects.upsert_for_hook(self.se, {'site': 'http://plus', 'submission_id': '7'})
+        self.assertEqual(AplusAPICallRequest.objects.filter(aplus_submission_id__in=[2, 7]).count(), 2)
+
+        get_client.return_value.fetched.clear()
+        self.assertEqual(ingest_batch(), 2)
+
+        self.assertEqual(get_client.return_value.fetched, [7])
+        self.assertEqual(OriginalSubmission.objects.filter(exercise=self.se).count(), subs + 1)
+        self.assertFalse(AplusAPICallRequest.objects.filter(aplus_submission_id__in=[2, 7]).exists())
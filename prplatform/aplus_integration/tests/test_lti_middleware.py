@@ -0,0 +1,87 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from django_lti_login.models import LTIClient
+from oauthlib.oauth1 import Client, SIGNATURE_TYPE_BODY
+from urllib.parse import parse_qsl
+
+from prplatform.aplus_integration.lti_middleware import LtiLoginMiddleware
+from prplatform.courses.models import Course
+from prplatform.users.models import User
+
+
+class LtiLoginMiddlewareTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = LtiLoginMiddleware(lambda request: HttpResponse('OK'))
+        self.path = reverse('courses:detail', kwargs={'base_url_slug': 'prog1', 'url_slug': 'F2018'})
+        self.course = Course.objects.get(base_course__url_slug='prog1', url_slug='F2018')
+        self.user = User.objects.create(username='lti_student', email='lti_student@prp.fi', lti=True)
+
+        LTIClient.objects.create(key='aplus', secret='secret')
+        self.oauth_client = Client('aplus', client_secret='secret', signature_type=SIGNATURE_TYPE_BODY)
+
+    def launch(self, body=None):
+        if body is None:
+            _, _, body = self.oauth_client.sign(
+                f"http://testserver{self.path}", http_method='POST',
+                body={'lti_message_type': 'basic-lti-launch-request', 'lti_version': 'LTI-1p0',
+                      'lis_person_contact_email_primary': self.user.email},
+                headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        request = self.factory.post(self.path, data=body, content_type='application/x-www-form-urlencoded')
+        return request, body
+
+    def test_plain_request_does_not_query(self):
+        request = self.factory.get(self.path, {'lti_version': 'LTI-1p0'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.middleware(request).content, b'OK')
+        self.assertFalse(request.LTI_MODE)
+
+    def test_confirmed_enrollment_is_cached(self):
+        request, body = self.launch()
+        self.assertEqual(self.middleware(request).content, b'OK')
+        self.assertTrue(request.LTI_MODE)
+        self.assertEqual(request.user, self.user)
+        self.assertTrue(self.course.is_enrolled(self.user))
+
+        # the new enrollment is cached when the transaction commits, which never
+        # happens in a TestCase. the next launch confirms it
+        request, _ = self.launch()
+        self.middleware(request)
+
+        # the client and the enrollment are cached: only the user is queried
+        request, _ = self.launch()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.middleware(request).content, b'OK')
+        self.assertEqual(request.user, self.user)
+
+        # removing the enrollment removes the cached one too
+        self.user.enrollments.all().delete()
+        request, _ = self.launch()
+        self.middleware(request)
+        self.assertTrue(self.course.is_enrolled(self.user))
+
+    def test_multipart_launch_logs_in(self):
+        # the embedded forms with file inputs are posted as multipart/form-data
+        _, body = self.launch()
+        data = dict(parse_qsl(body))
+        data['file'] = SimpleUploadedFile('answer.txt', b'answer')
+        request = self.factory.post(self.path, data=data)
+
+        self.assertEqual(self.middleware(request).content, b'OK')
+        self.assertTrue(request.LTI_MODE)
+        self.assertEqual(request.user, self.user)
+        self.assertTrue(request._dont_enforce_csrf_checks)
+        self.assertEqual(request.FILES['file'].read(), b'answer')
+
+    def test_replayed_launch_is_rejected(self):
+        request, body = self.launch()
+        self.middleware(request)
+
+        request, _ = self.launch(body)
+        self.assertIn(b'LTI login/authentication failed', self.middleware(request).content)
+        self.assertFalse(request.LTI_MODE)
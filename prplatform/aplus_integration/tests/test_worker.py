@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from unittest import mock
+
+from prplatform.aplus_integration.models import AplusAPICallRequest
+from prplatform.aplus_integration.worker import claim_calls, process_next
+from prplatform.exercises.models import SubmissionExercise
+
+
+class WorkerTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def setUp(self):
+        self.se = SubmissionExercise.objects.get(name='T3 Plus submission')
+        self.call = AplusAPICallRequest.objects.create(submission_exercise=self.se,
+                                                       hook_data={'submission_id': '1'})
+
+    @mock.patch('prplatform.aplus_integration.worker.handle_submission_by_hook', return_value=(True, ''))
+    def test_handled_call_is_deleted(self, handler):
+        self.assertTrue(process_next())
+        self.assertFalse(AplusAPICallRequest.objects.exists())
+        self.assertFalse(process_next())
+
+    @mock.patch('prplatform.aplus_integration.worker.handle_submission_by_hook', side_effect=ValueError('boom'))
+    def test_failing_call_backs_off_and_dies(self, handler):
+        self.assertTrue(process_next())
+        self.call.refresh_from_db()
+        self.assertEqual(self.call.attempts, 1)
+        self.assertIn('boom', self.call.last_error)
+        self.assertGreater(self.call.next_attempt_at, timezone.now())
+
+        # not due before the backoff has passed
+        self.assertFalse(process_next())
+
+        first_delay = self.call.next_attempt_at - self.call.modified
+        for attempt in range(2, settings.APLUS_QUEUE_MAX_ATTEMPTS + 1):
+            AplusAPICallRequest.objects.update(next_attempt_at=timezone.now())
+            self.assertTrue(process_next())
+        self.call.refresh_from_db()
+
+        self.assertEqual(self.call.state, AplusAPICallRequest.DEAD)
+        self.assertEqual(self.call.attempts, settings.APLUS_QUEUE_MAX_ATTEMPTS)
+        self.assertGreater(settings.APLUS_QUEUE_BACKOFF_SECONDS * 2, first_delay.total_seconds())
+
+        # dead calls are never claimed
+        AplusAPICallRequest.objects.update(next_attempt_at=timezone.now())
+        self.assertFalse(process_next())
+
+    @mock.patch('prplatform.aplus_integration.worker.handle_submission_by_hook', return_value=(False, 'Not ready yet'))
+    def test_waiting_submission_is_retried(self, handler):
+        self.assertTrue(process_next())
+        self.call.refresh_from_db()
+        self.assertEqual(self.call.state, AplusAPICallRequest.PENDING)
+        self.assertEqual(self.call.last_error, 'Not ready yet')
+        self.assertGreater(self.call.next_attempt_at, timezone.now())
+
+        # waiting for the grading doesn't use up the attempts
+        for attempt in range(settings.APLUS_QUEUE_MAX_ATTEMPTS + 1):
+            AplusAPICallRequest.objects.update(next_attempt_at=timezone.now())
+            self.assertTrue(process_next())
+        self.call.refresh_from_db()
+        self.assertEqual(self.call.state, AplusAPICallRequest.PENDING)
+        self.assertEqual(self.call.attempts, 0)
+
+    def test_claimed_call_is_skipped_by_other_workers(self):
+        self.assertEqual(claim_calls(10), [self.call])
+        self.assertEqual(claim_calls(10), [])
+
+        # the worker died, the call is handled again once the claim has expired
+        AplusAPICallRequest.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(claim_calls(10), [self.call])
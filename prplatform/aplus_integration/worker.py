@@ -0,0 +1,110 @@
+"""
+Queue worker for AplusAPICallRequests.
+
+Each worker claims the next due call in a short transaction: the row is locked with
+SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers (threads or processes) never
+claim the same call and never wait for each other, and its next attempt is moved
+APLUS_QUEUE_CLAIM_SECONDS ahead. The call is then handled without any transaction
+open during the requests to A+. A handled call is deleted; a submission that A+
+has not graded yet is checked again later; any other outcome schedules a retry with
+exponential backoff and the call ends up in the DEAD state after too many attempts.
+"""
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .client import FileTooLarge
+from .core import NOT_READY, handle_submission_by_hook
+from .models import AplusAPICallRequest
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def due_calls():
+    return AplusAPICallRequest.objects.filter(state=AplusAPICallRequest.PENDING,
+                                              next_attempt_at__lte=timezone.now()) \
+                                      .order_by('next_attempt_at', 'pk')
+
+
+def claim_calls(limit):
+    """
+    Up to limit due calls, claimed for this worker. Other workers skip them until
+    APLUS_QUEUE_CLAIM_SECONDS have passed, or until their outcome is recorded.
+    """
+    with transaction.atomic():
+        calls = list(due_calls().select_for_update(skip_locked=True, of=('self',))
+                                .select_related('submission_exercise__course')[:limit])
+        claimed_until = timezone.now() + timezone.timedelta(seconds=settings.APLUS_QUEUE_CLAIM_SECONDS)
+        AplusAPICallRequest.objects.filter(pk__in=[call.pk for call in calls]).update(next_attempt_at=claimed_until)
+    return calls
+
+
+def record_outcome(call, can_delete, msg, permanent=False):
+    """ Deletes a handled call, otherwise schedules the next attempt """
+    if can_delete:
+        logger.debug('Hook handled the call -> deleting')
+        call.delete()
+    elif msg == NOT_READY:
+        call.postpone(msg)
+    else:
+        call.schedule_retry(msg, permanent=permanent)
+        if call.state == AplusAPICallRequest.DEAD:
+            logger.error(f"Giving up {call}: {msg}")
+
+
+def process_next():
+    """ Handles the next due call. Returns False if there was nothing to do. """
+    calls = claim_calls(1)
+    if not calls:
+        return False
+    call = calls[0]
+
+    logger.debug(f"Starting to handle {call}")
+    permanent = False
+    try:
+        can_delete, msg = handle_submission_by_hook(call)
+    except FileTooLarge as e:
+        can_delete, msg, permanent = False, str(e), True
+    except Exception:
+        logger.exception(f"Handling {call} failed")
+        can_delete, msg = False, traceback.format_exc()
+
+    record_outcome(call, can_delete, msg, permanent)
+    return True
+
+
+def _work(stop, once, poll_interval):
+    try:
+        while not stop.is_set():
+            if not process_next():
+                if once:
+                    return
+                stop.wait(poll_interval)
+    finally:
+        # every thread has its own database connection
+        connection.close()
+
+
+def run_workers(workers=1, once=False, poll_interval=5, stop=None):
+    """
+    Runs workers threads handling the queue. With once=True they return when nothing
+    is due, otherwise they poll every poll_interval seconds until stop is set.
+    """
+    stop = stop or threading.Event()
+    threads = [threading.Thread(target=_work, args=(stop, once, poll_interval), name=f"aplus-worker-{i}")
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        logger.info("Stopping the workers after their current calls")
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,170 @@
+"""
+Shared cache of data that is read on almost every page but rarely changes:
+course metadata, exercise configuration, questionnaires and group maps.
+
+Values are stored with get_or_set(namespace, key, compute) in the default Django
+cache, Redis in production and a local-memory or file cache in tests and local
+development. The receivers of the apps call invalidate() when the underlying models
+change. The entry is deleted right away and once more when the transaction
+commits, since a concurrent request may have cached the old rows meanwhile.
+A key invalidated in the current transaction is not cached again before the
+transaction ends, so rolled back changes never end up in the cache.
+
+Hits and misses are counted per namespace, see stats().
+"""
+import threading
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+_MISSING = object()
+
+_state = threading.local()
+
+
+class CacheStats:
+    """
+    Hit and miss counters per namespace. The counts are collected in the process and
+    added to the shared counters in the cache every FLUSH_EVERY lookups, so that
+    stats() sees the lookups of every process.
+    """
+
+    FLUSH_EVERY = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_count = 0
+
+    def count(self, namespace, hit):
+        with self._lock:
+            counts = self._pending.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+            self._pending_count += 1
+            if self._pending_count < self.FLUSH_EVERY:
+                return
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+        self._add(pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+        self._add(pending)
+
+    def _add(self, pending):
+        for namespace, counts in pending.items():
+            for name, amount in counts.items():
+                if not amount:
+                    continue
+                key = _stats_key(namespace, name)
+                # add() creates the counter, incr() is atomic in the cache backends
+                if not cache.add(key, amount, timeout=None):
+                    try:
+                        cache.incr(key, amount)
+                    except ValueError:
+                        cache.set(key, amount, timeout=None)
+                self._remember_namespace(namespace)
+
+    def _remember_namespace(self, namespace):
+        namespaces = cache.get(_stats_key('', 'namespaces'), set())
+        if namespace not in namespaces:
+            cache.set(_stats_key('', 'namespaces'), namespaces | {namespace}, timeout=None)
+
+    def snapshot(self):
+        """ {namespace: {'hits': n, 'misses': n}} of every process """
+        self.flush()
+        namespaces = cache.get(_stats_key('', 'namespaces'), set())
+        return {namespace: {name: cache.get(_stats_key(namespace, name), 0) for name in ('hits', 'misses')}
+                for namespace in sorted(namespaces)}
+
+    def reset(self):
+        with self._lock:
+            self._pending, self._pending_count = {}, 0
+        namespaces = cache.get(_stats_key('', 'namespaces'), set())
+        cache.delete_many([_stats_key(namespace, name) for namespace in namespaces for name in ('hits', 'misses')] +
+                          [_stats_key('', 'namespaces')])
+
+
+def _stats_key(namespace, name):
+    return f"prp:stats:{namespace}:{name}"
+
+
+def _key(namespace, key):
+    return f"prp:{namespace}:{key}"
+
+
+_stats = CacheStats()
+
+
+class _Invalidated:
+    """
+    The keys invalidated in one transaction. The object is registered with on_commit
+    and forgets the keys when it is called on commit. A rolled back transaction drops
+    its callbacks, and with them the only strong reference to the object.
+    """
+
+    def __init__(self):
+        self.keys = set()
+
+    def __call__(self):
+        self.keys.clear()
+
+
+def _invalidated_in_transaction(create=False):
+    """
+    The keys invalidated in the current transaction. _state only holds a weak reference
+    to them, so they are gone once the transaction has ended either way. With create,
+    a set is started for the current transaction if there's none.
+    """
+    ref = getattr(_state, 'invalidated', None)
+    invalidated = ref() if ref is not None else None
+    if invalidated is not None and connection.in_atomic_block:
+        return invalidated.keys
+
+    _state.invalidated = None
+    if not create or not connection.in_atomic_block:
+        return set()
+    invalidated = _Invalidated()
+    _state.invalidated = weakref.ref(invalidated)
+    transaction.on_commit(invalidated)
+    return invalidated.keys
+
+
+def get_or_set(namespace, key, compute, timeout=None):
+    """
+    The cached value of (namespace, key). On a miss, compute() is called and its value
+    is cached for timeout seconds, CACHE_TIMEOUT_SECONDS by default. None is cached too.
+    """
+    full_key = _key(namespace, key)
+    if full_key in _invalidated_in_transaction():
+        _stats.count(namespace, hit=False)
+        return compute()
+
+    value = cache.get(full_key, _MISSING)
+    _stats.count(namespace, hit=value is not _MISSING)
+    if value is _MISSING:
+        value = compute()
+        cache.set(full_key, value, settings.CACHE_TIMEOUT_SECONDS if timeout is None else timeout)
+    return value
+
+
+def invalidate(namespace, *keys):
+    """ Removes the keys of the namespace from the cache, now and when the transaction commits """
+    full_keys = [_key(namespace, key) for key in keys]
+    if not full_keys:
+        return
+    cache.delete_many(full_keys)
+    if connection.in_atomic_block:
+        _invalidated_in_transaction(create=True).update(full_keys)
+        transaction.on_commit(lambda: cache.delete_many(full_keys))
+
+
+def stats():
+    """ Hit and miss counts per namespace """
+    return _stats.snapshot()
+
+
+def reset_stats():
+    _stats.reset()
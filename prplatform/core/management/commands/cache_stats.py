@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from prplatform.core.cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = 'Shows the hit and miss counts of the shared cache per namespace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Set the counters to zero after showing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'namespace':>12} {'hits':>10} {'misses':>10} {'hit rate':>9}")
+        for namespace, counts in stats().items():
+            lookups = counts['hits'] + counts['misses']
+            rate = counts['hits'] / lookups if lookups else 0
+            self.stdout.write(f"{namespace:>12} {counts['hits']:>10} {counts['misses']:>10} {rate:>9.1%}")
+        if options['reset']:
+            reset_stats()
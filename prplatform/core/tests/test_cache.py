@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from prplatform.core import cache
+from prplatform.courses.models import Course
+from prplatform.users.models import StudentGroup, User
+
+
+class CacheTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def setUp(self):
+        cache.reset_stats()
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def test_values_are_cached_and_counted(self):
+        self.assertEqual(cache.get_or_set('test', 'a', self.compute), 1)
+        self.assertEqual(cache.get_or_set('test', 'a', self.compute), 1)
+        self.assertEqual(cache.get_or_set('test', 'b', self.compute), 2)
+
+        self.assertEqual(cache.stats()['test'], {'hits': 1, 'misses': 2})
+
+    def test_invalidated_key_is_not_cached_again_in_the_transaction(self):
+        cache.get_or_set('test', 'c', self.compute)
+        cache.invalidate('test', 'c')
+
+        # the transaction could still be rolled back, so the new values are not cached
+        self.assertEqual(cache.get_or_set('test', 'c', self.compute), 2)
+        self.assertEqual(cache.get_or_set('test', 'c', self.compute), 3)
+
+    def test_group_map_is_invalidated(self):
+        course = Course.objects.get(base_course__url_slug='prog1', url_slug='F2018')
+        student = User.objects.get(username='student1')
+        before = course.find_studentgroup_by_user(student)
+
+        group = StudentGroup.objects.create(course=course, name='cache-test', student_usernames=['new@prp.fi'])
+        new_student = User.objects.create(username='new', email='new@prp.fi')
+        self.assertEqual(course.find_studentgroup_by_user(new_student), group)
+        self.assertEqual(course.find_studentgroup_by_user(student), before)
+
+        group.delete()
+        self.assertIsNone(course.find_studentgroup_by_user(new_student))
+
+
+class CacheTransactionTest(TransactionTestCase):
+    """ Invalidations across real commits and rollbacks, TestCase never ends its transaction """
+
+    def setUp(self):
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def test_key_is_cached_again_after_the_invalidating_transaction_commits(self):
+        with transaction.atomic():
+            cache.get_or_set('test', 'committed', self.compute)
+            cache.invalidate('test', 'committed')
+            self.assertEqual(cache.get_or_set('test', 'committed', self.compute), 2)
+
+        with transaction.atomic():
+            self.assertEqual(cache.get_or_set('test', 'committed', self.compute), 3)
+            self.assertEqual(cache.get_or_set('test', 'committed', self.compute), 3)
+
+    def test_key_is_cached_again_after_the_invalidating_transaction_rolls_back(self):
+        try:
+            with transaction.atomic():
+                cache.invalidate('test', 'rolled-back')
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        with transaction.atomic():
+            self.assertEqual(cache.get_or_set('test', 'rolled-back', self.compute), 1)
+            self.assertEqual(cache.get_or_set('test', 'rolled-back', self.compute), 1)
@@ -15,3 +15,5 @@ class CoursesConfig(AppConfig):
         except ImportError:
             pass
 
+        import prplatform.courses.receivers  # noqa F401
+
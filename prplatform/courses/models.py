@@ -1,10 +1,15 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction
 from django.contrib.postgres.fields import ArrayField
 
+from prplatform.core.cache import get_or_set
 from prplatform.core.models import TimeStampedModel
 from prplatform.users.models import User
 
+from . import roles
+
 
 class BaseCourseManager(models.Manager):
     def get_by_natural_key(self, code):
@@ -40,14 +45,55 @@ class BaseCourse(TimeStampedModel):
                     user.is_superuser
                     or
                     (isinstance(user, User) and
-                        self.teachers.filter(pk=user.pk).exists()))
+                        roles.memoized('teacher', (self.pk, user.pk),
+                                       lambda: self.teachers.filter(pk=user.pk).exists())))
                 )
 
 
+def enrollment_cache_key(user_pk, base_url_slug, url_slug):
+    return f"enrolled:{user_pk}:{base_url_slug}/{url_slug}"
+
+
 class CourseManager(models.Manager):
     def get_by_natural_key(self, base_course_code, code):
         return self.get(base_course=BaseCourse.objects.get(code=base_course_code), code=code)
 
+    def get_cached(self, base_url_slug, url_slug):
+        """ The course with its base course from the shared cache. Raises Course.DoesNotExist """
+        course = get_or_set('course', f"{base_url_slug}/{url_slug}",
+                            lambda: self.select_related('base_course')
+                                        .filter(base_course__url_slug=base_url_slug, url_slug=url_slug)
+                                        .first())
+        if course is None:
+            raise self.model.DoesNotExist(f"No course {base_url_slug}/{url_slug}")
+        return course
+
+    def enroll_by_slugs(self, user, base_url_slug, url_slug):
+        """
+        Enrolls user to the course unless the enrollment has been confirmed during the last
+        ENROLLMENT_CACHE_SECONDS. Repeated LTI launches of the same student skip the queries.
+        """
+        key = enrollment_cache_key(user.pk, base_url_slug, url_slug)
+        if cache.get(key):
+            return
+        course = self.get(base_course__url_slug=base_url_slug, url_slug=url_slug)
+        if course.is_enrolled(user):
+            cache.set(key, True, settings.ENROLLMENT_CACHE_SECONDS)
+        else:
+            course.enroll(user)
+            # a rolled back enrollment must not be remembered
+            transaction.on_commit(lambda: cache.set(key, True, settings.ENROLLMENT_CACHE_SECONDS))
+
+    def forget_enrollments(self, course_pk, user_pks):
+        """ Removes the cached enrollments of the users, called when their enrollments are removed """
+        slugs = self.filter(pk=course_pk).values_list('base_course__url_slug', 'url_slug').first()
+        if slugs is None:
+            return
+        keys = [enrollment_cache_key(user_pk, *slugs) for user_pk in user_pks]
+        cache.delete_many(keys)
+        # a launch running meanwhile could still see the enrollment before the removal is committed
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
 
 class Course(TimeStampedModel):
     """ This is the actual user-facing course which describes an implementation.
@@ -98,7 +144,8 @@ class Course(TimeStampedModel):
                 user.is_authenticated and
                 (
                     (isinstance(user, User) and
-                        self.students.filter(pk=user.pk).exists()))
+                        roles.memoized('enrolled', (self.pk, user.pk),
+                                       lambda: self.students.filter(pk=user.pk).exists())))
                 )
 
     def can_enroll(self, user):
@@ -111,11 +158,38 @@ class Course(TimeStampedModel):
         if not self.is_enrolled(user):
             new_enrollment = Enrollment(student=user, course=self)
             new_enrollment.save()
+            roles.remember('enrolled', (self.pk, user.pk), True)
 
     def find_studentgroup_by_user(self, user):
         if user.is_anonymous:
             return None
-        return self.student_groups.filter(student_usernames__contains=[user.email]).first()
+        return roles.memoized('group', (self.pk, user.email),
+                              lambda: self.cached_student_groups().get(user.email))
+
+    def cached_student_groups(self):
+        """ {email: StudentGroup} of the course from the shared cache """
+        def group_map():
+            groups = {}
+            for group in self.student_groups.order_by('pk'):
+                for email in group.student_usernames:
+                    groups.setdefault(email, group)
+            return groups
+        return get_or_set('groups', self.pk, group_map)
+
+    def find_studentgroups_by_users(self, users):
+        """ {user pk: StudentGroup or None} for many users with one query """
+        users = [user for user in users if not user.is_anonymous]
+        emails = [user.email for user in users]
+        # the first group by pk, like cached_student_groups
+        group_of_email = {}
+        for group in self.student_groups.filter(student_usernames__overlap=emails).order_by('pk'):
+            for email in group.student_usernames:
+                group_of_email.setdefault(email, group)
+        groups = {}
+        for user in users:
+            groups[user.pk] = group_of_email.get(user.email)
+            roles.remember('group', (self.pk, user.email), groups[user.pk])
+        return groups
 
 
 class Enrollment(TimeStampedModel):
@@ -0,0 +1,67 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import roles
+from prplatform.core.cache import invalidate
+from .models import BaseCourse, Course, Enrollment
+from prplatform.users.models import StudentGroup
+
+
+@receiver(m2m_changed, sender=BaseCourse.teachers.through, dispatch_uid='teachers_changed_roles')
+def teachers_changed_roles(sender, **kwargs):
+    roles.forget('teacher')
+
+
+@receiver(post_save, sender=Enrollment, dispatch_uid='enrollment_saved_roles')
+@receiver(post_delete, sender=Enrollment, dispatch_uid='enrollment_deleted_roles')
+def enrollment_changed_roles(sender, **kwargs):
+    roles.forget('enrolled')
+    # the counts of CourseStatus depend on the enrollment
+    roles.forget('status')
+
+
+@receiver(post_delete, sender=Enrollment, dispatch_uid='enrollment_deleted_cache')
+def enrollment_deleted_cache(sender, instance, **kwargs):
+    Course.objects.forget_enrollments(instance.course_id, [instance.student_id])
+
+
+@receiver(m2m_changed, sender=Course.students.through, dispatch_uid='course_students_changed_cache')
+def course_students_changed_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    # remove() and clear() of the through model don't send post_delete
+    if action not in ('post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is a User, pk_set has Course pks
+        course_pks = pk_set if action == 'post_remove' else instance.enrollments.values_list('course', flat=True)
+        for course_pk in list(course_pks):
+            Course.objects.forget_enrollments(course_pk, [instance.pk])
+    else:
+        user_pks = pk_set if action == 'post_remove' else instance.students.values_list('pk', flat=True)
+        Course.objects.forget_enrollments(instance.pk, list(user_pks))
+
+
+@receiver(post_save, sender=StudentGroup, dispatch_uid='studentgroup_saved_roles')
+@receiver(post_delete, sender=StudentGroup, dispatch_uid='studentgroup_deleted_roles')
+def studentgroup_changed_roles(sender, **kwargs):
+    roles.forget('group')
+    # and on the group
+    roles.forget('status')
+
+
+@receiver(pre_save, sender=Course, dispatch_uid='course_saving_cache')
+@receiver(post_save, sender=Course, dispatch_uid='course_saved_cache')
+@receiver(pre_delete, sender=Course, dispatch_uid='course_deleting_cache')
+@receiver(pre_save, sender=BaseCourse, dispatch_uid='basecourse_saving_cache')
+@receiver(post_save, sender=BaseCourse, dispatch_uid='basecourse_saved_cache')
+@receiver(pre_delete, sender=BaseCourse, dispatch_uid='basecourse_deleting_cache')
+def course_changed_cache(sender, instance, **kwargs):
+    # the courses are cached by their slugs: the old ones are read before saving, the new ones after
+    courses = Course.objects.filter(**{'pk' if sender is Course else 'base_course': instance.pk})
+    invalidate('course', *[f"{base_url_slug}/{url_slug}"
+                           for base_url_slug, url_slug in courses.values_list('base_course__url_slug', 'url_slug')])
+
+
+@receiver(post_save, sender=StudentGroup, dispatch_uid='studentgroup_saved_cache')
+@receiver(post_delete, sender=StudentGroup, dispatch_uid='studentgroup_deleted_cache')
+def studentgroup_changed_cache(sender, instance, **kwargs):
+    invalidate('groups', instance.course_id)
@@ -0,0 +1,84 @@
+"""
+Request-scoped memoization of course roles.
+
+BaseCourse.is_teacher, Course.is_enrolled and Course.find_studentgroup_by_user are
+called by the view mixins, the exercise models and the template filters over and over
+during a single request. Inside role_scope() the answer of each lookup is stored and
+later calls with the same course and user reuse it. Outside of a scope every call
+hits the database like before.
+
+RoleScopeMiddleware opens a scope for every request, so the memoized values never
+outlive the request.
+"""
+import threading
+from contextlib import contextmanager
+
+_state = threading.local()
+
+
+class RoleResolver:
+    """ Memoized role lookups, {role: {key: value}} """
+
+    def __init__(self):
+        self._roles = {}
+
+    def get(self, role, key, lookup):
+        values = self._roles.setdefault(role, {})
+        if key not in values:
+            values[key] = lookup()
+        return values[key]
+
+    def set(self, role, key, value):
+        self._roles.setdefault(role, {})[key] = value
+
+    def forget(self, role):
+        self._roles.pop(role, None)
+
+
+def current_resolver():
+    return getattr(_state, 'resolver', None)
+
+
+@contextmanager
+def role_scope():
+    """ Memoizes role lookups until the block exits. A nested scope shares the outermost resolver. """
+    if current_resolver() is not None:
+        yield current_resolver()
+        return
+
+    _state.resolver = RoleResolver()
+    try:
+        yield _state.resolver
+    finally:
+        _state.resolver = None
+
+
+def memoized(role, key, lookup):
+    """ The value of lookup() memoized under (role, key) in the current scope """
+    resolver = current_resolver()
+    if resolver is None:
+        return lookup()
+    return resolver.get(role, key, lookup)
+
+
+def remember(role, key, value):
+    resolver = current_resolver()
+    if resolver is not None:
+        resolver.set(role, key, value)
+
+
+def forget(role):
+    resolver = current_resolver()
+    if resolver is not None:
+        resolver.forget(role)
+
+
+class RoleScopeMiddleware:
+    """ Opens a role_scope for each request, template rendering included """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with role_scope():
+            return self.get_response(request)
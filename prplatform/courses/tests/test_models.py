@@ -33,3 +33,22 @@ class TestCourse(TestCase):
         self.assertEqual(course.find_studentgroup_by_user(s1), None)
         self.assertEqual(course.find_studentgroup_by_user(s2), None)
         self.assertEqual(course.find_studentgroup_by_user(AnonymousUser()), None)
+
+    def test_find_studentgroups_by_users(self):
+        course = Course.objects.get(pk=1)
+        s1, s2, s3 = [User.objects.get(username=f"student{i}") for i in range(1, 4)]
+        g1 = StudentGroup.objects.create(course=course, name="g1", student_usernames=[s1.email, s2.email])
+
+        with self.assertNumQueries(1):
+            groups = course.find_studentgroups_by_users([s1, s2, s3, AnonymousUser()])
+
+        self.assertEqual(groups, {s1.pk: g1, s2.pk: g1, s3.pk: None})
+
+    def test_user_in_many_groups_gets_the_first_one(self):
+        course = Course.objects.get(pk=1)
+        s1 = User.objects.get(username="student1")
+        g1 = StudentGroup.objects.create(course=course, name="g1", student_usernames=[s1.email])
+        StudentGroup.objects.create(course=course, name="g2", student_usernames=[s1.email])
+
+        self.assertEqual(course.find_studentgroups_by_users([s1]), {s1.pk: g1})
+        self.assertEqual(course.find_studentgroup_by_user(s1), g1)
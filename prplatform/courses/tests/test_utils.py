@@ -0,0 +1,142 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from prplatform.courses.utils import create_stats, stats_csv_rows
+from prplatform.exercises.models import ReviewExercise, Question
+from prplatform.submissions.models import OriginalSubmission, ReviewSubmission, Answer
+from prplatform.submissions.stats_models import ReviewStatsSnapshot
+from prplatform.users.models import User
+
+
+class CreateStatsTest(TestCase):
+    fixtures = ["courses.yaml"]
+
+    def setUp(self):
+        self.re = ReviewExercise.objects.get(name='T1 TEXT REVIEW')
+        self.se = self.re.reviewable_exercise
+        self.course = self.re.course
+        self.text_question = Question.objects.get(pk=1)
+        self.numeric_question = Question.objects.get(pk=2)
+        self.students = list(User.objects.filter(username__startswith='student').order_by('username'))
+
+    def _submit_and_review(self, students):
+        """ Everyone submits and reviews the next one's submission twice with scores 1 and 3 """
+        osubs = [OriginalSubmission.objects.create(course=self.course, exercise=self.se,
+                                                   submitter_user=student, text="jadajada")
+                 for student in students]
+        for index, student in enumerate(students):
+            reviewed = osubs[(index + 1) % len(osubs)]
+            for value in ["1", "3"]:
+                review = ReviewSubmission.objects.create(course=self.course, exercise=self.re,
+                                                         submitter_user=student, reviewed_submission=reviewed)
+                Answer.objects.create(submission=review, question=self.numeric_question, value_choice=value)
+                Answer.objects.create(submission=review, question=self.text_question, value_text=value)
+
+    def _stats(self):
+        ctx = {'re': self.re,
+               'orig_subs': self.se.last_submission_by_submitters()
+                                   .select_related('submitter_user', 'submitter_group',
+                                                   'course__base_course', 'exercise')}
+        with CaptureQueriesContext(connection) as queries:
+            stats, headers = create_stats(ctx, include_textual_answers=True, pad=True)
+        return stats, headers, len(queries)
+
+    def test_query_count_does_not_grow_with_submitters(self):
+
+        self._submit_and_review(self.students[:2])
+        stats, headers, few_queries = self._stats()
+        self.assertEqual(len(stats), 2)
+
+        ReviewSubmission.objects.all().delete()
+        OriginalSubmission.objects.all().delete()
+        # rebuilt from scratch like the first time
+        ReviewStatsSnapshot.objects.all().delete()
+
+        self._submit_and_review(self.students)
+        stats, headers, many_queries = self._stats()
+        self.assertEqual(len(stats), len(self.students))
+        self.assertEqual(few_queries, many_queries)
+
+        for row in stats.values():
+            # only the last of the two reviews counts
+            self.assertEqual(len(row['reviews_for']), 1)
+            self.assertEqual(len(row['reviews_by']), 1)
+            self.assertEqual(row['numerical_avgs'], [3])
+            self.assertEqual(len(row['text_answer_lists']), 1)
+            self.assertTrue(row['text_answer_lists'][0][0].endswith(": 3"))
+
+        self.assertIn(f"Q: {self.numeric_question.question_text}", headers)
+        self.assertIn("A1: 1", headers)
+
+    def test_stats_csv_rows_match_create_stats(self):
+
+        self._submit_and_review(self.students)
+        stats, headers, _ = self._stats()
+
+        ctx = {'re': self.re,
+               'orig_subs': self.se.last_submission_by_submitters()
+                                   .select_related('submitter_user', 'submitter_group',
+                                                   'course__base_course', 'exercise')}
+        rows = list(stats_csv_rows(ctx, chunk_size=4))
+
+        self.assertEqual(rows[0], headers)
+        self.assertEqual(len(rows) - 1, len(stats))
+        rows_by_submitter = {str(row[1]): row for row in rows[1:]}
+        for row in stats.values():
+            csv_row = rows_by_submitter[str(row['orig_sub'].submitter)]
+            self.assertEqual(csv_row[2], "|".join(review['name'] for review in row['reviews_by']))
+            self.assertEqual(csv_row[4:], [round(avg, 2) for avg in row['numerical_avgs']] +
+                                          [a for alist in row['text_answer_lists'] for a in alist])
+
+    def test_snapshot_updates_only_affected_rows(self):
+
+        self._submit_and_review(self.students[:3])
+        self._stats()
+
+        snapshot = ReviewStatsSnapshot.objects.get(review_exercise=self.re)
+        self.assertFalse(snapshot.rows.filter(dirty=True).exists())
+
+        # students[0] reviews students[2] who was reviewed by students[1] only
+        review = ReviewSubmission.objects.create(course=self.course, exercise=self.re,
+                                                 submitter_user=self.students[0],
+                                                 reviewed_submission=OriginalSubmission.objects.get(
+                                                     submitter_user=self.students[2]))
+        Answer.objects.create(submission=review, question=self.numeric_question, value_choice="1")
+
+        dirty = snapshot.rows.filter(dirty=True).values_list('submitter_key', flat=True)
+        self.assertEqual(set(dirty), {self.students[0].pk, self.students[2].pk})
+
+        stats, headers, _ = self._stats()
+        self.assertFalse(snapshot.rows.filter(dirty=True).exists())
+
+        rows = {row['orig_sub'].submitter_user: row for row in stats.values()}
+        self.assertEqual(len(rows[self.students[0]]['reviews_by']), 2)
+        self.assertEqual(rows[self.students[2]]['numerical_avgs'], [2])
+        self.assertEqual(rows[self.students[1]]['numerical_avgs'], [3])
+
+    def test_answers_of_a_new_review_dont_mark_rows_again(self):
+
+        self._submit_and_review(self.students[:2])
+        self._stats()
+
+        review = ReviewSubmission.objects.create(course=self.course, exercise=self.re,
+                                                 submitter_user=self.students[0],
+                                                 reviewed_submission=OriginalSubmission.objects.get(
+                                                     submitter_user=self.students[1]))
+        with CaptureQueriesContext(connection) as queries:
+            Answer.objects.create(submission=review, question=self.numeric_question, value_choice="1")
+        self.assertFalse([q for q in queries if 'reviewstats' in q['sql']])
+
+        stats, headers, _ = self._stats()
+        rows = {row['orig_sub'].submitter_user: row for row in stats.values()}
+        self.assertEqual(rows[self.students[1]]['numerical_avgs'], [1])
+
+    def test_changed_question_rebuilds_snapshot(self):
+
+        self._submit_and_review(self.students[:2])
+        self._stats()
+
+        self.numeric_question.choices = []
+        self.numeric_question.save()
+        self.assertFalse(ReviewStatsSnapshot.objects.filter(review_exercise=self.re).exists())
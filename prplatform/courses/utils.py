@@ -1,9 +1,17 @@
 from django.contrib import messages
+from django.db.models import Count
+from django.urls import reverse
+from itertools import islice
+import logging
 import re
 
 from prplatform.users.models import StudentGroup
 from prplatform.submissions.models import Answer
 from prplatform.exercises.models import ReviewExercise
+from prplatform.submissions.reviewlock_models import ReviewLock
+from prplatform.submissions.stats_models import ReviewStatsSnapshot
+
+logger = logging.getLogger(__name__)
 
 
 def handle_group_file(request, ctx, form):
@@ -125,51 +133,174 @@ def handle_group_file(request, ctx, form):
         messages.error(request, "Group file was not valid. Cannot do anything.")
 
 
+def handle_dealing_file(request, ctx, form):
+    cd = form.cleaned_data
+    exercise = cd['exercise']
+    pinned_pairs = []
+
+    if cd['dealing_file']:
+        try:
+            contents = cd['dealing_file'].read().decode('utf-8')
+        except Exception:
+            logger.exception(f'Could not read the dealing file of "{exercise}"')
+            messages.error(request,
+                           "The uploaded file could not be parsed. Make sure it's either ASCII or UTF-8 encoded.")
+            return
+
+        for row in contents.strip().split("\n"):
+            if not row.strip():
+                continue
+            parts = [part.strip() for part in row.strip().split(",")]
+            if len(parts) != 2 or not all(parts):
+                messages.error(request, f'Row "{row.strip()}" should be of form reviewer,reviewed. Cannot continue.')
+                return
+            pinned_pairs.append(tuple(parts))
+
+    result = ReviewLock.objects.deal(exercise, pinned_pairs)
+
+    for error in result['errors']:
+        messages.warning(request, f'Skipped a pinned pair: {error}')
+    if result['unassigned']:
+        names = ", ".join(str(reviewer) for reviewer in result['unassigned'])
+        messages.warning(request, f'Not enough submissions to deal all reviews to: {names}')
+    messages.success(request, f'Dealt {result["created"]} reviews in "{exercise}".')
+
+
+class _ReviewStats:
+    """
+    Statistics of every submitter of a ReviewExercise, read from its ReviewStatsSnapshot.
+    Submitters are identified with submitter_key: group pks if the exercise uses groups,
+    user pks otherwise.
+    """
+
+    def __init__(self, re):
+        self.re = re
+        snapshot = ReviewStatsSnapshot.objects.fresh_for(re)
+        self.rows = {row.submitter_key: row for row in snapshot.rows.all()}
+        self.reviewer_names = {pk: name for row in self.rows.values() for pk, name in row.reviews_for}
+        self.last_review_pks = list(self.reviewer_names)
+        self.group_of_user = {}
+        self.reviewed_key = 'submission__reviewed_submission__submitter_group' if re.use_groups \
+            else 'submission__reviewed_submission__submitter_user'
+
+    def load_groups(self, orig_subs):
+        """ Resolves the groups of the submitters with one query, needed by submitter_key """
+        if self.re.use_groups:
+            self.group_of_user = self.re.course.find_studentgroups_by_users(
+                [orig_sub.submitter_user for orig_sub in orig_subs])
+
+    def submitter_key(self, orig_sub):
+        if self.re.use_groups:
+            group = self.group_of_user.get(orig_sub.submitter_user_id)
+            return group.pk if group else None
+        return orig_sub.submitter_user_id
+
+    def reviews_by(self, key):
+        """ [(review pk, reviewed submitter name), ...] """
+        row = self.rows.get(key)
+        return row.reviews_by if row else []
+
+    def reviews_for(self, key):
+        """ [(review pk, reviewer name), ...] """
+        row = self.rows.get(key)
+        return row.reviews_for if row else []
+
+    def done(self, key):
+        if self.re.type != ReviewExercise.GROUP:
+            return 'n/a'
+        row = self.rows.get(key)
+        return bool(row and row.done)
+
+    def numerical_avg(self, question, key):
+        row = self.rows.get(key)
+        return row.numerical_avgs.get(str(question.pk)) if row else None
+
+    def review_links(self, reviews):
+        course = self.re.course
+        return [{'name': name,
+                 'url': reverse('courses:submissions:review-detail', kwargs={
+                     'base_url_slug': course.base_course.url_slug,
+                     'url_slug': course.url_slug,
+                     'pk': self.re.pk,
+                     'sub_pk': pk})}
+                for pk, name in reviews]
+
+    def max_text_answer_counts(self, questions):
+        """ {question pk: the largest number of answers any submitter has received} """
+        counts = Answer.objects.filter(question__in=questions,
+                                       submission__pk__in=self.last_review_pks) \
+                               .values_list('question', self.reviewed_key) \
+                               .order_by() \
+                               .annotate(count=Count('pk'))
+        max_counts = {question.pk: 0 for question in questions}
+        for question, submitter, count in counts:
+            max_counts[question] = max(max_counts[question], count)
+        return max_counts
+
+    def text_answers(self, questions, review_pks):
+        """ {(question pk, submitter key): ["reviewer: answer", ...]} of the given reviews """
+        if not questions:
+            return {}
+        answers = Answer.objects.filter(question__in=questions,
+                                        submission__pk__in=review_pks) \
+                                .order_by(
+                                        'submission__submitter_group',
+                                        'submission__submitter_user'
+                                        ) \
+                                .values_list('question', 'submission', self.reviewed_key, 'value_text')
+        answer_strings = {}
+        for question, submission, submitter, value_text in answers:
+            answer_strings.setdefault((question, submitter), []) \
+                          .append(f"{self.reviewer_names[submission]}: {value_text}")
+        return answer_strings
+
+
 def create_stats(ctx, include_textual_answers=False, pad=False):
+    """
+    Reads the review data from the ReviewStatsSnapshot of the exercise. Everything is
+    fetched with a fixed number of queries regardless of the number of submitters.
+    ctx['orig_subs'] should select_related the submitters and the url parts.
+    """
     re = ctx['re']
     d = {}
 
     HEADERS = []
 
-    for index, orig_sub in enumerate(ctx['orig_subs']):
+    stats = _ReviewStats(re)
+    orig_subs = list(ctx['orig_subs'])
+    stats.load_groups(orig_subs)
+
+    for index, orig_sub in enumerate(orig_subs):
         key = orig_sub.pk
+        submitter = stats.submitter_key(orig_sub)
         d[key] = {'orig_sub': orig_sub,
+                  'submitter_key': submitter,
                   'numerical_avgs': [],
                   'reviews_for': [],
                   'reviews_by': [],
-                  'done': 'n/a',
+                  'done': stats.done(submitter),
                   'text_answer_lists': []
                   }
-        d[key]['reviews_by'] = re.last_reviews_by(orig_sub.submitter_user)
-        d[key]['reviews_for'] = re.last_reviews_for(orig_sub.submitter_user, include_hidden=True)
-        d[key]['reviews_for_pks'] = d[key]['reviews_for'].values_list('pk', flat=True)
-
-        if re.type == ReviewExercise.GROUP:
-            group = re.course.find_studentgroup_by_user(orig_sub.submitter_user)
-            d[key]['done'] = len(group.student_usernames) == d[key]['reviews_by'].count() if group else False
+        d[key]['reviews_by'] = stats.review_links(stats.reviews_by(submitter))
+        d[key]['reviews_for'] = stats.review_links(stats.reviews_for(submitter))
 
     HEADERS.append('Done')
     HEADERS.append('Submitter')
     HEADERS.append('Reviews by submitter')
     HEADERS.append('Reviews for submitter')
 
-    numeric_questions = re.questions.exclude(choices__len=0)
-
-    # TODO: calculate on the DBMS
-    if numeric_questions:
-        for nq in numeric_questions:
+    numeric_questions = re.questionnaire().numeric_questions
 
-            HEADERS.append(f"Q: {nq.question_text}")
+    for nq in numeric_questions:
 
-            for subd in d.values():
-
-                answer_values = Answer.objects.filter(question=nq,
-                                                      submission__pk__in=subd['reviews_for_pks']) \
-                                              .values_list('value_choice', flat=True)
+        HEADERS.append(f"Q: {nq.question_text}")
 
-                if answer_values:
-                    avg = sum([int(a) for a in answer_values])/len(answer_values)
-                    subd['numerical_avgs'].append(avg)
+        for subd in d.values():
+            avg = stats.numerical_avg(nq, subd['submitter_key'])
+            if avg is not None:
+                subd['numerical_avgs'].append(avg)
+            elif pad:
+                subd['numerical_avgs'].append(None)
 
     # collect whatever textual questions available
     # collect answers to them and put them into lists
@@ -178,35 +309,20 @@ def create_stats(ctx, include_textual_answers=False, pad=False):
 
     max_textual_answer_counts = []
     if include_textual_answers:
-        textual_questions = re.questions.filter(choices__len=0)
-        if textual_questions:
-            for (index, tq) in enumerate(textual_questions):
-                for subd in d.values():
-
-                    textual_answers = Answer.objects.filter(question=tq,
-                                                            submission__pk__in=subd['reviews_for_pks']) \
-                                                    .order_by(
-                                                            'submission__submitter_group',
-                                                            'submission__submitter_user'
-                                                            ) \
-                                                    .select_related('submission')
-                    if textual_answers:
-                        answer_strings = [f"{a.submission.submitter}: {a.value_text}" for a in textual_answers]
-                        subd['text_answer_lists'].append(answer_strings)
-
-                tkey = 'text_answer_lists'
-                max_answer_count_for_tq = [
-                        len(x[tkey][-1]) for x in d.values() if len(x[tkey]) > 0
-                    ]
-
-                if max_answer_count_for_tq:
-                    max_answer_count_for_tq = max(max_answer_count_for_tq)
-                else:
-                    max_answer_count_for_tq = 0
-
-                max_textual_answer_counts.append(max_answer_count_for_tq)
-
-                HEADERS += [f"A{index + 1}: {num}" for num in range(1, max_answer_count_for_tq + 1)]
+        textual_questions = re.questionnaire().textual_questions
+        answer_strings = stats.text_answers(textual_questions, stats.last_review_pks)
+
+        for (index, tq) in enumerate(textual_questions):
+            max_answer_count_for_tq = 0
+            for subd in d.values():
+                answers = answer_strings.get((tq.pk, subd['submitter_key']), [])
+                if answers or pad:
+                    subd['text_answer_lists'].append(list(answers))
+                max_answer_count_for_tq = max(max_answer_count_for_tq, len(answers))
+
+            max_textual_answer_counts.append(max_answer_count_for_tq)
+
+            HEADERS += [f"A{index + 1}: {num}" for num in range(1, max_answer_count_for_tq + 1)]
     if d.values():
         max_review_range = range(1, max([len(x['reviews_for']) for x in d.values()]) + 1)
     else:
@@ -218,18 +334,61 @@ def create_stats(ctx, include_textual_answers=False, pad=False):
 
         for subd in d.values():
 
-            difference = len(numeric_questions) - len(subd['numerical_avgs'])
-            if difference != 0:
-                subd['numerical_avgs'] += difference * [None]
-
             for (index, count) in enumerate(max_textual_answer_counts):
 
-                if len(subd['text_answer_lists']) < len(max_textual_answer_counts):
-                    subd['text_answer_lists'].append(count * [None])
-                    continue
-
                 difference = count - len(subd['text_answer_lists'][index])
                 if difference != 0:
                     subd['text_answer_lists'][index] += difference * [None]
 
     return d, HEADERS
+
+
+STATS_CSV_CHUNK_SIZE = 200
+
+
+def stats_csv_rows(ctx, chunk_size=STATS_CSV_CHUNK_SIZE):
+    """
+    Yields the rows of the statistics CSV one at a time, the header row first.
+    Everything but the textual answers comes from the ReviewStatsSnapshot. Only the
+    textual answers of chunk_size submitters are in memory at once and the submissions
+    are read with a server-side cursor.
+    """
+    re = ctx['re']
+    stats = _ReviewStats(re)
+
+    questionnaire = re.questionnaire()
+    numeric_questions = questionnaire.numeric_questions
+    textual_questions = questionnaire.textual_questions
+    # the header needs the answer counts before any answer has been read
+    max_counts = stats.max_text_answer_counts(textual_questions)
+
+    headers = ['Done', 'Submitter', 'Reviews by submitter', 'Reviews for submitter']
+    headers += [f"Q: {nq.question_text}" for nq in numeric_questions]
+    for (index, tq) in enumerate(textual_questions):
+        headers += [f"A{index + 1}: {num}" for num in range(1, max_counts[tq.pk] + 1)]
+    yield headers
+
+    orig_subs = ctx['orig_subs'].iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(orig_subs, chunk_size))
+        if not chunk:
+            break
+
+        stats.load_groups(chunk)
+        keys = [stats.submitter_key(orig_sub) for orig_sub in chunk]
+        review_pks = [pk for key in keys for pk, name in stats.reviews_for(key)]
+        answer_strings = stats.text_answers(textual_questions, review_pks)
+
+        for orig_sub, key in zip(chunk, keys):
+            row = []
+            row += [stats.done(key)]
+            row += [orig_sub.submitter]
+            row += ["|".join([name for pk, name in stats.reviews_by(key)])]
+            row += ["|".join([name for pk, name in stats.reviews_for(key)])]
+            for nq in numeric_questions:
+                avg = stats.numerical_avg(nq, key)
+                row += [round(avg, 2) if avg is not None else ""]
+            for tq in textual_questions:
+                answers = answer_strings.get((tq.pk, key), [])
+                row += answers + (max_counts[tq.pk] - len(answers)) * [None]
+            yield row
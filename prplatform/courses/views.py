@@ -1,4 +1,4 @@
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django import forms
 from django.db import transaction
 from django.core.exceptions import PermissionDenied
@@ -12,6 +12,8 @@ from django.core.validators import FileExtensionValidator
 
 from .models import BaseCourse, Course
 from prplatform.users.models import StudentGroup
+from prplatform.exercises.models import ReviewExercise
+from prplatform.submissions.reviewlock_models import ReviewLock
 from . import utils
 
 
@@ -24,12 +26,18 @@ class GroupMixin(object):
         return ctx
 
 
+def get_cached_course_or_404(base_url_slug, url_slug):
+    try:
+        return Course.objects.get_cached(base_url_slug, url_slug)
+    except Course.DoesNotExist:
+        raise Http404('No course matches the given query.')
+
+
 class CourseContextMixin(object):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx['course'] = get_object_or_404(Course, url_slug=self.kwargs['url_slug'],
-                                          base_course__url_slug=self.kwargs['base_url_slug'])
+        ctx['course'] = get_cached_course_or_404(self.kwargs['base_url_slug'], self.kwargs['url_slug'])
         ctx['teacher'] = ctx['course'].is_teacher(self.request.user)
         ctx['enrolled'] = ctx['course'].is_enrolled(self.request.user)
         ctx['reviewable'] = None
@@ -247,24 +255,46 @@ class CourseGroupView(CourseContextMixin, IsTeacherMixin, TemplateView):
 
 
 class ReviewDealUploadForm(forms.Form):
-    dealing_file = forms.FileField(label='CSV formatted review dealing file')
+    exercise = forms.ModelChoiceField(queryset=ReviewExercise.objects.none(), label='Peer-review exercise')
+    dealing_file = forms.FileField(label='CSV formatted file of reviewer,reviewed pairs to deal first (optional)',
+                                   required=False,
+                                   validators=[FileExtensionValidator(allowed_extensions=['csv'])])
+
+    def __init__(self, *args, **kwargs):
+        course = kwargs.pop('course')
+        super().__init__(*args, **kwargs)
+        self.fields['exercise'].queryset = ReviewExercise.objects.filter(course=course, type=ReviewExercise.RANDOM)
 
 
 class CourseReviewDealingView(CourseContextMixin, IsTeacherMixin, TemplateView):
     model = Course
     template_name = "courses/dealings.html"
 
+    def _reviewlocks(self, course):
+        return ReviewLock.objects.filter(review_exercise__course=course) \
+                                 .select_related('review_exercise', 'user', 'group',
+                                                 'original_submission__submitter_user',
+                                                 'original_submission__submitter_group') \
+                                 .order_by('review_exercise', 'created')
+
     def get(self, args, **kwargs):
         ctx = self.get_context_data(**kwargs)
-        ctx['form'] = ReviewDealUploadForm()
+        ctx['form'] = ReviewDealUploadForm(course=ctx['course'])
+        ctx['reviewlocks'] = self._reviewlocks(ctx['course'])
         return self.render_to_response(ctx)
 
     def post(self, args, **kwargs):
-        print("NO OP")
-        # ctx = self.get_context_data(**kwargs)
-        # group_file = self.request.FILES['group_file']
-        # contents = group_file.read().decode('utf-8')
-        messages.warning(self.request, "Not implemented yet!")
+        ctx = self.get_context_data(**kwargs)
+
+        form = ReviewDealUploadForm(self.request.POST, self.request.FILES, course=ctx['course'])
+
+        if form.is_valid():
+            utils.handle_dealing_file(self.request, ctx, form)
+        else:
+            ctx['form'] = form
+            ctx['reviewlocks'] = self._reviewlocks(ctx['course'])
+            return self.render_to_response(ctx)
+
         return HttpResponseRedirect(reverse("courses:dealings", kwargs={'url_slug': self.kwargs['url_slug'],
                                             'base_url_slug': self.kwargs['base_url_slug']}))
 
@@ -1,14 +1,23 @@
+from django.db import transaction
 from django.forms import Form, ModelForm, Textarea, inlineformset_factory, modelformset_factory, ValidationError, ModelChoiceField
 from django.views.generic import TemplateView
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
 
 import csv
 
-from .utils import create_stats
+from .utils import create_stats, stats_csv_rows
 from .views import CourseContextMixin, IsTeacherMixin
 from prplatform.exercises.models import ReviewExercise
 
 
+class Echo:
+    """ A file-like object for csv.writer which returns the written row instead of storing it """
+
+    def write(self, value):
+        return value
+
+
 class StatsForm(Form):
     choice = ModelChoiceField(queryset=None, label='')
 
@@ -19,6 +28,9 @@ class StatsForm(Form):
         self.fields['choice'].queryset = res
 
 
+# the view only reads, except for refreshing the ReviewStatsSnapshot which
+# locks the snapshot in its own short transaction, see fresh_for
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class CourseStatsView(CourseContextMixin, IsTeacherMixin, TemplateView):
     template_name = "courses/stats.html"
 
@@ -37,6 +49,7 @@ class CourseStatsView(CourseContextMixin, IsTeacherMixin, TemplateView):
 
         ctx['orig_subs'] = re.reviewable_exercise \
                              .last_submission_by_submitters() \
+                             .select_related('submitter_user', 'submitter_group', 'course__base_course', 'exercise') \
                              .order_by('submitter_group', 'submitter_user')
 
         if not self.request.GET.get('format'):
@@ -50,28 +63,9 @@ class CourseStatsView(CourseContextMixin, IsTeacherMixin, TemplateView):
 
         else:
 
-            stats, headers = create_stats(ctx, include_textual_answers=True, pad=True)
-
-            response = HttpResponse(content_type='text/csv')
+            writer = csv.writer(Echo(), delimiter=";")
+            response = StreamingHttpResponse((writer.writerow(row) for row in stats_csv_rows(ctx)),
+                                             content_type='text/csv')
             response['Content-Disposition'] = 'attachment; filename="statistics.csv"'
 
-            writer = csv.writer(response, delimiter=";")
-            writer.writerow(headers)
-            for submitter_pk in stats:
-
-                osr = stats[submitter_pk]
-
-                row = []
-                row += [osr['done']]
-                row += [osr['orig_sub'].submitter]
-                row += ["|".join([str(x.reviewed_submission.submitter) for x in osr['reviews_by'] if x])]
-                row += ["|".join([str(x.submitter) for x in osr['reviews_for'] if x])]
-                row += [round(avg, 2) if avg is not None else "" for avg in osr['numerical_avgs']]
-
-                # 'text_answer_lists' is a list of padded lists
-                # -> flatten
-                row += [a for alist in osr['text_answer_lists'] for a in alist]
-
-                writer.writerow(row)
-
             return response
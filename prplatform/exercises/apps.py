@@ -15,3 +15,5 @@ class ExercisesConfig(AppConfig):
         except ImportError:
             pass
 
+        import prplatform.exercises.receivers  # noqa F401
+
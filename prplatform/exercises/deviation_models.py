@@ -47,8 +47,20 @@ class SubmissionExerciseDeviation(Deviation):
     exercise = models.ForeignKey(SubmissionExercise, related_name='deviations',
                                  on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['exercise', 'user'], name='sdeviation_exercise_user_idx'),
+            models.Index(fields=['exercise', 'group'], name='sdeviation_exercise_group_idx'),
+        ]
+
 
 class ReviewExerciseDeviation(Deviation):
 
     exercise = models.ForeignKey(ReviewExercise, related_name='deviations',
                                  on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['exercise', 'user'], name='rdeviation_exercise_user_idx'),
+            models.Index(fields=['exercise', 'group'], name='rdeviation_exercise_group_idx'),
+        ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.3 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0050_remove_reviewexercise_model_answer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submissionexercisedeviation',
+            index=models.Index(fields=['exercise', 'user'], name='sdeviation_exercise_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submissionexercisedeviation',
+            index=models.Index(fields=['exercise', 'group'], name='sdeviation_exercise_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewexercisedeviation',
+            index=models.Index(fields=['exercise', 'user'], name='rdeviation_exercise_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewexercisedeviation',
+            index=models.Index(fields=['exercise', 'group'], name='rdeviation_exercise_group_idx'),
+        ),
+    ]
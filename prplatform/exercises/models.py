@@ -4,9 +4,13 @@ from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 
+from prplatform.core.cache import get_or_set
 from prplatform.core.models import TimeStampedModel
 from prplatform.courses.models import Course
 
+from .questionnaire import Questionnaire
+from .status import course_status
+
 
 class BaseExercise(TimeStampedModel):
     """ This base exercise includes common fields for all exercises.
@@ -31,6 +35,19 @@ class BaseExercise(TimeStampedModel):
     def base_course(self):
         return self.course.base_course
 
+    @classmethod
+    def cache_key(cls, pk):
+        return f"{cls._meta.model_name}:{pk}"
+
+    @classmethod
+    def get_cached(cls, pk):
+        """ The exercise with its course from the shared cache. Raises DoesNotExist """
+        exercise = get_or_set('exercise', cls.cache_key(pk),
+                              lambda: cls.objects.select_related('course__base_course').filter(pk=pk).first())
+        if exercise is None:
+            raise cls.DoesNotExist(f"No {cls._meta.verbose_name} {pk}")
+        return exercise
+
     def is_teacher(self, user):
         return self.base_course.is_teacher(user)
 
@@ -51,12 +68,8 @@ class BaseExercise(TimeStampedModel):
         return True
 
     def deviation_for(self, user):
-        if self.use_groups:
-            return self.deviations.filter(
-                    group=self.course.find_studentgroup_by_user(user)
-                    ).first()
-        else:
-            return self.deviations.filter(user=user).first()
+        # the deviations of every exercise of the course are loaded at once, see status.py
+        return course_status(self.course, user).deviation(self)
 
     def deadline_extension_for(self, user):
 
@@ -278,9 +291,13 @@ class ReviewExercise(BaseExercise):
 
     show_reviews_only_to_teacher = models.BooleanField(default=False)
 
+    def questionnaire(self):
+        """ The compiled questions of this exercise, see questionnaire.py """
+        return get_or_set('questionnaire', self.pk,
+                          lambda: Questionnaire(self.questions.all(), self.question_order))
+
     def question_list_in_order(self):
-        # TODO: THIS WILL THROW IF Q NOT IN self.question_order
-        return sorted(self.questions.all(), key=lambda i: self.question_order.index(i.pk))
+        return self.questionnaire().questions
 
     def reviews_available_date_in_future(self):
         if self.show_reviews_after_date and self.show_reviews_after_date > timezone.now():
@@ -314,11 +331,13 @@ class ReviewExercise(BaseExercise):
 
         return True
 
-    def last_reviews_by(self, user):
+    def last_reviews_by(self, user, group=None):
 
         all_reviews = None
         if self.use_groups:
-            all_reviews = self.submissions.filter(submitter_group=self.course.find_studentgroup_by_user(user)) \
+            if group is None:
+                group = self.course.find_studentgroup_by_user(user)
+            all_reviews = self.submissions.filter(submitter_group=group) \
                                           .order_by('reviewed_submission__submitter_group_id', '-created') \
                                           .distinct('reviewed_submission__submitter_group_id')
         else:
@@ -361,15 +380,29 @@ class ReviewExercise(BaseExercise):
                    .submissions_by_submitter(user) \
                    .filter(state=apps.get_model('submissions', 'OriginalSubmission').READY_FOR_REVIEW)
 
-    def reviewlocks_for(self, user):
+    def reviewlock_expiry_time(self):
+        """ Reviewlocks created before this are expired. None if they never expire. """
+        if self.reviewlock_expiry_hours == 0:
+            return None
+        return timezone.now() - timezone.timedelta(hours=self.reviewlock_expiry_hours)
+
+    def reviewlocks_for(self, user, group=None):
+        """ Reviewlocks of the user (or the user's group) that have not expired.
+            Expired ones are deleted by the next allocation or expire_reviewlocks.
+            group is the user's group in the course, looked up if not given. """
+        locks = self.reviewlock_set.all()
+        expiry_time = self.reviewlock_expiry_time()
+        if expiry_time:
+            locks = locks.filter(created__gte=expiry_time)
+
         if self.use_groups:
-            g = self.course.find_studentgroup_by_user(user)
+            g = group or self.course.find_studentgroup_by_user(user)
             if not g:
                 return self.reviewlock_set.none()
-            return self.reviewlock_set.filter(group=g,
-                                              review_exercise=self)
-        return self.reviewlock_set.filter(user=user,
-                                          review_exercise=self)
+            return locks.filter(group=g,
+                                review_exercise=self)
+        return locks.filter(user=user,
+                            review_exercise=self)
 
     def get_choose_type_queryset(self, user):
         # TODO: make sure max_reviews_per_submission is honored
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.urls import reverse
+from django.utils.functional import cached_property
 
 from prplatform.courses.models import Course
 from .models import ReviewExercise
@@ -30,6 +31,16 @@ class Question(models.Model):
     def __str__(self):
         return f"Q: {self.question_text}"
 
+    @cached_property
+    def choice_labels(self):
+        """ {value: label} of the choices """
+        return dict(self.choices or [])
+
+    @cached_property
+    def sorted_choices(self):
+        """ The choices in the order the forms show them """
+        return sorted(self.choices or [], key=lambda c: c[0])
+
     def get_absolute_url(self):
         return reverse('courses:exercises:question-detail', kwargs={
             'base_url_slug': self.course.base_course.url_slug,
@@ -0,0 +1,52 @@
+"""
+The questions of a ReviewExercise compiled into lookup tables.
+
+ReviewExercise.questionnaire() builds a Questionnaire once per version of the
+exercise and keeps it in the shared cache (the 'questionnaire' namespace of
+prplatform.core.cache), the receivers of the exercises app drop it when the
+exercise, its questions or their order change. Views, forms and the stats
+read the question order and the choice labels from it instead of sorting
+and scanning lists on every request.
+"""
+
+
+class Questionnaire:
+
+    def __init__(self, questions, question_order):
+        # questions missing from question_order go last instead of breaking the page
+        self.position = {pk: index for index, pk in enumerate(question_order)}
+        self.questions = sorted(questions, key=self._position_of)
+        self.by_pk = {q.pk: q for q in self.questions}
+        for q in self.questions:
+            # computed here so that they are cached with the questions
+            q.choice_labels
+            q.sorted_choices
+
+    def _position_of(self, question):
+        return self.position.get(question.pk, len(self.position))
+
+    # NULL choices count as numeric and never as textual, like the
+    # exclude(choices__len=0) and filter(choices__len=0) queries used to
+
+    @property
+    def numeric_questions(self):
+        return [q for q in self.questions if q.choices != []]
+
+    @property
+    def textual_questions(self):
+        return [q for q in self.questions if q.choices == []]
+
+    def choice_label(self, question_pk, value):
+        return self.by_pk[question_pk].choice_labels[value]
+
+    def order_answers(self, answers):
+        """
+        The answers sorted in the order of the questions. The questions of the answers
+        are taken from the questionnaire so that reading them needs no queries.
+        """
+        answers = list(answers)
+        for answer in answers:
+            question = self.by_pk.get(answer.question_id)
+            if question is not None:
+                answer.question = question
+        return sorted(answers, key=lambda a: self.position.get(a.question_id, len(self.position)))
@@ -0,0 +1,59 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .deviation_models import ReviewExerciseDeviation, SubmissionExerciseDeviation
+from .models import ReviewExercise, SubmissionExercise
+from .question_models import Question
+from prplatform.core.cache import invalidate
+from prplatform.courses import roles
+from prplatform.courses.models import BaseCourse, Course
+
+
+@receiver(post_save, sender=SubmissionExercise, dispatch_uid='submissionexercise_saved_cache')
+@receiver(post_delete, sender=SubmissionExercise, dispatch_uid='submissionexercise_deleted_cache')
+@receiver(post_save, sender=ReviewExercise, dispatch_uid='reviewexercise_saved_cache')
+@receiver(post_delete, sender=ReviewExercise, dispatch_uid='reviewexercise_deleted_cache')
+def exercise_changed_cache(sender, instance, **kwargs):
+    invalidate('exercise', sender.cache_key(instance.pk))
+    if sender is ReviewExercise:
+        # question_order may have changed
+        invalidate('questionnaire', instance.pk)
+
+
+@receiver(post_save, sender=Course, dispatch_uid='course_saved_exercise_cache')
+@receiver(post_save, sender=BaseCourse, dispatch_uid='basecourse_saved_exercise_cache')
+def course_saved_exercise_cache(sender, instance, created, **kwargs):
+    # the cached exercises include their course and base course
+    if created:
+        return
+    lookup = 'course' if sender is Course else 'course__base_course'
+    for model in (SubmissionExercise, ReviewExercise):
+        pks = model.objects.filter(**{lookup: instance}).values_list('pk', flat=True)
+        invalidate('exercise', *[model.cache_key(pk) for pk in pks])
+
+
+@receiver(m2m_changed, sender=ReviewExercise.questions.through, dispatch_uid='reviewexercise_questions_cache')
+def reviewexercise_questions_changed_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_') and action != 'pre_clear':
+        return
+    if not reverse:
+        invalidate('questionnaire', instance.pk)
+    elif action == 'pre_clear':
+        invalidate('questionnaire', *instance.exercises.values_list('pk', flat=True))
+    else:
+        invalidate('questionnaire', *(pk_set or []))
+
+
+@receiver(post_save, sender=Question, dispatch_uid='question_saved_cache')
+@receiver(pre_delete, sender=Question, dispatch_uid='question_deleting_cache')
+def question_changed_cache(sender, instance, **kwargs):
+    invalidate('questionnaire', *instance.exercises.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=SubmissionExerciseDeviation, dispatch_uid='submissiondeviation_saved_status')
+@receiver(post_delete, sender=SubmissionExerciseDeviation, dispatch_uid='submissiondeviation_deleted_status')
+@receiver(post_save, sender=ReviewExerciseDeviation, dispatch_uid='reviewdeviation_saved_status')
+@receiver(post_delete, sender=ReviewExerciseDeviation, dispatch_uid='reviewdeviation_deleted_status')
+def deviation_changed_status(sender, **kwargs):
+    # the deviations of the CourseStatus objects of the request are outdated
+    roles.forget('status')
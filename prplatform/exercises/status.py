@@ -0,0 +1,127 @@
+"""
+The standing of a user in every exercise of a course.
+
+The tabs of the exercise pages show how many submissions the user has made and
+how much feedback they have received. The template filters used to query these
+separately for every exercise they were applied to. CourseStatus fetches the
+counts of all the exercises of the course with a few grouped aggregate queries
+the first time one is needed. The deviations of the user are loaded the same
+way, all of one exercise type at once. course_status() memoizes the object in
+the role_scope of the request (see prplatform.courses.roles), so every filter,
+view and can_submit of the request shares it.
+"""
+from django.apps import apps
+from django.db.models import Count, Q
+
+from prplatform.courses import roles
+
+
+def course_status(course, user):
+    """ The CourseStatus of user in course, shared during the request """
+    return roles.memoized('status', (course.pk, user.pk), lambda: CourseStatus(course, user))
+
+
+def _owned_by(user, group, prefix=''):
+    """
+    Q of the submissions of user, or of group in the exercises that use groups, like
+    submissions_by_submitter. prefix points to the submission whose submitter is checked.
+    """
+    owned = Q(exercise__use_groups=False, **{f'{prefix}submitter_user': user})
+    if group is not None:
+        owned |= Q(exercise__use_groups=True, **{f'{prefix}submitter_group': group})
+    return owned
+
+
+class CourseStatus:
+
+    def __init__(self, course, user):
+        self.course = course
+        self.user = user
+        self._counts = None
+        self._deviations = {}
+
+    def _load(self):
+        course, user = self.course, self.user
+        counts = {'submissions': {}, 'reviews': {}, 'reviewed': {}, 'received': {}}
+        if user.is_anonymous:
+            return counts
+
+        group = course.find_studentgroup_by_user(user)
+        OriginalSubmission = apps.get_model('submissions', 'OriginalSubmission')
+        ReviewSubmission = apps.get_model('submissions', 'ReviewSubmission')
+
+        if course.is_enrolled(user):
+            counts['submissions'] = dict(OriginalSubmission.objects.filter(_owned_by(user, group), course=course)
+                                                                   .values_list('exercise')
+                                                                   .order_by()
+                                                                   .annotate(Count('pk')))
+
+        # the reviews made by the user, counted once per reviewer and per reviewed submitter
+        for exercise, use_groups, total, reviewed_users, reviewed_groups in \
+                ReviewSubmission.objects.filter(_owned_by(user, group), course=course) \
+                                        .values_list('exercise', 'exercise__use_groups') \
+                                        .order_by() \
+                                        .annotate(Count('pk'),
+                                                  Count('reviewed_submission__submitter_user', distinct=True),
+                                                  Count('reviewed_submission__submitter_group', distinct=True)):
+            if course.is_enrolled(user):
+                counts['reviews'][exercise] = total
+            counts['reviewed'][exercise] = reviewed_groups if use_groups else reviewed_users
+
+        # the reviews of the submissions of the user, the last one of each reviewer like last_reviews_for
+        for exercise, use_groups, reviewers, reviewer_groups in \
+                ReviewSubmission.objects.filter(_owned_by(user, group, prefix='reviewed_submission__'),
+                                                course=course) \
+                                        .values_list('exercise', 'exercise__use_groups') \
+                                        .order_by() \
+                                        .annotate(Count('submitter_user', distinct=True),
+                                                  Count('submitter_group', distinct=True)):
+            counts['received'][exercise] = reviewer_groups if use_groups else reviewers
+        return counts
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            self._counts = self._load()
+        return self._counts
+
+    def submission_count(self, exercise):
+        """ exercise.submissions_by_submitter(user).count() """
+        key = 'reviews' if isinstance(exercise, apps.get_model('exercises', 'ReviewExercise')) else 'submissions'
+        return self.counts[key].get(exercise.pk, 0)
+
+    def reviews_done_count(self, exercise):
+        """ exercise.last_reviews_by(user).count() """
+        return self.counts['reviewed'].get(exercise.pk, 0)
+
+    def received_feedback_count(self, exercise):
+        """ The number of peer-reviews the user is shown in the feedback tab of exercise """
+        if self.course.is_teacher(self.user):
+            return 0
+        if exercise.show_reviews_only_to_teacher or exercise.reviews_available_date_in_future():
+            return 0
+        if self.reviews_done_count(exercise) < exercise.min_submission_count:
+            return 0
+        return self.counts['received'].get(exercise.pk, 0)
+
+    def _load_deviations(self, deviation_model):
+        """ {exercise pk: the first deviation of the user or their group} of one deviation model """
+        user = self.user
+        owned = Q(exercise__use_groups=False, user=user)
+        group = self.course.find_studentgroup_by_user(user)
+        if group is not None:
+            owned |= Q(exercise__use_groups=True, group=group)
+
+        deviations = {}
+        for deviation in deviation_model.objects.filter(owned, exercise__course=self.course).order_by('pk'):
+            deviations.setdefault(deviation.exercise_id, deviation)
+        return deviations
+
+    def deviation(self, exercise):
+        """ exercise.deviation_for(user) """
+        if self.user.is_anonymous:
+            return None
+        deviation_model = exercise.deviations.model
+        if deviation_model not in self._deviations:
+            self._deviations[deviation_model] = self._load_deviations(deviation_model)
+        return self._deviations[deviation_model].get(exercise.pk)
@@ -1,24 +1,21 @@
 from django import template
 
+from prplatform.exercises import status
+
 register = template.Library()
 
 
+def course_status(course, user):
+    """ The CourseStatus of user, {% with course|course_status:user as status %} """
+    return status.course_status(course, user)
+
+
 def my_submission_count(exercise, user):
-    return exercise.submissions_by_submitter(user).count()
+    return status.course_status(exercise.course, user).submission_count(exercise)
 
 
 def my_received_feedback_count(exercise, user):
-    if exercise.course.is_teacher(user):
-        return 0
-    if exercise.reviews_available_date_in_future():
-        return 0
-    if not exercise.review_showing_requirements_ok(user):
-        return 0
-    qs = exercise.last_reviews_for(user)
-    if qs:
-        return qs.count()
-    else:
-        return 0
+    return status.course_status(exercise.course, user).received_feedback_count(exercise)
 
 
 def deadline_extension_for(exercise, user):
@@ -33,6 +30,7 @@ def max_submissions_for(exercise, user):
     return exercise.max_submissions_for(user)
 
 
+register.filter('course_status', course_status)
 register.filter('my_submission_count', my_submission_count)
 register.filter('my_received_feedback_count', my_received_feedback_count)
 register.filter('deadline_extension_for', deadline_extension_for)
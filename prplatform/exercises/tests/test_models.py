@@ -2,10 +2,14 @@ from django.test import TestCase
 from django.utils import timezone
 from django.contrib.auth.models import AnonymousUser
 
+from prplatform.courses.roles import role_scope
 from prplatform.exercises.models import SubmissionExercise, ReviewExercise
+from prplatform.exercises.question_models import Question
+from prplatform.exercises.questionnaire import Questionnaire
+from prplatform.exercises.status import course_status
 from prplatform.exercises.deviation_models import SubmissionExerciseDeviation, ReviewExerciseDeviation
 from prplatform.submissions.models import OriginalSubmission, ReviewSubmission
-from prplatform.users.models import User
+from prplatform.users.models import StudentGroup, User
 
 
 class ExerciseTestCase(TestCase):
@@ -180,3 +184,72 @@ class ExerciseTestCase(TestCase):
         self.re.use_groups = True
         self.re.save()
         self.assertEqual(self.re.can_submit(self.student2), (False, None))
+
+    def test_questionnaire(self):
+        self.re.questions.set([1, 2, 3])
+        self.re.question_order = [3, 1]
+        self.re.save()
+
+        questionnaire = self.re.questionnaire()
+        # the question missing from question_order goes last
+        self.assertEqual([q.pk for q in questionnaire.questions], [3, 1, 2])
+        self.assertEqual([q.pk for q in questionnaire.numeric_questions], [2])
+        self.assertEqual([q.pk for q in questionnaire.textual_questions], [3, 1])
+        self.assertEqual(questionnaire.choice_label(2, '3'), '3')
+
+        Question.objects.filter(pk=1).update(choices=None)
+        questionnaire = Questionnaire(self.re.questions.all(), self.re.question_order)
+        self.assertEqual([q.pk for q in questionnaire.numeric_questions], [1, 2])
+        self.assertEqual([q.pk for q in questionnaire.textual_questions], [3])
+
+        _, review = self.create_reviewsubmission_for(self.re, reviewer=self.student2, reviewed=self.student1,
+                                                     create_original=True)
+        for question_pk in [2, 1, 3]:
+            review.answers.create(question_id=question_pk, value_text='text')
+        with self.assertNumQueries(1):
+            answers = questionnaire.order_answers(review.answers.all())
+            self.assertEqual([a.question.question_text for a in answers],
+                             ['Upload a txt file', 'Midi', 'Score the work'])
+
+    def test_course_status(self):
+        self.re.min_submission_count = 0
+        self.re.save()
+        osub, _ = self.create_reviewsubmission_for(self.re, reviewer=self.student2, reviewed=self.student1,
+                                                   create_original=True)
+        self.create_reviewsubmission_for(self.re, reviewer=self.student3, osubmission=osub)
+        self.create_reviewsubmission_for(self.re, reviewer=self.student3, osubmission=osub)
+
+        with role_scope():
+            for user in [self.student1, self.student2, self.student3]:
+                status = course_status(self.course, user)
+                for exercise in [self.se, self.re]:
+                    self.assertEqual(status.submission_count(exercise),
+                                     exercise.submissions_by_submitter(user).count())
+                self.assertEqual(status.reviews_done_count(self.re), self.re.last_reviews_by(user).count())
+                self.assertEqual(status.received_feedback_count(self.re), self.re.last_reviews_for(user).count())
+
+                # the counts are fetched once per request
+                with self.assertNumQueries(0):
+                    course_status(self.course, user).submission_count(self.re)
+
+    def test_deviations_are_loaded_once_per_course(self):
+        group = StudentGroup.objects.create(course=self.course, name='g-1',
+                                            student_usernames=[self.student2.email, self.student3.email])
+        self.re.use_groups = True
+        self.re.save()
+        se_deviation = SubmissionExerciseDeviation.objects.create(user=self.student2, exercise=self.se,
+                                                                  extra_submissions=2)
+        re_deviation = ReviewExerciseDeviation.objects.create(group=group, exercise=self.re, extra_submissions=1)
+        # another user's deviation
+        SubmissionExerciseDeviation.objects.create(user=self.student3, exercise=self.se, extra_submissions=5)
+
+        with role_scope():
+            self.assertEqual(self.se.deviation_for(self.student2), se_deviation)
+            self.assertEqual(self.re.deviation_for(self.student3), re_deviation)
+            self.assertEqual(self.re.deviation_for(self.student2), re_deviation)
+            self.assertIsNone(self.re.deviation_for(self.student1))
+
+            with self.assertNumQueries(0):
+                self.assertEqual(self.se.max_submissions_for(self.student2), self.se.max_submission_count + 2)
+                self.assertEqual(self.re.max_submissions_for(self.student2), self.re.max_submission_count + 1)
+                self.assertIsNone(self.se.deadline_extension_for(self.student2))
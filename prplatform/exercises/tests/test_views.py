@@ -1,8 +1,11 @@
 from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib.messages.middleware import MessageMiddleware
+from django.db import connection
 from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.http import HttpRequest
 from django.urls import resolve
 
@@ -17,6 +20,8 @@ from prplatform.users.models import (
 )
 from prplatform.users.receivers import change_original_submission_submitters
 from prplatform.courses.models import Course
+from prplatform.core.cache import invalidate
+from prplatform.courses.roles import role_scope
 from prplatform.submissions.models import (
     OriginalSubmission,
     ReviewSubmission,
@@ -460,14 +465,22 @@ class ExerciseTest(TestCase):
         rl_s4.refresh_from_db()
         self.assertNotEqual(created_before_refresh, rl_s4.created)
 
-        # change expiry to 1 hour -> all locks should be expirying now
+        # change expiry to 1 hour -> locks of s2 and s3 are expired now
         re.reviewlock_expiry_hours = 1
         re.save()
+        self.assertEqual(re.reviewlocks_for(self.s2).exists(), False)
+        self.assertEqual(re.reviewlocks_for(self.s3).exists(), False)
 
         request.user = self.s1
-        # this should create a lock for s1 and expire locks of s2 and s3
+        # this should create a lock for s1. expired locks are only ignored, not deleted
         response = ReviewExerciseDetailView.as_view()(request, **self.kwargs)
 
+        self.assertEqual(ReviewLock.objects.all().count(), 4)
+        self.assertEqual(re.reviewlocks_for(self.s1).exists(), True)
+        self.assertEqual(re.reviewlocks_for(self.s4).exists(), True)
+
+        # the sweeper deletes the expired locks of s2 and s3
+        call_command('expire_reviewlocks')
         self.assertEqual(ReviewLock.objects.all().count(), 2)
         self.assertEqual(ReviewLock.objects.filter(user=self.s1).exists(), True)
         self.assertEqual(ReviewLock.objects.filter(user=self.s4).exists(), True)
@@ -479,9 +492,12 @@ class ExerciseTest(TestCase):
         rl_s1.created = rl_s1.created.replace(hour=rl_s1.created.hour-5)
         rl_s1.save()
         rl_s1_reviewable_pk = rl_s1.original_submission.pk
-        # this will expire rl for s1
+        self.assertEqual(re.reviewlocks_for(self.s1).exists(), False)
+
+        # s3 gets a new lock since the old one was deleted
         request.user = self.s3
         ReviewExerciseDetailView.as_view()(request, **self.kwargs)
+        call_command('expire_reviewlocks')
         self.assertEqual(ReviewLock.objects.filter(user=self.s1).exists(), False)
 
         # there should be locks for s3 and s4
@@ -754,3 +770,38 @@ class ExerciseTest(TestCase):
         self.assertNotContains(self.get(self.RE1, self.s1), 'no-submissions-for-peer-review')
         self.create_originalsubmission_for(self.SE1, self.s1)
         self.assertContains(self.get(self.RE1, self.s1), 'no-submissions-for-peer-review', count=1)
+
+    def test_role_checks_are_memoized_per_request(self):
+        # the mixins, the models and the template filters ask for the same roles
+        # many times during one request. inside a role scope each lookup runs once.
+
+        # keys invalidated in the test transaction are read from the database. the fixtures
+        # and earlier tests invalidate some of them, so all of them are invalidated here
+        invalidate('course', 'prog1/F2018')
+        invalidate('exercise', SubmissionExercise.cache_key(self.SE1.pk), ReviewExercise.cache_key(self.RE1.pk))
+        invalidate('questionnaire', self.RE1.pk)
+        invalidate('groups', self.course.pk)
+
+        self.create_originalsubmission_for(self.SE1, [self.s1, self.s2])
+
+        # both exercises are closed. the counts include the SAVEPOINT and RELEASE of the atomic views
+        for exercise, user, count in [(self.SE1, self.s1, 12),
+                                      (self.SE1, self.t1, 9),
+                                      (self.RE1, self.s1, 19),
+                                      (self.RE1, self.t1, 20)]:
+            with self.subTest(exercise=exercise, user=user), role_scope(), self.assertNumQueries(count):
+                self.get(exercise, user).render()
+
+        # without a scope nothing is memoized
+        base_course = self.course.base_course
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(base_course.is_teacher(self.t1))
+            self.assertTrue(base_course.is_teacher(self.t1))
+        self.assertEqual(len(queries), 2)
+
+        # enrolling inside a scope updates the memoized value
+        new_student = User.objects.create(username="student7", email="student7@prp.fi")
+        with role_scope():
+            self.assertFalse(self.course.is_enrolled(new_student))
+            self.course.enroll(new_student)
+            self.assertTrue(self.course.is_enrolled(new_student))
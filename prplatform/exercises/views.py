@@ -1,7 +1,7 @@
 from django.contrib import messages
 from django.core.exceptions import EmptyResultSet, PermissionDenied
 from django.db import transaction
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import Http404, HttpResponseRedirect, HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -54,6 +54,16 @@ class LTIMixin:
         return super().dispatch(request, *args, **kwargs)
 
 
+class CachedExerciseMixin:
+    """ Reads the exercise from the shared cache, see prplatform.core.cache """
+
+    def get_object(self, queryset=None):
+        try:
+            return self.model.get_cached(self.kwargs['pk'])
+        except self.model.DoesNotExist:
+            raise Http404(f"No {self.model._meta.verbose_name} found matching the query")
+
+
 ###
 #
 # CREATE VIEWS
@@ -134,7 +144,7 @@ class ReviewExerciseUpdateView(IsTeacherMixin, ExerciseContextMixin, UpdateView)
 # DETAIL VIEWS
 #
 
-class SubmissionExerciseDetailView(LTIMixin, GroupMixin, ExerciseContextMixin, DetailView):
+class SubmissionExerciseDetailView(LTIMixin, GroupMixin, CachedExerciseMixin, ExerciseContextMixin, DetailView):
 
     model = SubmissionExercise
 
@@ -232,7 +242,7 @@ def _construct_aplus_response(exercise=None, user=None):
                           '</html>'))
 
 
-class ReviewExerciseDetailView(LTIMixin, GroupMixin, ExerciseContextMixin, DetailView):
+class ReviewExerciseDetailView(LTIMixin, GroupMixin, CachedExerciseMixin, ExerciseContextMixin, DetailView):
     model = ReviewExercise
 
     def _get_answer_forms(self):
@@ -263,7 +273,7 @@ class ReviewExerciseDetailView(LTIMixin, GroupMixin, ExerciseContextMixin, Detai
         if ctx['my_submission']:
             ctx['my_filecontents'] = ctx['my_submission'].filecontents_or_none()
 
-        rlock = exercise.reviewlocks_for(self.request.user).last()
+        rlock = exercise.reviewlocks_for(self.request.user, ctx.get('my_group')).last()
 
         if rlock:
             rlock.created = timezone.now()
@@ -296,7 +306,7 @@ class ReviewExerciseDetailView(LTIMixin, GroupMixin, ExerciseContextMixin, Detai
             for opt in self.object.get_choose_type_queryset(self.request.user):
                 token = None
                 if self.request.LTI_MODE:
-                    token = opt.get_download_token_for(self.request.user, self.request)
+                    token = opt.get_download_token_for(self.request.user)
                 options.append((opt, token))
         ctx['chooseform_options_list'] = options
         return ctx
@@ -333,11 +343,11 @@ class ReviewExerciseDetailView(LTIMixin, GroupMixin, ExerciseContextMixin, Detai
             ctx['disable_form'] = False
 
         if self.request.LTI_MODE and ctx['reviewable']:
-            ctx['LTI_DL_TOKEN'] = ctx['reviewable'].get_download_token_for(self.request.user, self.request)
+            ctx['LTI_DL_TOKEN'] = ctx['reviewable'].get_download_token_for(self.request.user)
         return ctx
 
     def _post_random(self, ctx):
-        rlock_list = self.object.reviewlocks_for(self.request.user)
+        rlock_list = self.object.reviewlocks_for(self.request.user, ctx.get('my_group'))
         rlock = rlock_list.last()
 
         reviewed_submission = None
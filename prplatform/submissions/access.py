@@ -0,0 +1,130 @@
+"""
+Access checks of DownloadSubmissionView.
+
+load_download fetches the OriginalSubmission or the Answer together with every
+relation the checks read, and download_access decides all the roles of the user
+with one more query of EXISTS subqueries. Without them each role check was a
+lazy query or several of its own. Requests with a dl_token are checked with
+download_token_allows instead.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import BooleanField, Exists, OuterRef, Subquery, Value
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+import datetime
+
+from prplatform.courses.models import BaseCourse
+from prplatform.exercises.models import ReviewExercise
+from prplatform.users.models import StudentGroup, User
+
+from .models import Answer, DownloadToken, OriginalSubmission
+from .reviewlock_models import ReviewLock
+from .tokens import read_download_token
+
+
+def load_download(pk, answer=False):
+    """
+    (object, review exercise or None) of the file to download with one query.
+    The review exercise might not exist if the teacher has only configured the
+    submission exercise.
+    """
+    if answer:
+        obj = get_object_or_404(Answer.objects.select_related('question',
+                                                              'submission__course__base_course',
+                                                              'submission__exercise',
+                                                              'submission__reviewed_submission'),
+                                pk=pk)
+        return obj, obj.submission.exercise
+
+    obj = get_object_or_404(OriginalSubmission.objects.select_related('course__base_course',
+                                                                      'exercise__review_exercise'),
+                            pk=pk)
+    return obj, getattr(obj.exercise, 'review_exercise', None)
+
+
+def _group_of(user, course):
+    """ Subquery of the pk of the user's group in course, the first by pk like Course.cached_student_groups """
+    return Subquery(StudentGroup.objects.filter(course=course, student_usernames__contains=[user.email])
+                                        .order_by('pk')
+                                        .values('pk')[:1])
+
+
+def _is_submitter(user, submission, group):
+    """ Expression telling if user is the submitter of submission or in its group, like is_owner """
+    if submission.submitter_group_id:
+        return Exists(StudentGroup.objects.filter(pk=submission.submitter_group_id).filter(pk=group))
+    return Value(submission.submitter_user_id == user.pk, output_field=BooleanField())
+
+
+def _has_reviewlock(user, re, osub, group):
+    """ Expression telling if user (or the user's group) has a reviewlock of osub, like reviewlocks_for """
+    locks = ReviewLock.objects.filter(review_exercise=re, original_submission=osub)
+    expiry_time = re.reviewlock_expiry_time()
+    if expiry_time:
+        locks = locks.filter(created__gte=expiry_time)
+    if re.use_groups:
+        locks = locks.filter(group=group)
+    else:
+        locks = locks.filter(user=user)
+    return Exists(locks)
+
+
+def download_access(user, obj, re):
+    """
+    {role: bool} of the roles allowing user to download the file of obj, an OriginalSubmission
+    or an Answer loaded by load_download. Any True role allows downloading. One query.
+    """
+    if isinstance(obj, Answer):
+        review = obj.submission
+        course = review.course
+        owned = review
+    else:
+        course = obj.course
+        owned = obj
+
+    teachers = BaseCourse.teachers.through.objects.filter(basecourse=course.base_course_id, user=OuterRef('pk'))
+    group = _group_of(user, course)
+    roles = {
+        'teacher': Exists(teachers),
+        'owner': _is_submitter(user, owned, group),
+        'reviewer': Value(False, output_field=BooleanField()),
+        'receiver': Value(False, output_field=BooleanField()),
+    }
+    if isinstance(obj, Answer):
+        if not obj.question.hide_from_receiver:
+            roles['receiver'] = _is_submitter(user, obj.submission.reviewed_submission, group)
+    elif re:
+        roles['reviewer'] = _has_reviewlock(user, re, obj, group)
+
+    access = User.objects.filter(pk=user.pk).annotate(**roles).values(*roles).first() or \
+        dict.fromkeys(roles, False)
+    access['teacher'] = access['teacher'] or user.is_superuser
+    # anyone on the course can download anything
+    access['enrolled_can_access'] = not isinstance(obj, Answer) and re is not None and \
+        re.type == ReviewExercise.CHOOSE
+    return access
+
+
+def download_token_allows(token, obj):
+    """
+    True if token was made for the submission of obj, an OriginalSubmission or an Answer
+    loaded by load_download. An answer is downloaded with the token of its review.
+    """
+    submission = obj.submission if isinstance(obj, Answer) else obj
+    try:
+        kind, submission_id, _ = read_download_token(token)
+    except signing.BadSignature:
+        return _legacy_token_allows(token, submission)
+    return kind == submission._meta.model_name and submission_id == submission.pk
+
+
+def _legacy_token_allows(token, submission):
+    """ The tokens stored in DownloadToken are valid until they expire, see delete_download_tokens """
+    # the stored tokens are sha256 hex digests, anything else would be a wasted query
+    if len(token) != 64:
+        return False
+    expiry_time = timezone.now() - datetime.timedelta(seconds=settings.DOWNLOAD_TOKEN_MAX_AGE)
+    return DownloadToken.objects.filter(submission_id=submission.pk, token=token,
+                                        created__gte=expiry_time).exists()
@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from .models import OriginalSubmission, ReviewSubmission
 from .reviewlock_models import ReviewLock
+from .stats_models import ReviewStatsSnapshot
 
 @admin.register(OriginalSubmission)
 class OriginalSubmissionModelAdmin(admin.ModelAdmin):
@@ -18,3 +19,7 @@ class ReviewLockModelAdmin(admin.ModelAdmin):
 
     def course(self, obj):
         return obj.review_exercise.course
+
+@admin.register(ReviewStatsSnapshot)
+class ReviewStatsSnapshotModelAdmin(admin.ModelAdmin):
+    list_display = ("review_exercise", "created", "modified")
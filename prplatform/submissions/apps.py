@@ -15,3 +15,5 @@ class SubmissionsConfig(AppConfig):
         except ImportError:
             pass
 
+        import prplatform.submissions.receivers  # noqa F401
+
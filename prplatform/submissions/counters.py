@@ -0,0 +1,59 @@
+"""
+Updates of the denormalized review_count and active_lock_count of OriginalSubmission.
+
+The receivers in prplatform.submissions.receivers change the counters of one
+submission per saved or deleted row. Inside batched() the changes are collected
+instead and written when the block exits with one UPDATE per field and distinct
+amount, so deleting a batch of reviewlocks doesn't run one UPDATE per lock.
+batched() must be used inside a transaction: if the block raises, the collected
+changes are dropped together with the rolled back rows.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F
+
+from .models import OriginalSubmission
+
+_state = threading.local()
+
+
+def add(osub_id, field, amount):
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending[(osub_id, field)] = pending.get((osub_id, field), 0) + amount
+        return
+    # update() runs in the transaction of the write that triggered the signal
+    # and never touches the other fields of the submission
+    OriginalSubmission.objects.filter(pk=osub_id).update(**{field: F(field) + amount})
+
+
+def add_many(field, amounts):
+    """ Adds {osub pk: amount} to the field with one UPDATE per distinct amount """
+    by_amount = {}
+    for pk, amount in amounts.items():
+        if amount:
+            by_amount.setdefault(amount, []).append(pk)
+    for amount, pks in by_amount.items():
+        OriginalSubmission.objects.filter(pk__in=pks).update(**{field: F(field) + amount})
+
+
+@contextmanager
+def batched():
+    """ Collects the counter changes until the block exits. A nested block shares the outermost one. """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+
+    _state.pending = {}
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+
+    by_field = {}
+    for (pk, field), amount in pending.items():
+        by_field.setdefault(field, {})[pk] = amount
+    for field, amounts in by_field.items():
+        add_many(field, amounts)
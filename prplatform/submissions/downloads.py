@@ -0,0 +1,142 @@
+"""
+Serving submitted files after the permission checks of DownloadSubmissionView.
+
+The file is never read into memory as a whole: it is streamed from the storage
+in blocks or, with DOWNLOAD_OFFLOAD, handed over to the front proxy with an
+X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) header so the worker
+is free as soon as the headers are sent. The responses have an ETag and a
+Last-Modified header, conditional GETs of an unchanged file get a 304, and a
+single byte range can be requested with the Range header.
+"""
+import mimetypes
+import re
+from hashlib import sha1
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^\s*bytes=(\d*)-(\d*)\s*$')
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+
+def parse_range(header, size):
+    """
+    (first byte, last byte) of a single byte range. None if the whole file should be sent:
+    no header or one that can't be parsed. False if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # the last n bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(field_file, start, length, block_size=FileResponse.block_size):
+    try:
+        field_file.seek(start)
+        while length > 0:
+            block = field_file.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        field_file.close()
+
+
+def _validators(field_file):
+    """ (ETag, modification timestamp or None) of the stored file """
+    storage = field_file.storage
+    try:
+        modified = int(storage.get_modified_time(field_file.name).timestamp())
+    except (NotImplementedError, AttributeError):
+        modified = None
+    etag = sha1(f"{field_file.name}:{field_file.size}:{modified}".encode()).hexdigest()
+    return f'"{etag}"', modified
+
+
+def _offload(response, field_file):
+    """ Lets the front proxy send the file. False if the storage doesn't allow it. """
+    if settings.DOWNLOAD_OFFLOAD == X_ACCEL_REDIRECT:
+        response['X-Accel-Redirect'] = settings.DOWNLOAD_ACCEL_PREFIX + quote(field_file.name)
+        return True
+    if settings.DOWNLOAD_OFFLOAD == X_SENDFILE:
+        try:
+            response['X-Sendfile'] = field_file.path
+        except NotImplementedError:
+            # not a local file
+            return False
+        return True
+    return False
+
+
+def serve_file(request, field_file):
+    """ Response sending field_file as an attachment, see the docstring of the module """
+    filename = field_file.name.split('/')[-1]
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    size = field_file.size
+    etag, modified = _validators(field_file)
+
+    def add_headers(response):
+        response['ETag'] = etag
+        if modified is not None:
+            response['Last-Modified'] = http_date(modified)
+        # the files are only for the users allowed above: browsers may keep them but must revalidate
+        response['Cache-Control'] = 'private, no-cache'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+    if not_modified is not None:
+        if isinstance(not_modified, HttpResponseNotModified):
+            add_headers(not_modified)
+        return not_modified
+
+    disposition = f"attachment; filename={filename}"
+
+    offloaded = HttpResponse(content_type=content_type)
+    if _offload(offloaded, field_file):
+        # the proxy handles the ranges and the length
+        offloaded['Content-Disposition'] = disposition
+        return add_headers(offloaded)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag or \
+            (modified is not None and parse_http_date_safe(if_range) == modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return add_headers(response)
+
+    field_file.open('rb')
+    if byte_range is None:
+        response = FileResponse(field_file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(field_file, start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Disposition'] = disposition
+    return add_headers(response)
@@ -135,7 +135,7 @@ class AnswerModelForm(ModelForm):
         # (by default the QS is all Choice model objects)
         if choices:
             self.fields['value_choice'].label = question_text
-            self.fields['value_choice'].choices = sorted(choices, key=lambda c: c[0])
+            self.fields['value_choice'].choices = question.sorted_choices
             if required:
                 self.fields['value_choice'].required = True
             self.fields.pop('value_text')
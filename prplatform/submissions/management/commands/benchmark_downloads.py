@@ -0,0 +1,162 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import time
+
+from prplatform.courses.models import BaseCourse, Course
+from prplatform.exercises.models import ReviewExercise, SubmissionExercise
+from prplatform.exercises.question_models import Question
+from prplatform.submissions.access import download_access, load_download
+from prplatform.submissions.models import Answer, OriginalSubmission, ReviewSubmission
+from prplatform.submissions.reviewlock_models import ReviewLock
+from prplatform.submissions.views import DownloadSubmissionView
+from prplatform.users.models import StudentGroup, User
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_allowed(user, dtype, pk):
+    """ These are the checks DownloadSubmissionView did before
+        prplatform.submissions.access. It is kept here only as
+        the baseline of the benchmark. """
+
+    if dtype == 'answer':
+        obj = get_object_or_404(Answer, pk=pk)
+        teacher = obj.submission.course.is_teacher(user)
+        owner = obj.submission.is_owner(user)
+        re = obj.submission.exercise
+    else:
+        obj = get_object_or_404(OriginalSubmission, pk=pk)
+        teacher = obj.course.is_teacher(user)
+        owner = obj.is_owner(user)
+        if hasattr(obj.exercise, 'review_exercise') and obj.exercise.review_exercise is not None:
+            re = obj.exercise.review_exercise
+        else:
+            re = None
+
+    enrolled_can_access = False
+    if re and re.type == ReviewExercise.CHOOSE and dtype == 'osub':
+        enrolled_can_access = True
+
+    reviewer = False
+    receiver = False
+    if dtype == 'osub':
+        pks_of_users_reviewables = []
+        if re:
+            pks_of_users_reviewables = re.reviewlocks_for(user).values_list('original_submission', flat=True)
+        reviewer = pk in pks_of_users_reviewables
+    else:
+        receiver = obj.submission.reviewed_submission.is_owner(user) and not obj.question.hide_from_receiver
+
+    return teacher or owner or reviewer or receiver or enrolled_can_access
+
+
+def new_allowed(user, dtype, pk):
+    obj, re = load_download(pk, answer=dtype == 'answer')
+    return any(download_access(user, obj, re).values())
+
+
+class Command(BaseCommand):
+    help = ('Compares the access checks of the submission download endpoint against the previous '
+            'implementation and measures the whole endpoint, for original submissions and answers. '
+            'All data is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='How many times each download is run')
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        self.stdout.write(f"{'download':>22} {'legacy ms':>10} {'queries':>8} "
+                          f"{'new ms':>10} {'queries':>8} {'endpoint ms':>12} {'queries':>8}")
+        files = []
+        try:
+            with transaction.atomic():
+                cases = self._create_data(files)
+                for name, user, dtype, pk in cases:
+                    legacy = self._measure(lambda: legacy_allowed(user, dtype, pk), options['repeat'])
+                    new = self._measure(lambda: new_allowed(user, dtype, pk), options['repeat'])
+                    endpoint = self._measure(lambda: self._download(user, dtype, pk), options['repeat'])
+                    if not (legacy[2] and new[2]):
+                        self.stderr.write(f"{name}: access was denied")
+                    self.stdout.write(f"{name:>22} {legacy[0]:>10.2f} {legacy[1]:>8} "
+                                      f"{new[0]:>10.2f} {new[1]:>8} {endpoint[0]:>12.2f} {endpoint[1]:>8}")
+                raise Rollback()
+        except Rollback:
+            pass
+        finally:
+            # the files are not rolled back with the rows
+            for field_file in files:
+                field_file.storage.delete(field_file.name)
+
+    def _download(self, user, dtype, pk):
+        request = self.factory.get('/', {'type': dtype} if dtype == 'answer' else {})
+        request.user = user
+        response = DownloadSubmissionView.as_view()(request, pk=pk)
+        # with DOWNLOAD_OFFLOAD the proxy sends the file and the response has no content to stream
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        return response.status_code == 200
+
+    def _measure(self, run, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            result = run()
+        query_count = len(queries)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        return elapsed_ms, query_count, result
+
+    def _create_data(self, files):
+        """ The test cases. The stored files are added to files as soon as they are saved. """
+        now = timezone.now()
+        base_course = BaseCourse.objects.create(name='Benchmark', code='BENCHMARK-DL',
+                                                url_slug='benchmark-dl', school='BENCH')
+        course = Course.objects.create(base_course=base_course, year=now.year, code='BENCHMARK-DL',
+                                       url_slug='benchmark-dl', start_date=now.date(), end_date=now.date())
+        se = SubmissionExercise.objects.create(name='benchmark', course=course,
+                                               type=SubmissionExercise.FILE_UPLOAD,
+                                               opening_time=now, closing_time=now)
+        question = Question.objects.create(course=course, question_text='benchmark', accepted_filetypes='.txt')
+        re = ReviewExercise.objects.create(name='benchmark review', course=course, reviewable_exercise=se,
+                                           type=ReviewExercise.RANDOM, opening_time=now, closing_time=now,
+                                           use_groups=True, question_order=[question.pk])
+        re.questions.add(question)
+
+        submitter, reviewer, other = User.objects.bulk_create([
+            User(username=f'benchmark-dl-{i}', email=f'benchmark-dl-{i}@prp.fi') for i in range(3)
+        ])
+        groups = StudentGroup.objects.bulk_create([
+            StudentGroup(course=course, name='benchmark-submitters', student_usernames=[submitter.email]),
+            StudentGroup(course=course, name='benchmark-reviewers', student_usernames=[reviewer.email]),
+        ])
+        osub = OriginalSubmission(course=course, exercise=se, submitter_user=submitter, submitter_group=groups[0],
+                                  file=ContentFile(b'benchmark' * 1000, name='benchmark.txt'))
+        osub.save()
+        files.append(osub.file)
+        ReviewLock.objects.create(user=other, group=groups[1], review_exercise=re, original_submission=osub)
+        review = ReviewSubmission.objects.create(course=course, exercise=re, submitter_user=other,
+                                                 submitter_group=groups[1], reviewed_submission=osub)
+        answer = Answer(submission=review, question=question,
+                        uploaded_file=ContentFile(b'benchmark' * 1000, name='benchmark.txt'))
+        answer.save()
+        files.append(answer.uploaded_file)
+
+        cases = [
+            ('submission owner', submitter, 'osub', osub.pk),
+            ('submission reviewer', reviewer, 'osub', osub.pk),
+            ('answer receiver', submitter, 'answer', answer.pk),
+            ('answer owner', reviewer, 'answer', answer.pk),
+        ]
+        return cases
@@ -0,0 +1,118 @@
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import time
+
+from prplatform.courses.models import BaseCourse, Course
+from prplatform.exercises.models import ReviewExercise, SubmissionExercise
+from prplatform.submissions.models import OriginalSubmission
+from prplatform.submissions.reviewlock_models import ReviewLock, rebuild_counters
+from prplatform.users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_candidate(exercise, user):
+    """ This is the candidate selection create_rlock used before
+        ReviewLockManager.random_candidates. It is kept here only
+        as the baseline of the benchmark. """
+
+    osub_candidates = OriginalSubmission.objects \
+                                        .filter(exercise=exercise.reviewable_exercise) \
+                                        .annotate(
+                                            reviews_and_locks=Count('reviewlocks', distinct=True) +
+                                            Count('reviews', distinct=True)
+                                            ) \
+                                        .order_by(
+                                            'reviews_and_locks',
+                                            'created'
+                                            )
+    osub_candidates = osub_candidates.exclude(reviews_and_locks__gte=exercise.max_reviews_per_submission)
+    latest_submission_ids = OriginalSubmission.objects.filter(exercise=exercise.reviewable_exercise) \
+                                              .values('id') \
+                                              .order_by('submitter_user_id', '-created') \
+                                              .distinct('submitter_user_id')
+    osub_candidates = osub_candidates.exclude(submitter_user=user) \
+                                     .filter(id__in=latest_submission_ids)
+    previous_revsub_ids = exercise.last_reviews_by(user).values('reviewed_submission__id')
+    osub_candidates = osub_candidates.exclude(pk__in=previous_revsub_ids)
+    osub_candidates = osub_candidates.filter(state=OriginalSubmission.READY_FOR_REVIEW)
+
+    if osub_candidates.count() == 0:
+        raise EmptyResultSet("nothing to review")
+
+    return osub_candidates.first()
+
+
+class Command(BaseCommand):
+    help = ('Compares the RANDOM reviewlock candidate selection against the previous '
+            'implementation. All data is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000],
+                            help='Numbers of original submissions to benchmark with')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='How many times each selection is run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'submissions':>12} {'legacy ms':>12} {'queries':>8} {'new ms':>12} {'queries':>8}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    exercise, reviewer = self._create_data(size)
+                    legacy = self._measure(lambda: legacy_candidate(exercise, reviewer), options['repeat'])
+                    new = self._measure(lambda: ReviewLock.objects.random_candidates(exercise, reviewer).first(),
+                                        options['repeat'])
+                    if legacy[2] != new[2]:
+                        self.stderr.write(f"Different candidates selected: {legacy[2]} vs. {new[2]}")
+                    raise Rollback()
+            except Rollback:
+                pass
+            self.stdout.write(f"{size:>12} {legacy[0]:>12.2f} {legacy[1]:>8} {new[0]:>12.2f} {new[1]:>8}")
+
+    def _measure(self, select, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            selected = select()
+        query_count = len(queries)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            select()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        return elapsed_ms, query_count, selected.pk if selected else None
+
+    def _create_data(self, size):
+        now = timezone.now()
+        base_course = BaseCourse.objects.create(name='Benchmark', code='BENCHMARK-RL',
+                                                url_slug='benchmark-rl', school='BENCH')
+        course = Course.objects.create(base_course=base_course, year=now.year, code='BENCHMARK-RL',
+                                       url_slug='benchmark-rl', start_date=now.date(), end_date=now.date())
+        se = SubmissionExercise.objects.create(name='benchmark', course=course, type=SubmissionExercise.TEXT,
+                                               opening_time=now, closing_time=now)
+        re = ReviewExercise.objects.create(name='benchmark review', course=course, reviewable_exercise=se,
+                                           type=ReviewExercise.RANDOM, opening_time=now, closing_time=now,
+                                           max_reviews_per_submission=2, question_order=[])
+
+        users = User.objects.bulk_create([
+            User(username=f'benchmark-rl-{i}', email=f'benchmark-rl-{i}@prp.fi') for i in range(size + 1)
+        ])
+        reviewer, submitters = users[0], users[1:]
+        submissions = OriginalSubmission.objects.bulk_create([
+            OriginalSubmission(course=course, exercise=se, submitter_user=user, text='benchmark')
+            for user in submitters
+        ])
+
+        # every other submission already has a reviewer working on it
+        ReviewLock.objects.bulk_create([
+            ReviewLock(user=submitters[(i + 1) % len(submitters)], review_exercise=re, original_submission=osub)
+            for i, osub in enumerate(submissions) if i % 2 == 0
+        ])
+        # bulk_create doesn't send the signals that maintain the counters
+        rebuild_counters(OriginalSubmission.objects.filter(exercise=se))
+        return re, reviewer
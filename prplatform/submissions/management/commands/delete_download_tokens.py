@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+import datetime
+
+from prplatform.submissions.models import DownloadToken
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Deletes the stored download tokens that are older than DOWNLOAD_TOKEN_MAX_AGE. '
+            'New tokens are signed and not stored, so eventually the table is empty.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='How many tokens are deleted in one transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Delete the tokens that have not expired yet too')
+
+    def handle(self, *args, **options):
+        tokens = DownloadToken.objects.all()
+        if not options['all']:
+            expiry_time = timezone.now() - datetime.timedelta(seconds=settings.DOWNLOAD_TOKEN_MAX_AGE)
+            tokens = tokens.filter(created__lt=expiry_time)
+
+        batch_size = options['batch_size']
+        total = 0
+        while True:
+            with transaction.atomic():
+                batch = list(tokens.values_list('pk', flat=True)[:batch_size])
+                if batch:
+                    DownloadToken.objects.filter(pk__in=batch).delete()
+            total += len(batch)
+
+            if len(batch) < batch_size:
+                break
+
+        logger.info(f"Deleted {total} download tokens")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from prplatform.exercises.models import ReviewExercise
+from prplatform.submissions.reviewlock_models import ReviewLock
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired ReviewLocks of all ReviewExercises that have reviewlock_expiry_hours set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='How many reviewlocks are deleted in one transaction')
+
+    def handle(self, *args, **options):
+
+        exercises = ReviewExercise.objects.filter(type=ReviewExercise.RANDOM) \
+                                          .exclude(reviewlock_expiry_hours=0)
+
+        total = 0
+        for exercise in exercises:
+            deleted = self._expire_locks_of(exercise, options['batch_size'])
+            if deleted:
+                logger.info(f"Deleted {deleted} expired reviewlocks of {exercise} (pk={exercise.pk})")
+            total += deleted
+
+        logger.info(f"Deleted {total} expired reviewlocks")
+
+    def _expire_locks_of(self, exercise, batch_size):
+        # the expiry time is fixed for the whole run so that
+        # locks refreshed meanwhile are not touched
+        expiry_time = exercise.reviewlock_expiry_time()
+        deleted = 0
+
+        while True:
+            # each batch is its own transaction. locks another run or an allocator
+            # (see ReviewLockManager._reserve_random_candidate) is deleting are skipped.
+            # allocators lock rows of OriginalSubmission, so the counter updates of a
+            # batch may wait for the allocations in progress to commit.
+            count = ReviewLock.objects.expire(exercise, expiry_time, limit=batch_size)
+            deleted += count
+
+            if count < batch_size:
+                return deleted
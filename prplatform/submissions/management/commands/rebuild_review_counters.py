@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from prplatform.submissions.models import OriginalSubmission
+from prplatform.submissions.reviewlock_models import rebuild_counters, with_live_counts
+
+
+class Command(BaseCommand):
+    help = ('Verifies the review_count and active_lock_count counters of OriginalSubmissions '
+            'against the live ReviewSubmission and ReviewLock rows and rebuilds them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, default=None,
+                            help='PK of the SubmissionExercise whose submissions are handled (default: all)')
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Only report the submissions with wrong counters, do not fix them')
+
+    def handle(self, *args, **options):
+        submissions = OriginalSubmission.objects.all()
+        if options['exercise']:
+            submissions = submissions.filter(exercise_id=options['exercise'])
+
+        with transaction.atomic():
+            mismatches = with_live_counts(submissions).filter(
+                    ~Q(review_count=F('live_review_count')) | ~Q(active_lock_count=F('live_active_lock_count'))
+                )
+
+            for osub in mismatches:
+                self.stdout.write(f"OriginalSubmission {osub.pk}: "
+                                  f"review_count {osub.review_count} (live {osub.live_review_count}), "
+                                  f"active_lock_count {osub.active_lock_count} (live {osub.live_active_lock_count})")
+
+            mismatch_count = len(mismatches)
+            self.stdout.write(f"{mismatch_count} submissions with wrong counters")
+
+            if mismatch_count and not options['verify_only']:
+                rebuild_counters(submissions)
+                self.stdout.write(self.style.SUCCESS("Counters rebuilt"))
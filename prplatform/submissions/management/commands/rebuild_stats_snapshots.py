@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from prplatform.exercises.models import ReviewExercise
+from prplatform.submissions.stats_models import ReviewStatsSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the statistics snapshots of ReviewExercises from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, default=None,
+                            help='PK of the ReviewExercise whose snapshot is rebuilt (default: all)')
+
+    def handle(self, *args, **options):
+        exercises = ReviewExercise.objects.all()
+        if options['exercise']:
+            exercises = exercises.filter(pk=options['exercise'])
+
+        for exercise in exercises:
+            with transaction.atomic():
+                ReviewStatsSnapshot.objects.filter(review_exercise=exercise).delete()
+                snapshot = ReviewStatsSnapshot.objects.fresh_for(exercise)
+                self.stdout.write(f"{exercise}: {snapshot.rows.count()} rows")
+
+        self.stdout.write(self.style.SUCCESS("Snapshots rebuilt"))
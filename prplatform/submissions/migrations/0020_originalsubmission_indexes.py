@@ -0,0 +1,21 @@
+# Generated by Django 2.2.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0019_auto_20190204_0711'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='originalsubmission',
+            index=models.Index(fields=['exercise', 'submitter_user', '-created'], name='osub_exercise_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='originalsubmission',
+            index=models.Index(fields=['exercise', 'submitter_group', '-created'], name='osub_exercise_group_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.3 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk_field):
+    counts = model.objects.filter(**{fk_field: OuterRef('pk')}) \
+                          .order_by() \
+                          .values(fk_field) \
+                          .annotate(count=Count('pk')) \
+                          .values('count')
+    return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+
+def populate_counters(apps, schema_editor):
+    OriginalSubmission = apps.get_model('submissions', 'OriginalSubmission')
+    ReviewSubmission = apps.get_model('submissions', 'ReviewSubmission')
+    ReviewLock = apps.get_model('submissions', 'ReviewLock')
+    OriginalSubmission.objects.update(review_count=count_of(ReviewSubmission, 'reviewed_submission'),
+                                      active_lock_count=count_of(ReviewLock, 'original_submission'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0020_originalsubmission_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='originalsubmission',
+            name='active_lock_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='originalsubmission',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+        # Django 2.2 cannot describe expression indexes in Meta.indexes
+        migrations.RunSQL(
+            'CREATE INDEX osub_exercise_review_load_idx ON submissions_originalsubmission '
+            '(exercise_id, state, (review_count + active_lock_count), created);',
+            'DROP INDEX osub_exercise_review_load_idx;',
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.3 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0021_originalsubmission_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reviewlock',
+            index=models.Index(fields=['review_exercise', 'user', 'created'], name='reviewlock_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewlock',
+            index=models.Index(fields=['review_exercise', 'group', 'created'], name='reviewlock_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewlock',
+            index=models.Index(fields=['review_exercise', 'created'], name='reviewlock_created_idx'),
+        ),
+    ]
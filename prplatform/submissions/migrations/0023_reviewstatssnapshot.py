@@ -0,0 +1,45 @@
+# Generated by Django 2.2.3 on 2026-10-18 13:05
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0050_remove_reviewexercise_model_answer'),
+        ('submissions', '0022_reviewlock_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewStatsSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('review_exercise', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats_snapshot', to='exercises.ReviewExercise')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReviewStatsRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitter_key', models.IntegerField(null=True)),
+                ('dirty', models.BooleanField(default=True)),
+                ('version', models.IntegerField(default=0)),
+                ('done', models.NullBooleanField()),
+                ('reviews_by', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('reviews_for', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('numerical_avgs', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='submissions.ReviewStatsSnapshot')),
+            ],
+            options={
+                'unique_together': {('snapshot', 'submitter_key')},
+            },
+        ),
+    ]
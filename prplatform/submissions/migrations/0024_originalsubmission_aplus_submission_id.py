@@ -0,0 +1,22 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0023_reviewstatssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='originalsubmission',
+            name='aplus_submission_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='originalsubmission',
+            constraint=models.UniqueConstraint(fields=('exercise', 'aplus_submission_id'), name='osub_unique_aplus_submission'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.3 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0024_originalsubmission_aplus_submission_id'),
+    ]
+
+    operations = [
+        # the existing tokens get the time of the migration and expire DOWNLOAD_TOKEN_MAX_AGE after it
+        migrations.AddField(
+            model_name='downloadtoken',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='downloadtoken',
+            index=models.Index(fields=['submission_id', 'token'], name='downloadtoken_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='downloadtoken',
+            index=models.Index(fields=['created'], name='downloadtoken_created_idx'),
+        ),
+    ]
@@ -1,8 +1,7 @@
-from django.db import models, OperationalError
+from django.db import models, transaction, OperationalError
 from django.urls import reverse
 
 import os
-from hashlib import sha256
 
 from prplatform.core.models import TimeStampedModel
 from prplatform.users.models import User, StudentGroup
@@ -10,6 +9,8 @@ from prplatform.courses.models import Course
 from prplatform.exercises.models import SubmissionExercise, ReviewExercise
 from prplatform.exercises.question_models import Question
 
+from .tokens import make_download_token
+
 
 class BaseSubmission(TimeStampedModel):
 
@@ -28,11 +29,13 @@ class BaseSubmission(TimeStampedModel):
         else:
             return self.submitter_user
 
-    def is_owner(self, user):
-        if self.submitter_group:
-            # TODO: perf, make group an optional parameter
-            return self.submitter_group == self.course.find_studentgroup_by_user(user)
-        return self.submitter_user == user
+    def is_owner(self, user, group=None):
+        """ group is the user's group in the course, looked up if not given """
+        if self.submitter_group_id:
+            if group is None:
+                group = self.course.find_studentgroup_by_user(user)
+            return group is not None and group.pk == self.submitter_group_id
+        return self.submitter_user_id == user.pk
 
     def get_absolute_url(self):
         urls = {'OriginalSubmission': 'courses:submissions:original-detail',
@@ -55,14 +58,9 @@ class BaseSubmission(TimeStampedModel):
             'sub_pk': self.pk
             })
 
-    def get_download_token_for(self, user, request):
-        previous_token = user.download_tokens.filter(submission_id=self.pk).first()
-        if previous_token:
-            return previous_token.token
-        query_bytes = request.META['QUERY_STRING'].encode()
-        hash_digest = sha256(query_bytes).hexdigest()
-        DownloadToken(submission_id=self.pk, user=user, token=hash_digest).save()
-        return hash_digest
+    def get_download_token_for(self, user):
+        """ Token that lets user download the files of this submission without a session, see tokens.py """
+        return make_download_token(self._meta.model_name, self.pk, user.pk)
 
 
 def upload_fp(instance, filename):
@@ -96,6 +94,33 @@ class OriginalSubmission(BaseSubmission):
         default=READY_FOR_REVIEW,
     )
 
+    # these are denormalized counts of the rows in ReviewSubmission and ReviewLock
+    # pointing to this submission. they are maintained with F() expressions by the
+    # receivers in prplatform.submissions.receivers and can be rebuilt with the
+    # rebuild_review_counters management command.
+    # migration 0021 also creates an expression index on
+    # (exercise, state, review_count + active_lock_count, created)
+    # which makes picking the least reviewed candidate an index scan.
+    review_count = models.IntegerField(default=0)
+    active_lock_count = models.IntegerField(default=0)
+
+    COUNTER_FIELDS = ('review_count', 'active_lock_count')
+
+    # id of the A+ submission this was created from, see prplatform.aplus_integration
+    aplus_submission_id = models.IntegerField(null=True, blank=True)
+
+    class Meta(BaseSubmission.Meta):
+        # these back the "latest submission by each submitter" subqueries
+        # (DISTINCT ON submitter ORDER BY created DESC) used when dealing reviews
+        indexes = [
+            models.Index(fields=['exercise', 'submitter_user', '-created'], name='osub_exercise_user_idx'),
+            models.Index(fields=['exercise', 'submitter_group', '-created'], name='osub_exercise_group_idx'),
+        ]
+        constraints = [
+            # an A+ submission is ingested only once even if its hook is delivered again
+            models.UniqueConstraint(fields=['exercise', 'aplus_submission_id'], name='osub_unique_aplus_submission'),
+        ]
+
     def __str__(self):
         # return f"Submitter: {self.submitter} | {self.exercise} ({str(self.created)[:16]})"
         return f"Submitter: {self.submitter} | {self.exercise}"
@@ -140,6 +165,14 @@ class OriginalSubmission(BaseSubmission):
             self.file = None
             super().save(*args, **kwargs)
             self.file = uploaded_file
+            # the row exists now, the save below is an UPDATE
+            kwargs.pop('force_insert', None)
+
+        if kwargs.get('update_fields') is None:
+            # the counters are only changed with F() expressions in the DB,
+            # never write the possibly stale values of this instance over them
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.COUNTER_FIELDS]
 
         super().save(*args, **kwargs)
 
@@ -150,11 +183,12 @@ class ReviewSubmission(BaseSubmission):
     reviewed_submission = models.ForeignKey(OriginalSubmission, related_name="reviews", on_delete=models.CASCADE)
 
     def answers_in_ordered_list(self):
-        return sorted(self.answers.all(), key=lambda a: self.exercise.question_order.index(a.question.pk))
+        return self.exercise.questionnaire().order_answers(self.answers.all())
 
     def __str__(self):
         return f"{self.submitter} -> {self.reviewed_submission.submitter} | {self.exercise}"
 
+    @transaction.atomic
     def save_and_destroy_lock(self, *args, **kwargs):
 
         if self.pk is not None:
@@ -163,7 +197,10 @@ class ReviewSubmission(BaseSubmission):
 
         else:
 
-            locks = self.exercise.reviewlocks_for(self.submitter_user)
+            locks = self.exercise.reviewlocks_for(self.submitter_user, self.submitter_group)
+            if locks.count() > 1:
+                # reviews dealt in advance leave one lock per reviewed submission
+                locks = locks.filter(original_submission=self.reviewed_submission)
             if locks.count() != 1:
                 raise OperationalError(f'There should be exactly 1 reviewlock! Found: {locks.count()}')
             locks.first().delete()
@@ -202,7 +239,7 @@ class Answer(models.Model):
         """ This is the original string representation from the shown question """
         if not self.value_choice:
             return None
-        return [c[1] for c in self.question.choices if c[0] == self.value_choice][0]
+        return self.question.choice_labels[self.value_choice]
 
     def get_file_download_url(self):
         return reverse('courses:submissions:download', kwargs={
@@ -213,6 +250,18 @@ class Answer(models.Model):
 
 
 class DownloadToken(models.Model):
+    """
+    Download tokens stored before the signed tokens of tokens.py. They are accepted until
+    DOWNLOAD_TOKEN_MAX_AGE has passed from their creation and deleted with the
+    delete_download_tokens command. No new tokens are stored.
+    """
     submission_id = models.PositiveIntegerField()
     user = models.ForeignKey(User, related_name='download_tokens', on_delete=models.CASCADE)
     token = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['submission_id', 'token'], name='downloadtoken_lookup_idx'),
+            models.Index(fields=['created'], name='downloadtoken_created_idx'),
+        ]
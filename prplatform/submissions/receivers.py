@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters
+from .models import Answer, OriginalSubmission, ReviewSubmission
+from .reviewlock_models import ReviewLock
+from .stats_models import ReviewStatsSnapshot, review_keys
+
+from prplatform.courses import roles
+from prplatform.exercises.models import ReviewExercise
+from prplatform.exercises.question_models import Question
+from prplatform.users.models import StudentGroup
+
+
+@receiver(post_save, sender=ReviewLock, dispatch_uid='reviewlock_created')
+def reviewlock_created(sender, instance, created, **kwargs):
+    if created:
+        counters.add(instance.original_submission_id, 'active_lock_count', 1)
+
+
+@receiver(post_delete, sender=ReviewLock, dispatch_uid='reviewlock_deleted')
+def reviewlock_deleted(sender, instance, **kwargs):
+    counters.add(instance.original_submission_id, 'active_lock_count', -1)
+
+
+@receiver(post_save, sender=ReviewSubmission, dispatch_uid='reviewsubmission_created')
+def reviewsubmission_created(sender, instance, created, **kwargs):
+    if created:
+        counters.add(instance.reviewed_submission_id, 'review_count', 1)
+
+
+@receiver(post_delete, sender=ReviewSubmission, dispatch_uid='reviewsubmission_deleted')
+def reviewsubmission_deleted(sender, instance, **kwargs):
+    counters.add(instance.reviewed_submission_id, 'review_count', -1)
+
+
+@receiver(post_save, sender=ReviewSubmission, dispatch_uid='reviewsubmission_saved_stats')
+@receiver(post_delete, sender=ReviewSubmission, dispatch_uid='reviewsubmission_deleted_stats')
+def reviewsubmission_changed_stats(sender, instance, **kwargs):
+    ReviewStatsSnapshot.objects.mark_dirty(instance.exercise_id, review_keys(instance))
+    # the answers saved with the review in the same transaction don't mark the rows again
+    instance._stats_marked_dirty = transaction.get_connection().in_atomic_block
+
+
+@receiver(post_save, sender=OriginalSubmission, dispatch_uid='originalsubmission_saved_status')
+@receiver(post_delete, sender=OriginalSubmission, dispatch_uid='originalsubmission_deleted_status')
+@receiver(post_save, sender=ReviewSubmission, dispatch_uid='reviewsubmission_saved_status')
+@receiver(post_delete, sender=ReviewSubmission, dispatch_uid='reviewsubmission_deleted_status')
+def submission_changed_status(sender, instance, **kwargs):
+    # the counts of the CourseStatus objects of the request are outdated
+    roles.forget('status')
+
+
+@receiver(post_save, sender=Answer, dispatch_uid='answer_saved_stats')
+@receiver(post_delete, sender=Answer, dispatch_uid='answer_deleted_stats')
+def answer_changed_stats(sender, instance, **kwargs):
+    if Answer.submission.is_cached(instance):
+        review = instance.submission
+        if getattr(review, '_stats_marked_dirty', False):
+            return
+    else:
+        review = ReviewSubmission.objects.filter(pk=instance.submission_id) \
+                                         .select_related('exercise', 'reviewed_submission') \
+                                         .first()
+    if review:
+        reviewer_key, reviewed_key = review_keys(review)
+        ReviewStatsSnapshot.objects.mark_dirty(review.exercise_id, [reviewed_key])
+
+
+@receiver(post_save, sender=ReviewExercise, dispatch_uid='reviewexercise_saved_stats')
+@receiver(pre_delete, sender=ReviewExercise, dispatch_uid='reviewexercise_deleted_stats')
+def reviewexercise_changed_stats(sender, instance, **kwargs):
+    # settings and questions affect every row, the snapshot is rebuilt when read next time.
+    # pre_delete: the cascading deletes of the reviews must not find a snapshot to mark dirty.
+    ReviewStatsSnapshot.objects.filter(review_exercise=instance).delete()
+
+
+@receiver(m2m_changed, sender=ReviewExercise.questions.through, dispatch_uid='reviewexercise_questions_stats')
+def reviewexercise_questions_changed_stats(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, ReviewExercise):
+        ReviewStatsSnapshot.objects.filter(review_exercise=instance).delete()
+
+
+@receiver(post_save, sender=Question, dispatch_uid='question_saved_stats')
+@receiver(pre_delete, sender=Question, dispatch_uid='question_deleted_stats')
+def question_changed_stats(sender, instance, **kwargs):
+    # the choices decide which questions are averaged, the snapshots are rebuilt when read next time
+    ReviewStatsSnapshot.objects.filter(review_exercise__questions=instance).delete()
+
+
+@receiver(post_save, sender=StudentGroup, dispatch_uid='studentgroup_saved_stats')
+@receiver(post_delete, sender=StudentGroup, dispatch_uid='studentgroup_deleted_stats')
+def studentgroup_changed_stats(sender, instance, **kwargs):
+    # group memberships affect the keys, the names and the done flags of the whole course
+    ReviewStatsSnapshot.objects.filter(review_exercise__course_id=instance.course_id).delete()
@@ -1,8 +1,11 @@
-from django.db import models
-from django.db.models import Count
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.exceptions import EmptyResultSet
-from django.utils import timezone
 
+import heapq
+
+from . import counters
 from .models import (
         OriginalSubmission,
         ReviewSubmission,
@@ -18,8 +21,334 @@ from prplatform.exercises.models import (
     )
 
 
+def _count_of(model, fk_field):
+    """ Correlated subquery counting the rows of model pointing to the outer OriginalSubmission """
+    counts = model.objects.filter(**{fk_field: OuterRef('pk')}) \
+                          .order_by() \
+                          .values(fk_field) \
+                          .annotate(count=Count('pk')) \
+                          .values('count')
+    return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+
+def with_live_counts(queryset):
+    """ Annotates OriginalSubmissions with the counts the denormalized
+        review_count and active_lock_count should match """
+    return queryset.annotate(live_review_count=_count_of(ReviewSubmission, 'reviewed_submission'),
+                             live_active_lock_count=_count_of(ReviewLock, 'original_submission'))
+
+
+def rebuild_counters(queryset):
+    """ Recomputes review_count and active_lock_count of the OriginalSubmissions
+        in the queryset with a single UPDATE. Returns the number of rows updated. """
+    return queryset.update(review_count=_count_of(ReviewSubmission, 'reviewed_submission'),
+                           active_lock_count=_count_of(ReviewLock, 'original_submission'))
+
+
+class _DealtReviewer:
+    """ A reviewer (user or group) during ReviewLockManager.deal """
+
+    def __init__(self, user, group, name):
+        self.user = user
+        self.group = group
+        self.name = name
+        self.quota = 0
+        self.excluded = set()
+
+    def __str__(self):
+        return self.name
+
+
 class ReviewLockManager(models.Manager):
 
+    def random_candidates(self, exercise, user, group=None):
+        """
+        All original submissions that *could* be the target of the next RANDOM
+        review by the user (or the group) annotated with their existing review
+        and reviewlock counts.
+
+        The queryset is ordered in ascending order by reviews_and_locks sum and
+        creation date ---> first item is the one with least reviews/locks and
+        oldest creation date.
+
+        Expired locks are counted in active_lock_count until they are deleted
+        with expire(), see _reserve_random_candidate.
+
+        Everything is expressed as subqueries of one SELECT so that picking the
+        first candidate takes a single round trip to the database. The counts
+        come from the denormalized counters of OriginalSubmission and the
+        ordering matches the expression index created in migration 0021.
+        """
+        reviewable_exercise = exercise.reviewable_exercise
+
+        osub_candidates = OriginalSubmission.objects \
+                                            .filter(exercise=reviewable_exercise,
+                                                    state=OriginalSubmission.READY_FOR_REVIEW) \
+                                            .annotate(reviews_and_locks=F('review_count') + F('active_lock_count')) \
+                                            .filter(reviews_and_locks__lt=exercise.max_reviews_per_submission)
+
+        if reviewable_exercise.use_groups:
+            if not exercise.use_groups:
+                group = exercise.course.find_studentgroup_by_user(user)
+            latest_submission_ids = OriginalSubmission.objects.filter(exercise=reviewable_exercise) \
+                                                      .values('id') \
+                                                      .order_by('submitter_group_id', '-created') \
+                                                      .distinct('submitter_group_id')
+            osub_candidates = osub_candidates.exclude(submitter_group=group) \
+                                             .filter(id__in=latest_submission_ids)
+
+        else:
+            latest_submission_ids = OriginalSubmission.objects.filter(exercise=reviewable_exercise) \
+                                                      .values('id') \
+                                                      .order_by('submitter_user_id', '-created') \
+                                                      .distinct('submitter_user_id')
+            osub_candidates = osub_candidates.exclude(submitter_user=user) \
+                                             .filter(id__in=latest_submission_ids)
+
+        previous_revsub_ids = exercise.last_reviews_by(user, group=group).values('reviewed_submission__id')
+        osub_candidates = osub_candidates.exclude(pk__in=previous_revsub_ids)
+
+        return osub_candidates.order_by('reviews_and_locks', 'created')
+
+    @transaction.atomic
+    def expire(self, exercise, expiry_time, limit=None):
+        """
+        Deletes the reviewlocks of the exercise created before expiry_time, at most
+        limit of them, and returns how many were deleted.
+
+        The active_lock_count of the original submissions is decremented with one
+        UPDATE per distinct number of deleted locks instead of one per lock. Locks
+        another transaction is deleting right now are skipped.
+        """
+        pks = self.filter(review_exercise=exercise, created__lt=expiry_time) \
+                  .select_for_update(skip_locked=True) \
+                  .values_list('pk', flat=True)
+        if limit is not None:
+            pks = pks[:limit]
+        pks = list(pks)
+
+        if pks:
+            with counters.batched():
+                self.filter(pk__in=pks).delete()
+        return len(pks)
+
+    @transaction.atomic
+    def _reserve_random_candidate(self, exercise, user, group=None):
+        """
+        Picks the first candidate from random_candidates and keeps its row locked
+        until the surrounding transaction (create_rlock) commits the new lock.
+
+        SELECT ... FOR UPDATE SKIP LOCKED makes concurrent allocators step over the
+        submissions other allocators are just reserving instead of all of them
+        reading the same first candidate and overshooting max_reviews_per_submission.
+        Locked rows are skipped, not waited for, so the allocators don't serialize
+        on the one "hot" submission at the top of the ordering.
+
+        The row lock alone is not enough: the SELECT may have started before another
+        allocator committed its lock on the row we got. Since every statement sees
+        the latest commits, the candidate is re-checked with a fresh query once the
+        row lock is held and skipped if it is already full.
+
+        The expired locks of the exercise are deleted first so that active_lock_count
+        is accurate and the ordering stays on the expression index of migration 0021.
+        Usually there are none and this is one lookup on the (review_exercise, created)
+        index.
+        """
+        expiry_time = exercise.reviewlock_expiry_time()
+        if expiry_time:
+            self.expire(exercise, expiry_time)
+
+        candidates = self.random_candidates(exercise, user, group)
+        skipped = []
+
+        while True:
+            reviewable = candidates.exclude(pk__in=skipped) \
+                                   .select_for_update(skip_locked=True) \
+                                   .first()
+
+            if reviewable is None:
+                raise EmptyResultSet("nothing to review")
+
+            if candidates.filter(pk=reviewable.pk).exists():
+                return reviewable
+
+            skipped.append(reviewable.pk)
+
+    @transaction.atomic
+    def deal(self, exercise, pinned_pairs=()):
+        """
+        Deals reviewlocks to every eligible reviewer of a RANDOM ReviewExercise at once
+        instead of each reviewer getting one lazily from create_rlock on a page load.
+
+        The assignment is computed in memory and all locks are inserted with a single
+        bulk_create. Reviewers are dealt one lock per round so that every reviewer gets
+        their first review before anyone gets the second. In each round the target is
+        the submission with the least reviews and locks, oldest first, just like in
+        create_rlock. The same restrictions as in create_rlock apply: own (or own
+        group's) submissions and previously reviewed submissions are excluded and
+        max_reviews_per_submission is honored. Nobody is dealt more than
+        max_submission_count reviews (done reviews and held locks included).
+
+        pinned_pairs is a list of (reviewer, reviewed) identifiers which are dealt
+        before anything else. The identifiers are emails of the users or, if the
+        exercise uses groups, names of the groups.
+
+        Returns a dict with the number of locks created, the reviewers who could
+        not be dealt all of their reviews and errors found in pinned_pairs.
+        """
+        reviewable_exercise = exercise.reviewable_exercise
+        course = exercise.course
+        result = {'created': 0, 'unassigned': [], 'errors': []}
+
+        # the capacity held by expired locks is given out again
+        expiry_time = exercise.reviewlock_expiry_time()
+        if expiry_time:
+            self.expire(exercise, expiry_time)
+
+        # the candidate rows stay locked until the end of the transaction so
+        # that create_rlock cannot hand out the same capacity meanwhile
+        candidates = list(reviewable_exercise.last_submission_by_submitters()
+                                             .filter(state=OriginalSubmission.READY_FOR_REVIEW)
+                                             .select_related('submitter_user', 'submitter_group')
+                                             .select_for_update(of=('self',))
+                                             .order_by('created'))
+
+        group_of_email = {email: group for group in course.student_groups.all() for email in group.student_usernames}
+
+        reviewers = {}
+        if exercise.use_groups:
+            for osub in candidates:
+                if osub.submitter_group and osub.submitter_group_id not in reviewers:
+                    reviewers[osub.submitter_group_id] = _DealtReviewer(osub.submitter_user,
+                                                                        osub.submitter_group,
+                                                                        osub.submitter_group.name)
+        else:
+            if exercise.require_original_submission:
+                users = [osub.submitter_user for osub in candidates]
+            else:
+                users = course.students.order_by('pk')
+            for user in users:
+                if user.pk not in reviewers:
+                    reviewers[user.pk] = _DealtReviewer(user, None, user.email)
+
+        # own submissions are never dealt, see create_rlock
+        by_group, by_user, by_email = {}, {}, {}
+        for osub in candidates:
+            by_group.setdefault(osub.submitter_group_id, []).append(osub.pk)
+            by_user.setdefault(osub.submitter_user_id, []).append(osub.pk)
+            by_email.setdefault(osub.submitter_user.email, []).append(osub.pk)
+
+        for reviewer in reviewers.values():
+            reviewer.quota = exercise.max_submission_count
+            if reviewable_exercise.use_groups:
+                group = reviewer.group or group_of_email.get(reviewer.user.email)
+                reviewer.excluded.update(by_group.get(group.pk if group else None, []))
+            elif reviewer.group:
+                for email in reviewer.group.student_usernames:
+                    reviewer.excluded.update(by_email.get(email, []))
+            else:
+                reviewer.excluded.update(by_user.get(reviewer.user.pk, []))
+
+        def reviewer_of(user_id, group_id):
+            return reviewers.get(group_id if exercise.use_groups else user_id)
+
+        # done reviews and held locks count against the quota and their targets are excluded
+        reviews = exercise.submissions.values_list('submitter_user_id', 'submitter_group_id', 'reviewed_submission_id')
+        locks = exercise.reviewlock_set.all()
+        if expiry_time:
+            # expired locks another transaction is still deleting in expire()
+            locks = locks.filter(created__gte=expiry_time)
+        locks = locks.values_list('user_id', 'group_id', 'original_submission_id')
+
+        for user_id, group_id, osub_id in list(reviews) + list(locks):
+            reviewer = reviewer_of(user_id, group_id)
+            if reviewer:
+                reviewer.quota -= 1
+                reviewer.excluded.add(osub_id)
+
+        capacity = {osub.pk: exercise.max_reviews_per_submission - osub.review_count - osub.active_lock_count
+                    for osub in candidates}
+        assignments = []
+
+        def assign(reviewer, osub):
+            assignments.append((reviewer, osub))
+            reviewer.quota -= 1
+            reviewer.excluded.add(osub.pk)
+            capacity[osub.pk] -= 1
+
+        reviewers_by_name = {reviewer.name: reviewer for reviewer in reviewers.values()}
+        if exercise.use_groups:
+            targets_by_name = {osub.submitter_group.name: osub for osub in candidates if osub.submitter_group}
+        else:
+            targets_by_name = {osub.submitter_user.email: osub for osub in candidates}
+
+        for reviewer_name, reviewed_name in pinned_pairs:
+            reviewer = reviewers_by_name.get(reviewer_name)
+            osub = targets_by_name.get(reviewed_name)
+            if not reviewer:
+                result['errors'].append(f'"{reviewer_name}" cannot review in this exercise.')
+            elif not osub:
+                result['errors'].append(f'"{reviewed_name}" has no submission ready for review.')
+            elif osub.pk in reviewer.excluded:
+                result['errors'].append(f'"{reviewer_name}" cannot review "{reviewed_name}".')
+            elif reviewer.quota <= 0:
+                result['errors'].append(f'"{reviewer_name}" cannot be dealt any more reviews.')
+            elif capacity[osub.pk] <= 0:
+                result['errors'].append(f'"{reviewed_name}" cannot receive any more reviews.')
+            else:
+                assign(reviewer, osub)
+
+        # (reviews and locks, created, pk) -> the heap gives the same target create_rlock would
+        heap = [(exercise.max_reviews_per_submission - capacity[osub.pk], osub.created, osub.pk)
+                for osub in candidates if capacity[osub.pk] > 0]
+        heapq.heapify(heap)
+        osubs = {osub.pk: osub for osub in candidates}
+        waiting = [reviewer for reviewer in reviewers.values() if reviewer.quota > 0]
+
+        while waiting and heap:
+            next_round = []
+            for reviewer in waiting:
+                skipped = []
+                target = None
+                while heap:
+                    item = heapq.heappop(heap)
+                    if item[2] in reviewer.excluded:
+                        skipped.append(item)
+                    else:
+                        target = item
+                        break
+                for item in skipped:
+                    heapq.heappush(heap, item)
+
+                if target is None:
+                    result['unassigned'].append(reviewer)
+                    continue
+
+                load, created, pk = target
+                assign(reviewer, osubs[pk])
+                if capacity[pk] > 0:
+                    heapq.heappush(heap, (load + 1, created, pk))
+                if reviewer.quota > 0:
+                    next_round.append(reviewer)
+            waiting = next_round
+
+        result['unassigned'] += waiting
+
+        self.bulk_create([
+            ReviewLock(user=reviewer.user, group=reviewer.group, review_exercise=exercise, original_submission=osub)
+            for reviewer, osub in assignments
+        ])
+
+        # bulk_create doesn't send the signals that maintain the counters
+        new_lock_counts = {}
+        for _, osub in assignments:
+            new_lock_counts[osub.pk] = new_lock_counts.get(osub.pk, 0) + 1
+        counters.add_many('active_lock_count', new_lock_counts)
+
+        result['created'] = len(assignments)
+        return result
+
+    @transaction.atomic
     def create_rlock(self, exercise, user, group=None):
         #  print(f"create_lock called for {exercise} {user} {group}")
 
@@ -31,68 +360,13 @@ class ReviewLockManager(models.Manager):
 
         if exercise.type == ReviewExercise.RANDOM:
 
-            if exercise.reviewlock_expiry_hours != 0:
-                # if expiry hours is something else than "no expiry" / -1,
-                # delete all reviewlocks older than the expiry time
-                not_expired_time = timezone.now() - timezone.timedelta(hours=exercise.reviewlock_expiry_hours)
-                ReviewLock.objects.filter(review_exercise=exercise, created__lt=not_expired_time).delete()
-
-            # all original submissions that *could* be the target of the review
-            # annotated with their existing review and reviewlock counts
-            # the queryset is ordered in ascending order by reviews_and_locks sum and creation date
-            # ---> first item is the one with least reviews/locks and oldest creation date
-            osub_candidates = OriginalSubmission.objects \
-                                                .filter(exercise=exercise.reviewable_exercise) \
-                                                .annotate(
-                                                    reviews_and_locks=Count('reviewlocks', distinct=True)+Count('reviews', distinct=True)
-                                                    ) \
-                                                .order_by(
-                                                    'reviews_and_locks',
-                                                    'created'
-                                                    )
-
-            # ATTENTION !!!!!!!!!!
-            # the query just above *CANNOT* be joined with the order_by/distinct queries
-            # that's why we need two queries
-
-            # print(f"{osub_candidates.count()} -- before max_rev_per_sub exlude")
-            # print(osub_candidates)
-            osub_candidates = osub_candidates.exclude(reviews_and_locks__gte=exercise.max_reviews_per_submission)
-            # print(f"{osub_candidates.count()} -- after max_rev_per_sub exlude")
-            # print(osub_candidates)
-
-            if exercise.reviewable_exercise.use_groups:
-                latest_submission_ids = OriginalSubmission.objects.filter(exercise=exercise.reviewable_exercise) \
-                                                          .values('id') \
-                                                          .order_by('submitter_group_id', '-created') \
-                                                          .distinct('submitter_group_id')
-                osub_candidates = osub_candidates.exclude(
-                                                    submitter_group=exercise.course.find_studentgroup_by_user(user)) \
-                                                 .filter(id__in=latest_submission_ids)
+            # expired reviewlocks of the exercise are deleted before picking the candidate,
+            # the expire_reviewlocks management command run by cron deletes the rest.
+            # ReviewExercise.reviewlocks_for ignores them until then.
 
-            else:
-                latest_submission_ids = OriginalSubmission.objects.filter(exercise=exercise.reviewable_exercise) \
-                                                          .values('id') \
-                                                          .order_by('submitter_user_id', '-created') \
-                                                          .distinct('submitter_user_id')
-                osub_candidates = osub_candidates.exclude(submitter_user=user) \
-                                                 .filter(id__in=latest_submission_ids)
-
-            previous_revsub_ids = exercise.last_reviews_by(user).values('reviewed_submission__id')
-            # print(f"previous_revsub_ids: {previous_revsub_ids}")
-            # print(f"{osub_candidates.count()} -- before prev id exlude")
-            # print(osub_candidates)
-            osub_candidates = osub_candidates.exclude(pk__in=previous_revsub_ids)
-            # print(f"{osub_candidates.count()} -- after prev id exlude")
-            # print(osub_candidates)
-            osub_candidates = osub_candidates.filter(state=OriginalSubmission.READY_FOR_REVIEW)
-            # print(f"{osub_candidates.count()} -- after READY_FOR_REVIEW filter")
-            # print(osub_candidates)
-
-            if osub_candidates.count() == 0:
-                raise EmptyResultSet("nothing to review")
-
-            reviewable = osub_candidates.first()
+            # atomic: the row of the candidate stays locked until the new
+            # lock is created, also when there is no outer transaction
+            reviewable = self._reserve_random_candidate(exercise, user, group)
 
         return self.create(user=user,
                            group=group,
@@ -110,6 +384,14 @@ class ReviewLock(TimeStampedModel):
     review_exercise = models.ForeignKey(ReviewExercise, on_delete=models.CASCADE)
     review_submission = models.ForeignKey(ReviewSubmission, null=True, default=None, on_delete=models.CASCADE)
 
+    class Meta:
+        # the created timestamp is used to tell apart expired reviewlocks
+        indexes = [
+            models.Index(fields=['review_exercise', 'user', 'created'], name='reviewlock_user_created_idx'),
+            models.Index(fields=['review_exercise', 'group', 'created'], name='reviewlock_group_created_idx'),
+            models.Index(fields=['review_exercise', 'created'], name='reviewlock_created_idx'),
+        ]
+
     @property
     def owner(self):
         if self.group:
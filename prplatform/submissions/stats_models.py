@@ -0,0 +1,215 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models, transaction
+from django.db.models import Avg, F, IntegerField, Q
+from django.db.models.functions import Cast
+
+from .models import Answer
+
+from prplatform.core.models import TimeStampedModel
+from prplatform.exercises.models import ReviewExercise
+from prplatform.users.models import User
+
+
+def last_reviews(re, reviews=None):
+    """
+    The same reviews last_reviews_by and last_reviews_for return, for every submitter at once.
+    Returns (reviews_by, reviews_for) dicts of lists keyed by submitter: group pks if the
+    exercise uses groups, user pks otherwise. reviews can limit the reviews considered,
+    it has to include every review of the submitters of interest.
+    """
+    if reviews is None:
+        reviews = re.submissions.all()
+    reviews = reviews.select_related('submitter_user', 'submitter_group',
+                                     'reviewed_submission__submitter_user',
+                                     'reviewed_submission__submitter_group') \
+                     .order_by('-created')
+    if re.use_groups:
+        def keys(review):
+            return review.submitter_group_id, review.reviewed_submission.submitter_group_id
+    else:
+        def keys(review):
+            return review.submitter_user_id, review.reviewed_submission.submitter_user_id
+
+    # newest first -> the first review of every (reviewer, reviewed) pair is the last one
+    last = {}
+    for review in reviews:
+        last.setdefault(keys(review), review)
+
+    reviews_by = {}
+    reviews_for = {}
+    # DISTINCT ON returns the rows in the order of the distinct key, NULLs last
+    for (by_key, for_key), review in sorted(last.items(), key=lambda item: [(k is None, k) for k in item[0]]):
+        reviews_by.setdefault(by_key, []).append(review)
+    for (by_key, for_key), review in sorted(last.items(), key=lambda item: [(k is None, k) for k in item[0][::-1]]):
+        reviews_for.setdefault(for_key, []).append(review)
+
+    return reviews_by, reviews_for
+
+
+def submitter_key_filter(re, keys, prefix=''):
+    """ Q of the submissions whose submitter key is one of keys. NULL keys need their own lookup. """
+    field = prefix + ('submitter_group' if re.use_groups else 'submitter_user')
+    q = Q(**{f'{field}__in': [key for key in keys if key is not None]})
+    if None in keys:
+        q |= Q(**{f'{field}__isnull': True})
+    return q
+
+
+class ReviewStatsSnapshotManager(models.Manager):
+
+    @transaction.atomic
+    def fresh_for(self, review_exercise):
+        """
+        The snapshot of review_exercise with its dirty rows recomputed.
+        A missing snapshot is built from scratch.
+
+        The snapshot stays locked until the transaction ends, so this should be
+        called outside of a longer transaction: the stats view opts out of
+        ATOMIC_REQUESTS and the refresh commits before the rows are read.
+        """
+        snapshot, created = self.get_or_create(review_exercise=review_exercise)
+        # one refresh at a time
+        snapshot = self.select_for_update().select_related('review_exercise__course').get(pk=snapshot.pk)
+
+        if created:
+            snapshot.refresh()
+        else:
+            dirty = {row.submitter_key: row.version for row in snapshot.rows.filter(dirty=True)}
+            if dirty:
+                snapshot.refresh(dirty)
+        return snapshot
+
+    def mark_dirty(self, review_exercise_id, keys):
+        """
+        Called when the reviews of the submitters have changed. The rows are
+        recomputed the next time the snapshot is read. Exercises without a
+        snapshot are skipped, theirs is built from scratch when first read.
+        """
+        snapshot_id = self.filter(review_exercise_id=review_exercise_id).values_list('pk', flat=True).first()
+        if snapshot_id is None:
+            return
+
+        for key in set(keys):
+            rows = ReviewStatsRow.objects.filter(snapshot_id=snapshot_id, submitter_key=key)
+            if not rows.update(dirty=True, version=F('version') + 1):
+                ReviewStatsRow.objects.get_or_create(snapshot_id=snapshot_id, submitter_key=key)
+
+
+class ReviewStatsSnapshot(TimeStampedModel):
+    """
+    Persisted statistics of a ReviewExercise, one ReviewStatsRow per submitter that
+    has given or received reviews. The receivers mark the rows of the submitters
+    affected by a saved or deleted ReviewSubmission or Answer dirty and only those
+    rows are recomputed when the snapshot is read next time.
+    """
+
+    review_exercise = models.OneToOneField(ReviewExercise, related_name="stats_snapshot", on_delete=models.CASCADE)
+
+    objects = ReviewStatsSnapshotManager()
+
+    def __str__(self):
+        return f"Statistics of {self.review_exercise}"
+
+    def refresh(self, dirty=None):
+        """
+        Recomputes the rows of the submitter keys in dirty, a dict of key -> version of the row
+        when it was read. A row that was marked dirty again meanwhile stays dirty.
+        None recomputes all rows.
+        """
+        re = self.review_exercise
+
+        if dirty is None:
+            self.rows.all().delete()
+            reviews = re.submissions.all()
+        else:
+            reviews = re.submissions.filter(submitter_key_filter(re, dirty) |
+                                            submitter_key_filter(re, dirty, prefix='reviewed_submission__'))
+
+        reviews_by, reviews_for = last_reviews(re, reviews)
+        keys = list(dirty) if dirty is not None else set(reviews_by) | set(reviews_for)
+
+        numeric_questions = re.questionnaire().numeric_questions
+        reviewed_key = 'submission__reviewed_submission__submitter_group' if re.use_groups \
+            else 'submission__reviewed_submission__submitter_user'
+        avgs = Answer.objects.filter(question__in=numeric_questions,
+                                     submission__pk__in=[review.pk
+                                                         for key in keys
+                                                         for review in reviews_for.get(key, [])]) \
+                             .values_list('question', reviewed_key) \
+                             .order_by() \
+                             .annotate(avg=Avg(Cast('value_choice', IntegerField())))
+        numerical_avgs = {}
+        for question, key, avg in avgs:
+            numerical_avgs.setdefault(key, {})[str(question)] = avg
+
+        # done is only defined for GROUP exercises: the student has reviewed everyone in the group
+        group_sizes = {}
+        if re.type == ReviewExercise.GROUP:
+            group_of_email = {email: group
+                              for group in re.course.student_groups.all()
+                              for email in group.student_usernames}
+            if re.use_groups:
+                group_sizes = {group.pk: len(group.student_usernames) for group in group_of_email.values()}
+            else:
+                for pk, email in User.objects.filter(pk__in=[key for key in keys if key]).values_list('pk', 'email'):
+                    group = group_of_email.get(email)
+                    group_sizes[pk] = len(group.student_usernames) if group else None
+
+        def fields(key):
+            done = None
+            if re.type == ReviewExercise.GROUP:
+                size = group_sizes.get(key)
+                done = size == len(reviews_by.get(key, [])) if size is not None else False
+            return {
+                'done': done,
+                'reviews_by': [[review.pk, str(review.reviewed_submission.submitter)]
+                               for review in reviews_by.get(key, [])],
+                'reviews_for': [[review.pk, str(review.submitter)]
+                                for review in reviews_for.get(key, [])],
+                'numerical_avgs': numerical_avgs.get(key, {}),
+            }
+
+        if dirty is None:
+            ReviewStatsRow.objects.bulk_create([
+                ReviewStatsRow(snapshot=self, submitter_key=key, dirty=False, **fields(key))
+                for key in keys
+            ])
+        else:
+            for key, version in dirty.items():
+                self.rows.filter(submitter_key=key, version=version).update(dirty=False, **fields(key))
+
+        self.save(update_fields=['modified'])
+
+
+class ReviewStatsRow(models.Model):
+    """
+    Statistics of one submitter in a ReviewStatsSnapshot. submitter_key is the pk of a
+    StudentGroup if the exercise uses groups, the pk of a User otherwise. reviews_by and
+    reviews_for are lists of [ReviewSubmission pk, name of the other party] pairs and
+    numerical_avgs maps question pks to the average of the answers received.
+    """
+
+    snapshot = models.ForeignKey(ReviewStatsSnapshot, related_name="rows", on_delete=models.CASCADE)
+    submitter_key = models.IntegerField(null=True)
+
+    dirty = models.BooleanField(default=True)
+    # bumped every time the row is marked dirty, see ReviewStatsSnapshot.refresh
+    version = models.IntegerField(default=0)
+
+    done = models.NullBooleanField()
+    reviews_by = JSONField(default=list)
+    reviews_for = JSONField(default=list)
+    numerical_avgs = JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('snapshot', 'submitter_key')
+
+    def __str__(self):
+        return f"{self.snapshot}: {self.submitter_key}"
+
+
+def review_keys(review):
+    """ (reviewer key, reviewed key) of a ReviewSubmission """
+    if review.exercise.use_groups:
+        return review.submitter_group_id, review.reviewed_submission.submitter_group_id
+    return review.submitter_user_id, review.reviewed_submission.submitter_user_id
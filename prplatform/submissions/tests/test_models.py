@@ -1,5 +1,11 @@
-from django.db import OperationalError
-from django.test import TestCase
+from django.core.exceptions import EmptyResultSet
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, F
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import threading
 
 from prplatform.exercises.models import (
         SubmissionExercise,
@@ -9,7 +15,7 @@ from prplatform.submissions.models import (
         OriginalSubmission,
         ReviewSubmission,
     )
-from prplatform.submissions.reviewlock_models import ReviewLock
+from prplatform.submissions.reviewlock_models import ReviewLock, with_live_counts
 from prplatform.users.models import User
 
 
@@ -62,3 +68,226 @@ class ReviewExerciseTestCase(TestCase):
                                reviewed_submission=os)
         self.assertRaises(OperationalError,
                           rs2.save_and_destroy_lock)
+
+    def test_review_counters_follow_locks_and_reviews(self):
+
+        os = OriginalSubmission(course=self.course,
+                                exercise=self.se,
+                                submitter_user=self.s1,
+                                text="jadajada")
+        os.save()
+
+        def counters():
+            os.refresh_from_db()
+            return os.review_count, os.active_lock_count
+
+        rl = ReviewLock.objects.create(review_exercise=self.re, user=self.s2, original_submission=os)
+        ReviewLock.objects.create(review_exercise=self.re, user=self.s3, original_submission=os)
+        self.assertEqual(counters(), (0, 2))
+
+        # a stale instance must not overwrite the counters
+        stale = OriginalSubmission.objects.get(pk=os.pk)
+        rl.delete()
+        stale.text = "changed"
+        stale.save()
+        self.assertEqual(counters(), (0, 1))
+
+        rs = ReviewSubmission(course=self.course,
+                              exercise=self.re,
+                              submitter_user=self.s3,
+                              reviewed_submission=os)
+        rs.save_and_destroy_lock()
+        self.assertEqual(counters(), (1, 0))
+
+        rs.delete()
+        self.assertEqual(counters(), (0, 0))
+
+    def test_create_rlock_selects_candidate_in_one_query(self):
+
+        for user in [self.s1, self.s3]:
+            OriginalSubmission(course=self.course,
+                               exercise=self.se,
+                               submitter_user=user,
+                               text="jadajada").save()
+
+        # make sure the exercise relation is already loaded
+        self.assertEqual(self.re.reviewable_exercise, self.se)
+
+        with CaptureQueriesContext(connection) as queries:
+            rl = ReviewLock.objects.create_rlock(self.re, self.s2)
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+
+        # the candidate SELECT, its re-check once the row is locked,
+        # the INSERT of the lock and the UPDATE of the lock counter
+        self.assertEqual(len(statements), 4)
+
+        # the oldest of the two submissions without reviews
+        self.assertEqual(rl.original_submission.submitter_user, self.s1)
+
+    def test_expired_reviewlocks_dont_use_capacity(self):
+
+        os = OriginalSubmission(course=self.course,
+                                exercise=self.se,
+                                submitter_user=self.s1,
+                                text="jadajada")
+        os.save()
+
+        self.re.reviewlock_expiry_hours = 1
+        self.re.save()
+
+        # the lock of s3 has expired but expire_reviewlocks hasn't deleted it yet
+        rl = ReviewLock.objects.create(review_exercise=self.re, user=self.s3, original_submission=os)
+        ReviewLock.objects.filter(pk=rl.pk).update(created=timezone.now() - timezone.timedelta(hours=2))
+
+        rl = ReviewLock.objects.create_rlock(self.re, self.s2)
+        self.assertEqual(rl.original_submission, os)
+        self.assertFalse(ReviewLock.objects.filter(user=self.s3).exists())
+        os.refresh_from_db()
+        self.assertEqual(os.active_lock_count, 1)
+
+        # the lock of s2 is still valid
+        s4 = User.objects.get(username='student4')
+        self.assertRaises(EmptyResultSet, ReviewLock.objects.create_rlock, self.re, s4)
+
+    def test_expire_reviewlocks_updates_counters_in_bulk(self):
+
+        os1 = OriginalSubmission(course=self.course, exercise=self.se, submitter_user=self.s1, text="jadajada")
+        os1.save()
+        os2 = OriginalSubmission(course=self.course, exercise=self.se, submitter_user=self.s2, text="jadajada")
+        os2.save()
+        s4 = User.objects.get(username='student4')
+        for user, os in [(self.s2, os1), (self.s3, os1), (s4, os1), (self.s3, os2), (s4, os2)]:
+            ReviewLock.objects.create(review_exercise=self.re, user=user, original_submission=os)
+
+        # one of the locks is still valid
+        ReviewLock.objects.exclude(user=s4, original_submission=os2) \
+                          .update(created=timezone.now() - timezone.timedelta(hours=2))
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = ReviewLock.objects.expire(self.re, timezone.now() - timezone.timedelta(hours=1))
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+
+        self.assertEqual(deleted, 4)
+        # one UPDATE for each distinct number of deleted locks: 3 of os1 and 1 of os2
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(ReviewLock.objects.get().original_submission, os2)
+        for os in with_live_counts(OriginalSubmission.objects.filter(pk__in=[os1.pk, os2.pk])):
+            self.assertEqual(os.active_lock_count, os.live_active_lock_count)
+
+
+    def test_deal_reviewlocks(self):
+
+        s4 = User.objects.get(username='student4')
+        submitters = [self.s1, self.s2, self.s3, s4]
+        for user in submitters:
+            OriginalSubmission(course=self.course,
+                               exercise=self.se,
+                               submitter_user=user,
+                               text="jadajada").save()
+
+        self.re.max_submission_count = 2
+        self.re.max_reviews_per_submission = 2
+        self.re.save()
+
+        result = ReviewLock.objects.deal(self.re, [(self.s1.email, self.s3.email),
+                                                   (self.s1.email, self.s1.email),
+                                                   ('nobody@prp.fi', self.s2.email)])
+
+        self.assertEqual(len(result['errors']), 2)
+        self.assertEqual(result['created'], ReviewLock.objects.count())
+        self.assertTrue(ReviewLock.objects.filter(user=self.s1,
+                                                  original_submission__submitter_user=self.s3).exists())
+
+        for user in submitters:
+            self.assertFalse(ReviewLock.objects.filter(user=user, original_submission__submitter_user=user).exists())
+
+        # in the last round only the submission of student4 has capacity left
+        locks_by_reviewer = dict(ReviewLock.objects.values_list('user').order_by().annotate(Count('pk')))
+        self.assertEqual(locks_by_reviewer, {self.s1.pk: 2, self.s2.pk: 2, self.s3.pk: 2, s4.pk: 1})
+        locks_by_submitter = dict(ReviewLock.objects.values_list('original_submission__submitter_user')
+                                                    .order_by()
+                                                    .annotate(Count('pk')))
+        self.assertEqual(locks_by_submitter, {self.s1.pk: 2, self.s2.pk: 2, self.s3.pk: 2, s4.pk: 1})
+        self.assertEqual([reviewer.user for reviewer in result['unassigned']], [s4])
+
+        # bulk_create bypasses the receivers but the counters must still be right
+        for osub in with_live_counts(OriginalSubmission.objects.all()):
+            self.assertLessEqual(osub.active_lock_count, 2)
+            self.assertEqual(osub.active_lock_count, osub.live_active_lock_count)
+
+        # everything has been dealt already
+        self.assertEqual(ReviewLock.objects.deal(self.re)['created'], 0)
+
+        # a reviewer holding several locks reviews the one matching the reviewed submission
+        rlock = ReviewLock.objects.filter(user=self.s1).first()
+        ReviewSubmission(course=self.course,
+                         exercise=self.re,
+                         submitter_user=self.s1,
+                         reviewed_submission=rlock.original_submission).save_and_destroy_lock()
+        self.assertFalse(ReviewLock.objects.filter(pk=rlock.pk).exists())
+
+
+class ReviewLockConcurrencyTestCase(TransactionTestCase):
+
+    fixtures = [
+        'courses.yaml'
+    ]
+
+    def _allocate_concurrently(self, exercise, users):
+        """ Every user tries to create a reviewlock at the same moment, each in its
+            own thread, DB connection and transaction like separate requests would. """
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        def allocate(user):
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    ReviewLock.objects.create_rlock(exercise, user)
+            except EmptyResultSet:
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_concurrent_allocations_dont_exceed_max_reviews_per_submission(self):
+        se = SubmissionExercise.objects.get(name='T1 TEXT')
+        re = ReviewExercise.objects.get(name='T1 TEXT REVIEW')
+        students = list(User.objects.filter(username__startswith='student'))
+
+        for student in students:
+            OriginalSubmission(course=se.course,
+                               exercise=se,
+                               submitter_user=student,
+                               text=f"text by {student}").save()
+
+        # load the relation before it's shared by the threads
+        self.assertEqual(re.reviewable_exercise, se)
+
+        for max_reviews in [1, 2, 3]:
+            re.max_reviews_per_submission = max_reviews
+            re.save()
+
+            errors = self._allocate_concurrently(re, students)
+            self.assertEqual(errors, [])
+
+            lock_counts = OriginalSubmission.objects.filter(exercise=se) \
+                                                    .annotate(locks=Count('reviewlocks')) \
+                                                    .values_list('locks', flat=True)
+            self.assertTrue(all(count <= max_reviews for count in lock_counts))
+
+            # the counters were maintained in the same transactions as the locks
+            self.assertFalse(with_live_counts(OriginalSubmission.objects.all())
+                             .exclude(active_lock_count=F('live_active_lock_count'))
+                             .exists())
+
+        # the cap has been raised twice -> submissions got locks on every round
+        self.assertGreater(ReviewLock.objects.count(), len(students))
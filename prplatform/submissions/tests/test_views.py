@@ -1,6 +1,9 @@
 from django.test import RequestFactory, TestCase
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 
@@ -18,6 +21,7 @@ from prplatform.submissions.models import (
     DownloadToken,
 )
 
+from prplatform.submissions.access import download_access, load_download
 from prplatform.submissions.reviewlock_models import ReviewLock
 from prplatform.submissions.views import (
     DownloadSubmissionView,
@@ -26,6 +30,7 @@ from prplatform.submissions.views import (
     ReviewSubmissionListView,
     ReviewSubmissionDetailView,
     ReviewSubmissionDeleteView,
+    ReviewSubmissionEmbeddedFeedbackList,
 )
 
 
@@ -547,6 +552,55 @@ class SubmissionsTest(TestCase):
                 response = DownloadSubmissionView.as_view()(request, **self.kwargs)
                 self.assertEqual(response.status_code, code)
 
+    def test_download_is_streamed_with_validators_and_ranges(self):
+        exercise = SubmissionExercise.objects.get(pk=1)
+        exercise.type = 'FILE_UPLOAD'
+        exercise.accepted_filetypes = '.pdf'
+        exercise.save()
+
+        temp_file = SimpleUploadedFile(name='lorem_ipsum.pdf', content=b'0123456789')
+        sub = OriginalSubmission(course=self.course, file=temp_file, submitter_user=self.s1, exercise=exercise)
+        sub.save()
+        self.kwargs['pk'] = sub.pk
+        url = f'/courses/prog1/F2018/submissions/download/{sub.pk}/'
+
+        def download(**headers):
+            request = self.factory.get(url, **headers)
+            request.user = self.s1
+            return DownloadSubmissionView.as_view()(request, **self.kwargs)
+
+        response = download()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        etag = response['ETag']
+
+        response = download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = download(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+        response = download(HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = download(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+        # the file has changed since the range was asked for
+        response = download(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        with self.settings(DOWNLOAD_OFFLOAD='x-accel-redirect', DOWNLOAD_ACCEL_PREFIX='/protected/'):
+            response = download()
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected/{sub.file.name}')
+            self.assertEqual(response.content, b'')
+
     def test_download_tokens_allow_downloading(self):
 
         exercise = SubmissionExercise.objects.get(pk=1)
@@ -572,10 +626,8 @@ class SubmissionsTest(TestCase):
         )
         answer_with_file.save()
 
-        view_request = self.factory.get(exercise.get_absolute_url() + "?some=queryparams")
-        osub_token = sub.get_download_token_for(self.s1, view_request)
-        view_request = self.factory.get(exercise.review_exercise.get_absolute_url() + "?some=queryparams")
-        rsub_token = rev.get_download_token_for(self.s1, view_request)
+        osub_token = sub.get_download_token_for(self.s1)
+        rsub_token = rev.get_download_token_for(self.s1)
 
         cases = [
             (AnonymousUser, 403, sub, ""),
@@ -599,15 +651,48 @@ class SubmissionsTest(TestCase):
                 response = DownloadSubmissionView.as_view()(request, **self.kwargs)
                 self.assertEqual(response.status_code, code)
 
-        DownloadToken.objects.all().delete()
+        # a token of the original submission doesn't open the answer with the same pk and vice versa
+        cases = [
+            (sub, f"?dl_token={rsub_token}"),
+            (answer_with_file, f"&dl_token={osub_token}"),
+        ]
+        with self.settings(DOWNLOAD_TOKEN_MAX_AGE=-1):
+            # expired
+            cases += [
+                (sub, f"?dl_token={osub_token}"),
+                (answer_with_file, f"&dl_token={rsub_token}"),
+            ]
+
+            for sub, query in cases:
+                url = f"{sub.get_file_download_url()}{query}"
+                request = self.factory.get(url)
+                request.user = AnonymousUser
+                self.kwargs['pk'] = sub.pk
+                self.assertRaises(PermissionDenied,
+                                  DownloadSubmissionView.as_view(), request, **self.kwargs)
 
-        for user, _, sub, query in cases:
-            url = f"{sub.get_file_download_url()}{query}"
-            request = self.factory.get(url)
-            request.user = user
-            self.kwargs['pk'] = sub.pk
+    def test_legacy_download_tokens_expire(self):
+        exercise = SubmissionExercise.objects.get(pk=1)
+        exercise.type = 'FILE_UPLOAD'
+        exercise.accepted_filetypes = '.txt'
+        exercise.save()
+
+        temp_file = SimpleUploadedFile(name='lorem_ipsum.txt', content=bytearray('jada jada', 'utf-8'))
+        sub = OriginalSubmission(course=self.course, file=temp_file, submitter_user=self.s1,
+                                 exercise=exercise)
+        sub.save()
+        token = DownloadToken.objects.create(submission_id=sub.pk, user=self.s1, token='a' * 64)
+
+        request = self.factory.get(f"{sub.get_file_download_url()}?dl_token={token.token}")
+        request.user = AnonymousUser
+        self.kwargs['pk'] = sub.pk
+        self.assertEqual(DownloadSubmissionView.as_view()(request, **self.kwargs).status_code, 200)
+
+        with self.settings(DOWNLOAD_TOKEN_MAX_AGE=-1):
             self.assertRaises(PermissionDenied,
                               DownloadSubmissionView.as_view(), request, **self.kwargs)
+            call_command('delete_download_tokens')
+        self.assertFalse(DownloadToken.objects.exists())
 
     def test_student_can_download_via_reviewlock(self):
         exercise = SubmissionExercise.objects.get(pk=1)
@@ -649,6 +734,13 @@ class SubmissionsTest(TestCase):
         response = DownloadSubmissionView.as_view()(request, **self.kwargs)
         self.assertEqual(response.status_code, 200)
 
+        # loading the submission and checking every role are a query each
+        with self.assertNumQueries(2):
+            obj, review_exercise = load_download(sub.pk)
+            access = download_access(self.s3, obj, review_exercise)
+        self.assertTrue(access['reviewer'])
+        self.assertFalse(access['owner'])
+
     def test_student_cannot_download_answer_file_not_owned(self):
         s_exercise = SubmissionExercise.objects.get(name="T1 TEXT")
         r_exercise = ReviewExercise.objects.get(name="T1 TEXT REVIEW")
@@ -730,6 +822,51 @@ class SubmissionsTest(TestCase):
         self.assertRaises(PermissionDenied,
                           DownloadSubmissionView.as_view(), request, **self.kwargs)
 
+    def test_embedded_feedback_list_queries_do_not_grow_with_reviews(self):
+        s_exercise = SubmissionExercise.objects.get(name="T1 TEXT")
+        r_exercise = ReviewExercise.objects.get(name="T1 TEXT REVIEW")
+        r_exercise.question_order = [3, 2, 1]
+        r_exercise.min_submission_count = 0
+        r_exercise.save()
+        r_exercise.questions.set([1, 2, 3])
+        Question.objects.filter(pk=2).update(hide_from_receiver=False)
+
+        sub = OriginalSubmission(course=self.course, text="juups", submitter_user=self.s1, exercise=s_exercise)
+        sub.save()
+
+        def add_review(reviewer):
+            review = ReviewSubmission(course=self.course, reviewed_submission=sub,
+                                      submitter_user=reviewer, exercise=r_exercise)
+            review.save()
+            Answer(submission=review, question_id=1, value_text=f"by {reviewer}").save()
+            Answer(submission=review, question_id=2, value_choice="3").save()
+            Answer(submission=review, question_id=3,
+                   uploaded_file=SimpleUploadedFile(name='lorem_ipsum.txt', content=b'jada jada')).save()
+
+        def feedback_list():
+            request = self.factory.get(f'/courses/prog1/F2018/submissions/r/{r_exercise.pk}/embedded_list/')
+            request.user = self.s1
+            with CaptureQueriesContext(connection) as queries:
+                response = ReviewSubmissionEmbeddedFeedbackList.as_view()(request, pk=r_exercise.pk, **self.kwargs)
+            return response.context_data['reviews'], len(queries)
+
+        add_review(self.s2)
+        # the course is read from the shared cache after the first request
+        feedback_list()
+        reviews, query_count = feedback_list()
+        self.assertEqual(len(reviews), 1)
+        qa_list = reviews[0]['qa_list']
+        self.assertEqual([item['q'] for item in qa_list], ['Upload a txt file', 'Score the work', 'Midi'])
+        self.assertIn('dl_token=', qa_list[0]['f'])
+        self.assertEqual(qa_list[1]['a'], '3')
+        self.assertEqual(qa_list[2]['a'], f"by {self.s2}")
+
+        add_review(self.s3)
+        add_review(self.s4)
+        reviews, more_reviews_query_count = feedback_list()
+        self.assertEqual(len(reviews), 3)
+        self.assertEqual(more_reviews_query_count, query_count)
+
     def test_original_submission_delete_confirmation_page_shows_cascades(self):
 
         os = OriginalSubmission(
@@ -0,0 +1,30 @@
+"""
+Download tokens let the LTI views link submitted files to users whose browser
+does not send the session cookie inside the A+ iframe.
+
+A token is a signed (submission kind, submission pk, user pk) with the time it
+was made, see django.core.signing. It is checked against SECRET_KEY with a
+constant-time comparison and nothing is stored in the database. Tokens older
+than DOWNLOAD_TOKEN_MAX_AGE seconds are rejected.
+"""
+from django.conf import settings
+from django.core import signing
+
+SALT = 'prplatform.submissions.download'
+
+
+def make_download_token(kind, submission_id, user_id):
+    """ kind is the model_name of the submission, answers are downloaded with the token of their review """
+    return signing.dumps([kind, submission_id, user_id], salt=SALT)
+
+
+def read_download_token(token):
+    """
+    (kind, submission pk, user pk) of a valid token. Raises signing.SignatureExpired if the
+    token is too old and signing.BadSignature if it wasn't made by make_download_token.
+    """
+    try:
+        kind, submission_id, user_id = signing.loads(token, salt=SALT, max_age=settings.DOWNLOAD_TOKEN_MAX_AGE)
+    except (TypeError, ValueError):
+        raise signing.BadSignature('Malformed download token')
+    return kind, submission_id, user_id
@@ -1,6 +1,5 @@
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import DetailView, ListView, UpdateView, DeleteView
@@ -19,11 +18,11 @@ from prplatform.exercises.models import (
     ReviewExercise,
 )
 from .models import (
-    Answer,
-    DownloadToken,
     OriginalSubmission,
     ReviewSubmission,
 )
+from .access import download_access, download_token_allows, load_download
+from .downloads import serve_file
 from .forms import OriginalSubmissionStateForm
 
 
@@ -130,8 +129,9 @@ class ReviewSubmissionDetailView(LoginRequiredMixin, CourseContextMixin, DetailV
         self.object = self.get_object()
         ctx = self.get_context_data(**kwargs)
 
-        owner = self.object.is_owner(self.request.user)
-        ctx['receiver'] = self.object.reviewed_submission.is_owner(self.request.user) and \
+        group = ctx['course'].find_studentgroup_by_user(self.request.user)
+        owner = self.object.is_owner(self.request.user, group)
+        ctx['receiver'] = self.object.reviewed_submission.is_owner(self.request.user, group) and \
             not self.object.exercise.show_reviews_only_to_teacher
 
         if not owner and not ctx['receiver'] and not ctx['teacher']:
@@ -206,60 +206,24 @@ class DownloadSubmissionView(View):
 
         dtype = 'answer' if self.request.GET.get('type') == 'answer' else 'osub'
 
+        obj, re = load_download(kwargs['pk'], answer=dtype == 'answer')
         if dtype == 'answer':
-            obj = get_object_or_404(Answer, pk=kwargs['pk'])
-            teacher = obj.submission.course.is_teacher(user)
-            owner = obj.submission.is_owner(user)
-            re = obj.submission.exercise
             file_itself = obj.uploaded_file
         else:
-            obj = get_object_or_404(OriginalSubmission, pk=kwargs['pk'])
-            teacher = obj.course.is_teacher(user)
-            owner = obj.is_owner(user)
-            # review_exercise might not exist yet if the teacher has only
-            # configured the submission exercise
-            if hasattr(obj.exercise, 'review_exercise') and obj.exercise.review_exercise is not None:
-                re = obj.exercise.review_exercise
-            else:
-                re = None
             file_itself = obj.file
 
         if dl_token:
-            if dtype == 'answer':
-                subid = obj.submission.pk
-            else:
-                subid = obj.pk
-            if not DownloadToken.objects.filter(submission_id=subid, token=dl_token).exists():
+            if not download_token_allows(dl_token, obj):
                 raise PermissionDenied('There\'s a problem with the download token.')
 
         else:
 
-            enrolled_can_access = False
-            if re and re.type == ReviewExercise.CHOOSE and dtype == 'osub':
-                # anyone on the course can download anything
-                enrolled_can_access = True
-
-            reviewer = False
-            receiver = False
-            if dtype == 'osub':
-                pks_of_users_reviewables = []
-                if re:
-                    pks_of_users_reviewables = re.reviewlocks_for(self.request.user) \
-                                                 .values_list('original_submission', flat=True)
-                reviewer = kwargs['pk'] in pks_of_users_reviewables
-            else:
-                receiver = obj.submission.reviewed_submission.is_owner(user) and \
-                    not obj.question.hide_from_receiver
-
-            if not teacher and not owner and not reviewer and not receiver and not enrolled_can_access:
-                print(f'teacher: {teacher}, owner: {owner}, reviewer: {reviewer}, receiver: {receiver}, enrolled_can_access: {enrolled_can_access}')  # noqa
+            access = download_access(user, obj, re)
+            if not any(access.values()):
+                print(', '.join(f'{role}: {allowed}' for role, allowed in access.items()))  # noqa
                 raise PermissionDenied('Download access is not allowed. If you think this is an error, contact admin.')
 
-        filename = file_itself.name.split('/')[-1]
-        response = HttpResponse(file_itself, content_type='text/plain')
-        # TODO: enough headers? meta type etc.?
-        response['Content-Disposition'] = 'attachment; filename=%s' % filename
-        return response
+        return serve_file(self.request, file_itself)
 
 
 class ReviewSubmissionEmbeddedFeedbackList(LTIMixin, LoginRequiredMixin, CourseContextMixin, ListView):
@@ -267,12 +231,15 @@ class ReviewSubmissionEmbeddedFeedbackList(LTIMixin, LoginRequiredMixin, CourseC
     template_name = "submissions/reviewsubmission_list_embed.html"
 
     def get_queryset(self):
-        re = ReviewExercise.objects.get(pk=self.kwargs['pk'])
-        return re.last_reviews_for(self.request.user)
+        self.exercise = ReviewExercise.objects.get(pk=self.kwargs['pk'])
+        # the answers of every review are fetched with one query, the questions come from the questionnaire
+        return self.exercise.last_reviews_for(self.request.user) \
+                            .select_related('course__base_course') \
+                            .prefetch_related('answers')
 
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx['exercise'] = ReviewExercise.objects.get(pk=self.kwargs['pk'])
+        ctx['exercise'] = self.exercise
 
         if ctx['exercise'].reviews_available_date_in_future():
             ctx['reviews_available_date_in_future'] = True
@@ -282,22 +249,25 @@ class ReviewSubmissionEmbeddedFeedbackList(LTIMixin, LoginRequiredMixin, CourseC
             ctx['needs_to_complete_more_reviews'] = True
             ctx['object_list'] = ReviewSubmission.objects.none()
 
+        questionnaire = ctx['exercise'].questionnaire()
+
         ctx['reviews'] = []
-        for review in self.object_list:
+        for review in ctx['object_list']:
             data = []
+            token = None
 
-            for ans in review.answers_in_ordered_list():
+            for ans in questionnaire.order_answers(review.answers.all()):
                 if ans.question.hide_from_receiver:
                     continue
 
                 if ans.value_text:
                     data.append({'q': ans.question.question_text, 'a': ans.value_text})
                 elif ans.value_choice:
-                    # TODO : braindead ???
-                    choice = [c[1] for c in ans.question.choices if c[0] == ans.value_choice][0]
-                    data.append({'q': ans.question.question_text, 'a': choice})
+                    data.append({'q': ans.question.question_text, 'a': ans.get_choice_question_value()})
                 else:
-                    token = review.get_download_token_for(self.request.user, self.request)
+                    if token is None:
+                        # one token opens every file of the review
+                        token = review.get_download_token_for(self.request.user)
                     data.append({'q': ans.question.question_text,
                                  'f': ans.get_file_download_url() + "&dl_token=" + token})
             ctx['reviews'].append({'qa_list': data})
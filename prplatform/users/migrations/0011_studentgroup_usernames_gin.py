@@ -0,0 +1,18 @@
+# Generated by Django 2.2.3 on 2026-10-18 13:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_user_lti'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentgroup',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['student_usernames'], name='studentgroup_usernames_gin'),
+        ),
+    ]
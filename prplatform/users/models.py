@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
@@ -40,6 +41,10 @@ class StudentGroup(models.Model):
 
     class Meta:
         unique_together = ['course', 'name']
+        indexes = [
+            # serves the membership lookups student_usernames__contains and __overlap
+            GinIndex(fields=['student_usernames'], name='studentgroup_usernames_gin'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({', '.join([x[:x.index('@')] if '@' in x else x for x in self.student_usernames])})"